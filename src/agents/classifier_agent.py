@@ -1,7 +1,8 @@
-import os, json
+import os, json, asyncio
 from typing import List, Dict, Any
-from openai import OpenAI
 from dotenv import load_dotenv
+from checkpoint import Checkpoint, break_digest
+from agents.llm import RateLimiter, complete, acomplete, env_int, is_json, estimate_tokens, get_client, get_async_client
 
 load_dotenv()
 
@@ -103,40 +104,249 @@ USER_PROMPT_TEMPLATE = """Break input (cash mismatch already detected):
 
 """
 
+RECOMMENDED_ACTIONS = [
+    "AUTO_CLOSE_WITHIN_TOL",
+    "DRAFT_CUSTODIAN_TICKET",
+    "PROPOSE_NBIM_CORRECTION",
+    "ESCALATE",
+]
+
+BATCH_USER_PROMPT_TEMPLATE = """Break inputs (cash mismatch already detected), one JSON object per line:
+{breaks_jsonl}
+
+Classify EVERY break independently. Return ONLY a JSON object like:
+{{"results": [{{"event_key": "...", ...same fields as for a single break...}}, ...]}}
+with exactly one entry per input break, keyed by its event_key.
+"""
+
+def _messages(b: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Keep the entire break payload (nbim_rows, custody_rows, NET_AMOUNT_SC_DIFF, etc.)
+    break_json = json.dumps(b, ensure_ascii=False, indent=2)
+
+    user = USER_PROMPT_TEMPLATE.format(
+        break_json=break_json,
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user},
+    ]
+
+
+def failed_result(b: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    """Placeholder result for a break the model could not classify (sent to manual review)."""
+    row = b.get("nbim_rows") or b.get("custody_rows") or {}
+    return {
+        "event_key": b.get("event_key"),
+        "COAC_EVENT_KEY": row.get("COAC_EVENT_KEY"),
+        "BANK_ACCOUNT": row.get("BANK_ACCOUNT"),
+        "CUSTODIAN": row.get("CUSTODIAN"),
+        "ORGANISATION_NAME": row.get("ORGANISATION_NAME"),
+        "classification": "OTHER",
+        "description": f"Automatic classification failed: {error}",
+        "confidence": 0.0,
+        "recommended_action": "ESCALATE",
+        "action_params": {"evidence": [], "notes": "Classify manually."},
+        "NET_AMOUNT_SC_DIFF": b.get("NET_AMOUNT_SC_DIFF"),
+        "SETTLEMENT_CURRENCY": row.get("CURRENCY_SC"),
+        "error": str(error),
+    }
+
+
+def _valid_result(r: Any) -> bool:
+    return (
+        isinstance(r, dict)
+        and r.get("classification") in CLASS_LABELS
+        and r.get("recommended_action") in RECOMMENDED_ACTIONS
+    )
+
+
+def _is_result(content: str) -> bool:
+    return is_json(content) and _valid_result(json.loads(content))
+
+
+def _parse_result(content: str) -> Dict[str, Any]:
+    """Parse a single-break reply; anything but a classification object raises ValueError."""
+    parsed = json.loads(content or "{}")
+    if not _valid_result(parsed):
+        raise ValueError(f"malformed classification: {(content or '')[:200]!r}")
+    return parsed
+
+
 def classify_reconciliation_breaks(
     breaks: List[Dict[str, Any]],
-    model: str = None
+    model: str = None,
+    checkpoint: Checkpoint = None,
 ):
-    """Classify and prioritize reconciliation breaks using an LLM."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    model = os.getenv("MODEL")
+    """
+    Classify and prioritize reconciliation breaks using an LLM.
+    With a checkpoint, every successful result is persisted as it arrives and breaks already in the
+    (resumed) checkpoint are not sent again.
+    """
+    client = get_client()
+    model = model or os.getenv("MODEL")
+    limiter = RateLimiter.from_env()
 
     results: List[Dict[str, Any]] = []
 
     for b in breaks:
-    
-        # Keep the entire break payload (nbim_rows, custody_rows, NET_AMOUNT_SC_DIFF, etc.)
-        break_json = json.dumps(b, ensure_ascii=False, indent=2)
-
-        user = USER_PROMPT_TEMPLATE.format(
-            break_json=break_json,
-        )
-
-        try:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user},
-                ],
-                response_format={"type": "json_object"},
-            )
-            content = resp.choices[0].message.content or "{}"
-            parsed = json.loads(content)
-        except Exception as e:
-            print(e)
+        digest = break_digest(b) if checkpoint else None
+        parsed = checkpoint.get(b["event_key"], digest) if checkpoint else None
+        if parsed is None:
+            try:
+                content = complete(client, model, _messages(b), {"type": "json_object"}, limiter, validate=_is_result, operation="classify")
+                parsed = _parse_result(content)
+            except Exception as e:
+                print(e)
+                parsed = failed_result(b, e)
+            if checkpoint and parsed.get("error") is None:
+                checkpoint.put(b["event_key"], parsed, digest)
 
         results.append(parsed)
 
     return results
+
+
+async def classify_break_async(client, model: str, b: Dict[str, Any], limiter: RateLimiter = None) -> Dict[str, Any]:
+    """Classify one break on an AsyncOpenAI client; failures return failed_result()."""
+    try:
+        content = await acomplete(client, model, _messages(b), {"type": "json_object"}, limiter, validate=_is_result, operation="classify")
+        return _parse_result(content)
+    except Exception as e:
+        print(e)
+        return failed_result(b, e)
+
+
+async def classify_reconciliation_breaks_async(
+    breaks: List[Dict[str, Any]],
+    model: str = None,
+    concurrency: int = None,
+    limiter: RateLimiter = None,
+    checkpoint: Checkpoint = None,
+):
+    """
+    Classify breaks concurrently: at most `concurrency` calls in flight (LLM_CONCURRENCY, default 8),
+    throttled by LLM_RPM / LLM_TPM and retried with backoff on 429/5xx. Results keep the input order.
+    Checkpointing as in classify_reconciliation_breaks.
+    """
+    client = get_async_client()
+    model = model or os.getenv("MODEL")
+    limiter = limiter or RateLimiter.from_env()
+    semaphore = asyncio.Semaphore(concurrency or env_int("LLM_CONCURRENCY", 8))
+
+    async def classify_one(b: Dict[str, Any]) -> Dict[str, Any]:
+        digest = break_digest(b) if checkpoint else None
+        done = checkpoint.get(b["event_key"], digest) if checkpoint else None
+        if done is not None:
+            return done
+        async with semaphore:
+            r = await classify_break_async(client, model, b, limiter)
+        if checkpoint and r.get("error") is None:
+            checkpoint.put(b["event_key"], r, digest)
+        return r
+
+    return list(await asyncio.gather(*(classify_one(b) for b in breaks)))
+
+
+# --- Batched classification: several breaks per request, packed to a token budget ---
+
+def compact_break(b: Dict[str, Any]) -> str:
+    """Single-line JSON of a break without null fields or the redundant key_tuple."""
+    slim = {}
+    for k, v in b.items():
+        if v is None or k == "key_tuple":
+            continue
+        slim[k] = {kk: vv for kk, vv in v.items() if vv is not None} if isinstance(v, dict) else v
+    return json.dumps(slim, ensure_ascii=False, separators=(",", ":"))
+
+
+def pack_batches(lines: List[str], token_budget: int, max_batch_size: int) -> List[List[int]]:
+    """Greedy, order-preserving packing of serialized breaks into batches of at most token_budget tokens."""
+    overhead = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(BATCH_USER_PROMPT_TEMPLATE)
+    batches, current, used = [], [], overhead
+    for i, line in enumerate(lines):
+        cost = estimate_tokens(line)
+        if current and (used + cost > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_batch_response(content: str) -> bool:
+    if not is_json(content):
+        return False
+    parsed = json.loads(content)
+    return isinstance(parsed, dict) and isinstance(parsed.get("results"), list)
+
+
+async def classify_reconciliation_breaks_batched(
+    breaks: List[Dict[str, Any]],
+    model: str = None,
+    token_budget: int = None,
+    max_batch_size: int = None,
+    concurrency: int = None,
+    limiter: RateLimiter = None,
+    checkpoint: Checkpoint = None,
+):
+    """
+    Classify breaks in multi-break requests. Breaks are serialized compactly and packed into
+    batches of at most `token_budget` input tokens (CLASSIFIER_BATCH_TOKENS, default 12000) and
+    `max_batch_size` breaks (CLASSIFIER_BATCH_SIZE, default 20). Entries that come back missing or
+    malformed are retried one by one with the single-break prompt. Results keep the input order.
+    Checkpointing as in classify_reconciliation_breaks: checkpointed breaks are left out of the batches.
+    """
+    client = get_async_client()
+    model = model or os.getenv("MODEL")
+    limiter = limiter or RateLimiter.from_env()
+    semaphore = asyncio.Semaphore(concurrency or env_int("LLM_CONCURRENCY", 8))
+    token_budget = token_budget or env_int("CLASSIFIER_BATCH_TOKENS", 12000)
+    max_batch_size = max_batch_size or env_int("CLASSIFIER_BATCH_SIZE", 20)
+
+    digests = [break_digest(b) if checkpoint else None for b in breaks]
+    results: List[Dict[str, Any]] = [
+        checkpoint.get(b["event_key"], digest) if checkpoint else None for b, digest in zip(breaks, digests)
+    ]
+    todo = [i for i, r in enumerate(results) if r is None]
+    lines = {i: compact_break(breaks[i]) for i in todo}
+
+    def finish(i: int, r: Dict[str, Any]):
+        results[i] = r
+        if checkpoint and r.get("error") is None:
+            checkpoint.put(breaks[i]["event_key"], r, digests[i])
+
+    async def classify_one(i: int):
+        async with semaphore:
+            finish(i, await classify_break_async(client, model, breaks[i], limiter))
+
+    async def classify_batch(batch: List[int]):
+        if len(batch) == 1:
+            return await classify_one(batch[0])
+
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": BATCH_USER_PROMPT_TEMPLATE.format(breaks_jsonl="\n".join(lines[i] for i in batch))},
+        ]
+        by_key = {}
+        async with semaphore:
+            try:
+                content = await acomplete(client, model, messages, {"type": "json_object"}, limiter, validate=_is_batch_response,
+                                          operation="classify_batch")
+                by_key = {r.get("event_key"): r for r in json.loads(content).get("results", []) if isinstance(r, dict)}
+            except Exception as e:
+                print(f"Batch of {len(batch)} breaks failed, retrying individually: {e}")
+
+        retry = []
+        for i in batch:
+            r = by_key.get(breaks[i].get("event_key"))
+            if _valid_result(r):
+                finish(i, r)
+            else:
+                retry.append(i)
+        await asyncio.gather(*(classify_one(i) for i in retry))
+
+    packed = pack_batches([lines[i] for i in todo], token_budget, max_batch_size)
+    await asyncio.gather(*(classify_batch([todo[j] for j in batch]) for batch in packed))
+    return results
@@ -0,0 +1,286 @@
+import os, json, time, random, asyncio, threading, weakref
+from typing import List, Dict, Any, Optional
+import openai
+from agents.llm_cache import ResponseCache, get_default_cache
+from metrics import get_metrics
+
+# --- Shared helpers for the agents: rate limiting, retries with backoff, response cache ---
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# --- Shared clients: one keep-alive connection pool per process (sync) and per event loop (async) ---
+# Clients are keyed by credentials and endpoint, so every agent call with the same settings reuses the
+# same warm connections instead of paying connection and TLS setup again. Retries are done by
+# complete() / acomplete(), so the clients themselves never retry.
+
+_CLIENTS: Dict[tuple, Any] = {}
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()  # event loop -> {settings: AsyncOpenAI}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _client_settings() -> tuple:
+    return os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL")
+
+
+def _client_options() -> Dict[str, Any]:
+    """
+    Timeout (LLM_TIMEOUT for the request, default 60 s; LLM_CONNECT_TIMEOUT, default 10 s) and pool limits
+    (LLM_MAX_CONNECTIONS, default 100; LLM_MAX_KEEPALIVE idle connections kept, default 20, for
+    LLM_KEEPALIVE_EXPIRY seconds, default 30). Without a plain httpx install the pool keeps its defaults.
+    """
+    options = {"timeout": openai.Timeout(env_float("LLM_TIMEOUT", 60.0), connect=env_float("LLM_CONNECT_TIMEOUT", 10.0))}
+    try:
+        import httpx
+    except ImportError:
+        return options
+    options["limits"] = httpx.Limits(
+        max_connections=env_int("LLM_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=env_int("LLM_MAX_KEEPALIVE", 20),
+        keepalive_expiry=env_float("LLM_KEEPALIVE_EXPIRY", 30.0),
+    )
+    return options
+
+
+def get_client() -> openai.OpenAI:
+    """Process-wide OpenAI client (thread-safe) for the current OPENAI_API_KEY / OPENAI_BASE_URL."""
+    settings = _client_settings()
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(settings)
+        if client is None:
+            options = _client_options()
+            client = _CLIENTS[settings] = openai.OpenAI(
+                api_key=settings[0], max_retries=0, timeout=options["timeout"],
+                http_client=openai.DefaultHttpxClient(**options),
+            )
+        return client
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Shared AsyncOpenAI client of the running event loop (async connections cannot cross loops),
+    for the current OPENAI_API_KEY / OPENAI_BASE_URL. Dropped together with its loop.
+    """
+    loop = asyncio.get_running_loop()
+    settings = _client_settings()
+    with _CLIENTS_LOCK:
+        clients = _ASYNC_CLIENTS.setdefault(loop, {})
+        client = clients.get(settings)
+        if client is None:
+            options = _client_options()
+            client = clients[settings] = openai.AsyncOpenAI(
+                api_key=settings[0], max_retries=0, timeout=options["timeout"],
+                http_client=openai.DefaultAsyncHttpxClient(**options),
+            )
+        return client
+
+
+def close_clients():
+    """Close the shared sync clients and their connections (the next get_client() opens a new pool)."""
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.close()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for rate limiting and packing."""
+    return len(text) // 4 + 1
+
+
+def messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") for m in messages)
+
+
+class _Bucket:
+    """Token bucket refilled continuously at capacity per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Take amount if available and return 0, else return the seconds until it will be."""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """
+    Request- and token-per-minute limiter shared by all calls of a stage.
+    Either limit may be None (unlimited). Works from threads and from asyncio tasks.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(env_int("LLM_RPM", None), env_int("LLM_TPM", None))
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            # Check both buckets before taking from either
+            if self.requests:
+                wait = self.requests.wait_time(1)
+                if wait:
+                    return wait
+            if self.tokens:
+                wait = self.tokens.wait_time(tokens)
+                if wait:
+                    if self.requests:
+                        self.requests.level += 1  # give the request slot back
+                    return wait
+            return 0.0
+
+    def wait(self, tokens: int = 0):
+        while (delay := self._reserve(tokens)) > 0:
+            time.sleep(delay)
+
+    async def acquire(self, tokens: int = 0):
+        while (delay := self._reserve(tokens)) > 0:
+            await asyncio.sleep(delay)
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return getattr(exc, "status_code", None) in RETRYABLE_STATUS
+
+
+def backoff_delay(exc: Exception, attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Retry-After when the server sends one, else exponential backoff with full jitter."""
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_reason(exc: Exception) -> str:
+    """Metrics label for a retried error: the HTTP status, or the exception type for connection errors."""
+    status = getattr(exc, "status_code", None)
+    return str(status) if status is not None else type(exc).__name__
+
+
+def _cache_lookup(cache, use_cache: bool, model, messages, response_format, operation: str):
+    cache = cache or (get_default_cache() if use_cache else None)
+    if cache is None:
+        return None, None, None
+    key = ResponseCache.key(model, messages, response_format)
+    cached = cache.get(key)
+    get_metrics().llm_cache(operation, model, cached is not None)
+    return cache, key, cached
+
+
+def complete(client, model: str, messages: List[Dict[str, Any]], response_format: Dict[str, Any],
+             limiter: Optional[RateLimiter] = None, max_retries: Optional[int] = None,
+             cache: Optional[ResponseCache] = None, use_cache: bool = True, validate=None,
+             operation: str = "chat") -> str:
+    """
+    Blocking chat completion with rate limiting and retries on 429/5xx/timeouts. Returns the content.
+    Responses are served from / stored in the shared response cache; `validate(content)` must
+    return True for a response to be cached (e.g. it parses as the expected JSON).
+    Latency, tokens, retries and cache hits are recorded in the run metrics under `operation`.
+    """
+    cache, key, cached = _cache_lookup(cache, use_cache, model, messages, response_format, operation)
+    if cached is not None:
+        return cached
+
+    content = _complete(client, model, messages, response_format, limiter, max_retries, operation)
+    if cache is not None and (validate is None or validate(content)):
+        cache.put(key, content)
+    return content
+
+
+async def acomplete(client, model: str, messages: List[Dict[str, Any]], response_format: Dict[str, Any],
+                    limiter: Optional[RateLimiter] = None, max_retries: Optional[int] = None,
+                    cache: Optional[ResponseCache] = None, use_cache: bool = True, validate=None,
+                    operation: str = "chat") -> str:
+    """Async version of complete() for an AsyncOpenAI client."""
+    cache, key, cached = _cache_lookup(cache, use_cache, model, messages, response_format, operation)
+    if cached is not None:
+        return cached
+
+    content = await _acomplete(client, model, messages, response_format, limiter, max_retries, operation)
+    if cache is not None and (validate is None or validate(content)):
+        cache.put(key, content)
+    return content
+
+
+def is_json(content: str) -> bool:
+    try:
+        json.loads(content)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _complete(client, model, messages, response_format, limiter, max_retries, operation="chat") -> str:
+    max_retries = env_int("LLM_MAX_RETRIES", 5) if max_retries is None else max_retries
+    metrics = get_metrics()
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.wait(messages_tokens(messages))
+        start = time.perf_counter()
+        try:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format=response_format,
+            )
+            metrics.llm_call(operation, model, time.perf_counter() - start, getattr(resp, "usage", None))
+            return resp.choices[0].message.content or ""
+        except Exception as e:
+            metrics.llm_call(operation, model, time.perf_counter() - start, error=True)
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.llm_retry(operation, model, retry_reason(e))
+            time.sleep(backoff_delay(e, attempt))
+
+
+async def _acomplete(client, model, messages, response_format, limiter, max_retries, operation="chat") -> str:
+    max_retries = env_int("LLM_MAX_RETRIES", 5) if max_retries is None else max_retries
+    metrics = get_metrics()
+    for attempt in range(max_retries + 1):
+        if limiter:
+            await limiter.acquire(messages_tokens(messages))
+        start = time.perf_counter()
+        try:
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format=response_format,
+            )
+            metrics.llm_call(operation, model, time.perf_counter() - start, getattr(resp, "usage", None))
+            return resp.choices[0].message.content or ""
+        except Exception as e:
+            metrics.llm_call(operation, model, time.perf_counter() - start, error=True)
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.llm_retry(operation, model, retry_reason(e))
+            await asyncio.sleep(backoff_delay(e, attempt))
@@ -0,0 +1,124 @@
+import os, json, time, sqlite3, hashlib, threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+# --- Persistent, content-addressed cache of LLM responses (SQLite) ---
+# Key: sha256 of model + messages (system prompt and user payload) + response_format.
+# Entries expire after a TTL; the least recently used ones are evicted past max_entries / max_bytes.
+
+CACHE_PATH = "cache/llm_responses.sqlite"
+
+
+class ResponseCache:
+
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = 256 * 1024 * 1024,
+                 evict_every: int = 64):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]], response_format: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "response_format": response_format},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value.encode("utf-8"))),
+            )
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until within the size limits."""
+        with self._lock, self._db:
+            if self.ttl_seconds is not None:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            if not ((self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes)):
+                return
+
+            doomed = []
+            for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                if not ((self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes)):
+                    break
+                doomed.append((key,))
+                count -= 1
+                total -= size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._db.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    """
+    Process-wide cache shared by all agents, configured from the environment:
+    LLM_CACHE=0 disables it; LLM_CACHE_PATH, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_MB.
+    """
+    global _default_cache
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            ttl_hours = os.getenv("LLM_CACHE_TTL_HOURS")
+            max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+            _default_cache = ResponseCache(
+                path=os.getenv("LLM_CACHE_PATH") or CACHE_PATH,
+                ttl_seconds=float(ttl_hours) * 3600 if ttl_hours else 7 * 24 * 3600,
+                max_entries=int(max_entries) if max_entries else None,
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_MB") or 256) * 1024 * 1024,
+            )
+        return _default_cache
@@ -1,7 +1,7 @@
-import os, json
+import os, json, asyncio
 from typing import List, Dict, Any
-from openai import OpenAI
 from dotenv import load_dotenv
+from agents.llm import RateLimiter, complete, acomplete, env_int, is_json, get_client, get_async_client
 
 load_dotenv()
 
@@ -97,8 +97,7 @@ def prioritize_breaks(
     model: str = None
 ):
     """Prioritize reconciliation breaks using an LLM."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
+    client = get_client()
     model = model or os.getenv("MODEL") or "gpt-5-mini"  # fallback to a fast model
 
     #break_json = json.dumps(breaks, ensure_ascii=False, indent=2)
@@ -106,16 +105,17 @@ def prioritize_breaks(
     user = USER_PROMPT_TEMPLATE.format(breaks=breaks)
 
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
+        content = complete(
+            client,
+            model,
+            [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user},
             ],
-            response_format={"type": "json_object"},
-        )
-
-        content = resp.choices[0].message.content.strip()
+            {"type": "json_object"},
+            validate=is_json,
+            operation="prioritize",
+        ).strip()
         parsed = json.loads(content)
 
         return parsed
@@ -123,3 +123,48 @@ def prioritize_breaks(
     except Exception as e:
         print(f"Error in prioritize_breaks: {e}")
         return breaks
+
+
+# --- Short LLM rationales for the top of a deterministic ranking (break_prioritizer) ---
+
+REASON_SYSTEM_PROMPT = """You explain the priority of dividend reconciliation breaks in an ops queue.
+Given one classified break and its rank, write ONE short reason (max 25 words) focused on cash impact,
+classification and urgency. Return strict JSON: {"reason": "..."}"""
+
+
+async def explain_priorities_async(
+    entries: List[Dict[str, Any]],
+    classified: List[Dict[str, Any]],
+    model: str = None,
+    concurrency: int = None,
+):
+    """
+    Replace the deterministic reason of each ranking entry with a short LLM-written one, in parallel.
+    Entries whose call fails keep their deterministic reason. Mutates and returns `entries`.
+    """
+    client = get_async_client()
+    model = model or os.getenv("MODEL") or "gpt-5-mini"
+    limiter = RateLimiter.from_env()
+    semaphore = asyncio.Semaphore(concurrency or env_int("LLM_CONCURRENCY", 8))
+    by_key = {(str(c.get("COAC_EVENT_KEY")), str(c.get("BANK_ACCOUNT"))): c for c in classified}
+
+    async def explain(entry: Dict[str, Any]):
+        record = by_key.get((str(entry.get("COAC_EVENT_KEY")), str(entry.get("BANK_ACCOUNT"))), {})
+        payload = {k: v for k, v in record.items() if k != "action_params"}
+        user = json.dumps({"priority": entry["priority"], "score": entry.get("score"), "break": payload},
+                          ensure_ascii=False, separators=(",", ":"))
+        async with semaphore:
+            try:
+                content = await acomplete(
+                    client, model,
+                    [{"role": "system", "content": REASON_SYSTEM_PROMPT}, {"role": "user", "content": user}],
+                    {"type": "json_object"}, limiter, validate=is_json, operation="explain",
+                )
+                reason = json.loads(content).get("reason")
+                if reason:
+                    entry["reason"] = reason
+            except Exception as e:
+                print(f"Error in explain_priorities_async: {e}")
+
+    await asyncio.gather(*(explain(e) for e in entries))
+    return entries
@@ -1,6 +1,9 @@
-import os, json
+import os, re, json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 from openai import OpenAI
+from agents.llm import RateLimiter, complete, env_int, get_client
 
 # --- Compact glossary the agent will see in the system prompt ---
 
@@ -108,52 +111,182 @@ JSON: {break_json}
 
 """
 
+CONSOLIDATED_USER_PROMPT_TEMPLATE = """Draft ONE formal consolidated custodian ticket covering all reconciliation breaks below for the same custodian. Follow the system instructions and the required document structure, but:
+- Use the subject "Dividend reconciliation discrepancies — {{number of events}} COAC events".
+- Summarize the discrepancies per classification (count, total cash difference per currency, typical cause); do not list every event.
+- A table of all affected COAC events is appended automatically below your text; refer to it instead of repeating it.
+Only use facts from the JSON.
+JSON: {summary_json}
+
+"""
+
+def _messages(user: str) -> List[Dict[str, Any]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user},
+    ]
+
+
+def _draft(client, model: str, user: str, limiter: RateLimiter = None):
+    content = None
+    try:
+        content = complete(
+            client,
+            model,
+            _messages(user),
+            {"type": "text"},
+            limiter,
+            validate=bool,  # never cache an empty ticket
+            operation="ticket",
+        )
+
+    except Exception as e:
+        print(e)
+
+    return content
+
+
 def draft_custodian_ticket(
     breaks: Dict[str, Any],
-    model: str = None
+    model: str = None,
+    client: OpenAI = None,
+    limiter: RateLimiter = None,
 ):
-   
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    model = os.getenv("MODEL")
-    
+    """Draft one ticket for one classified break (pass `client` to reuse a connection pool)."""
+    client = client or get_client()
+    model = model or os.getenv("MODEL")
+
     break_json = json.dumps(breaks, ensure_ascii=False, indent=2)
 
     user = USER_PROMPT_TEMPLATE.format(
         break_json=break_json,
     )
 
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user},
-            ],
-            response_format={"type": "text"},
+    return _draft(client, model, user, limiter)
+
+
+def _safe_name(value: Any) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(value)).strip("_") or "unknown"
+
+
+def events_table(breaks: List[Dict[str, Any]]) -> str:
+    """Markdown table of the COAC events covered by a consolidated ticket."""
+    lines = [
+        "| COAC_EVENT_KEY | BANK_ACCOUNT | Organisation | Classification | Net cash difference | Currency |",
+        "|---|---|---|---|---:|---|",
+    ]
+    for b in sorted(breaks, key=lambda b: str(b.get("classification"))):
+        diff = b.get("NET_AMOUNT_SC_DIFF")
+        diff = f"{diff:,.2f}" if isinstance(diff, (int, float)) else ""
+        lines.append(
+            f"| {b.get('COAC_EVENT_KEY', '')} | {b.get('BANK_ACCOUNT', '')} | {b.get('ORGANISATION_NAME') or ''} "
+            f"| {b.get('classification', '')} | {diff} | {b.get('SETTLEMENT_CURRENCY') or ''} |"
         )
-        content = resp.choices[0].message.content or "{}"
-        
-    except Exception as e:
-        print(e)
+    return "\n".join(lines)
+
+
+def _custodian_summary(custodian: str, breaks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    groups = defaultdict(list)
+    for b in breaks:
+        groups[b.get("classification") or "OTHER"].append(b)
+
+    summary = {"CUSTODIAN": custodian, "number_of_events": len(breaks), "classifications": {}}
+    for label, items in sorted(groups.items()):
+        totals = defaultdict(float)
+        for b in items:
+            if isinstance(b.get("NET_AMOUNT_SC_DIFF"), (int, float)):
+                totals[b.get("SETTLEMENT_CURRENCY") or "?"] += b["NET_AMOUNT_SC_DIFF"]
+        summary["classifications"][label] = {
+            "count": len(items),
+            "total_NET_AMOUNT_SC_DIFF": {ccy: round(v, 2) for ccy, v in totals.items()},
+            "examples": [
+                {k: b.get(k) for k in ("COAC_EVENT_KEY", "BANK_ACCOUNT", "ORGANISATION_NAME", "description", "NET_AMOUNT_SC_DIFF", "SETTLEMENT_CURRENCY")}
+                for b in items[:3]
+            ],
+        }
+    return summary
+
+
+def draft_consolidated_ticket(
+    custodian: str,
+    breaks: List[Dict[str, Any]],
+    model: str = None,
+    client: OpenAI = None,
+    limiter: RateLimiter = None,
+):
+    """One ticket for all breaks of a custodian: LLM-written summary plus a table of affected COAC events."""
+    client = client or get_client()
+    model = model or os.getenv("MODEL")
+
+    summary_json = json.dumps(_custodian_summary(custodian, breaks), ensure_ascii=False, indent=2)
+    body = _draft(client, model, CONSOLIDATED_USER_PROMPT_TEMPLATE.format(summary_json=summary_json), limiter)
+    if not body:
+        return None
+    return f"{body.rstrip()}\n\n## Affected COAC events\n\n{events_table(breaks)}\n"
+
+
+def ticket_path(b: Dict[str, Any], out_dir: str = "drafted_tickets") -> str:
+    """One ticket per break: custodian_ticket_<COAC_EVENT_KEY>_<BANK_ACCOUNT>.md"""
+    return os.path.join(out_dir, f"custodian_ticket_{b.get('COAC_EVENT_KEY', 'unknown')}_{b.get('BANK_ACCOUNT', 'unknown')}.md")
+
+
+def consolidated_ticket_path(custodian: Any, out_dir: str = "drafted_tickets") -> str:
+    """One ticket per custodian: custodian_ticket_<CUSTODIAN>.md"""
+    return os.path.join(out_dir, f"custodian_ticket_{_safe_name(custodian or 'unknown')}.md")
+
+
+def write_ticket(filename: str, ticket: str):
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(ticket)
+
+    print(f"✅ Wrote custodian ticket to {filename}")
 
-    return content
 
 def draft_custodian_tickets(
     breaks: List[Dict[str, Any]],
-    model: str = None
+    model: str = None,
+    max_workers: int = None,
+    consolidate: bool = None,
+    out_dir: str = "drafted_tickets",
 ):
-    """Draft custodian tickets for multiple breaks."""
-    for b in breaks:
-        if b.get("recommended_action") == "DRAFT_CUSTODIAN_TICKET":
-            ticket = draft_custodian_ticket(b, model=model)
-            
-            # Write each ticket to a separate .txt file
-            coac_key = b.get("COAC_EVENT_KEY", "unknown")
-            bank_acc = b.get("BANK_ACCOUNT", "unknown")
-            filename = f"drafted_tickets/custodian_ticket_{coac_key}_{bank_acc}.md"
-
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(ticket)
-
-            print(f"✅ Wrote custodian ticket to {filename}")
+    """
+    Draft custodian tickets for multiple breaks on a bounded worker pool sharing one client
+    (TICKET_WORKERS, default 8). With `consolidate` (TICKETS_CONSOLIDATE=1) breaks are grouped
+    by CUSTODIAN into one ticket per custodian. Returns the written file paths.
+    """
+    client = get_client()
+    limiter = RateLimiter.from_env()
+    max_workers = max_workers or env_int("TICKET_WORKERS", 8)
+    if consolidate is None:
+        consolidate = os.getenv("TICKETS_CONSOLIDATE") == "1"
+
+    todo = [b for b in breaks if b.get("recommended_action") == "DRAFT_CUSTODIAN_TICKET"]
+
+    if consolidate:
+        groups = defaultdict(list)
+        for b in todo:
+            groups[b.get("CUSTODIAN") or "unknown"].append(b)
+        jobs = [
+            (consolidated_ticket_path(custodian, out_dir),
+             lambda custodian=custodian, items=items: draft_consolidated_ticket(custodian, items, model, client, limiter))
+            for custodian, items in groups.items()
+        ]
+    else:
+        jobs = [
+            (ticket_path(b, out_dir), lambda b=b: draft_custodian_ticket(b, model, client, limiter))
+            for b in todo
+        ]
+
+    written = []
+
+    def run(job):
+        filename, draft = job
+        ticket = draft()
+        if ticket:
+            write_ticket(filename, ticket)
+            written.append(filename)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(run, jobs))
+
+    return written
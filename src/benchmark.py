@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from data_prcessing import load_csv, normalize_columns, get_event_store, join_events
+from break_detector import DETECTOR_COLUMNS, detect_breaks, detect_breaks_frame, to_break_events, detect_breaks_streaming
+from pre_classifier import pre_classify
+from break_prioritizer import rank_breaks
+from write_to_excel import write_rows, combined_rows, COLUMN_ORDER
+from report_writers import JsonlWriter, iter_jsonl
+from synthetic_data import generate, NBIM_FILE, CUSTODY_FILE
+from sharding import reconcile_sharded
+
+# Per-stage benchmark on synthetic data: wall time and peak traced memory of each stage, appended to
+# benchmarks/results.jsonl with the git commit so runs can be compared across commits (--compare).
+
+RESULTS_PATH = "benchmarks/results.jsonl"
+DATA_DIR = "cache/bench"
+
+# LLM stages send at most this many breaks (to the stub server, see --llm-server)
+LLM_MAX_BREAKS = 2_000
+
+
+def _load(ctx):
+    ctx["nbim"], ctx["custody"] = normalize_columns(load_csv(ctx["nbim_path"]), load_csv(ctx["custody_path"]))
+    return len(ctx["nbim"]) + len(ctx["custody"])
+
+
+def _event_store(ctx):
+    ctx["store"] = get_event_store(ctx["nbim"], ctx["custody"])
+    return len(ctx["store"])
+
+
+def _detect_store(ctx):
+    return len(detect_breaks(ctx["store"]))
+
+
+def _join(ctx):
+    ctx["joined"] = join_events(ctx["nbim"], ctx["custody"], columns=DETECTOR_COLUMNS)
+    return len(ctx["joined"])
+
+
+def _detect(ctx):
+    ctx["breaks"] = to_break_events(detect_breaks_frame(ctx["joined"]), ctx["nbim"], ctx["custody"])
+    return len(ctx["breaks"])
+
+
+def _detect_streaming(ctx):
+    return len(detect_breaks_streaming(ctx["nbim_path"], ctx["custody_path"], chunksize=100_000))
+
+
+def _detect_sharded(ctx):
+    breaks, _ = reconcile_sharded(ctx["nbim_path"], ctx["custody_path"])
+    return len(breaks)
+
+
+def _pre_classify(ctx):
+    ctx["resolved"], ctx["remaining"] = pre_classify(ctx["breaks"])
+    return len(ctx["resolved"])
+
+
+def _rank(ctx):
+    ctx["prioritized"] = rank_breaks(ctx["resolved"], ctx["breaks"])
+    return len(ctx["prioritized"]["reconciliation_breaks"])
+
+
+def _excel(ctx):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_rows(COLUMN_ORDER, combined_rows(ctx["prioritized"], ctx["resolved"]), os.path.join(tmp, "bench.xlsx"))
+    return len(ctx["resolved"])
+
+
+def _classify(ctx):
+    from agents.classifier_agent import classify_reconciliation_breaks_async
+
+    breaks = ctx["breaks"][: ctx["llm_max"]]
+    classified = asyncio.run(classify_reconciliation_breaks_async(breaks))
+    return sum(1 for r in classified if r.get("error") is None)
+
+
+def _pipeline(ctx):
+    from pipeline import run_pipeline
+
+    with tempfile.TemporaryDirectory() as tmp:
+        classified, _, written = asyncio.run(run_pipeline(ctx["breaks"][: ctx["llm_max"]], [], out_dir=tmp))
+    return len(classified) + len(written)
+
+
+# name -> (function, prerequisite stages); stages run in this order and feed each other through ctx
+STAGES = {
+    "load": (_load, []),
+    "event_store": (_event_store, ["load"]),
+    "detect_store": (_detect_store, ["event_store"]),
+    "join": (_join, ["load"]),
+    "detect": (_detect, ["join"]),
+    "detect_streaming": (_detect_streaming, []),
+    "detect_sharded": (_detect_sharded, []),
+    "pre_classify": (_pre_classify, ["detect"]),
+    "rank": (_rank, ["pre_classify"]),
+    "excel": (_excel, ["rank"]),
+    "classify": (_classify, ["detect"]),
+    "pipeline": (_pipeline, ["detect"]),
+}
+
+# Stages that call the LLM endpoint; they only run against OPENAI_BASE_URL (e.g. the stub server)
+LLM_STAGES = {"classify", "pipeline"}
+
+
+def _with_prerequisites(stages):
+    needed, todo = set(), list(stages)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(STAGES[name][1])
+    return [name for name in STAGES if name in needed]
+
+
+def git_commit():
+    """(commit hash, dirty) of the working tree, (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def dataset(rows: int, seed: int = 0, data_dir: str = DATA_DIR):
+    """Synthetic input files for `rows` events, generated once and reused."""
+    out = os.path.join(data_dir, f"{rows}-{seed}")
+    nbim_path, custody_path = os.path.join(out, NBIM_FILE), os.path.join(out, CUSTODY_FILE)
+    if not (os.path.exists(nbim_path) and os.path.exists(custody_path)):
+        print(f"Generating {rows:,} synthetic events in {out} ...")
+        generate(rows, out, seed=seed)
+    return nbim_path, custody_path
+
+
+def measure(fn, ctx, memory: bool = True):
+    """(seconds, peak MB allocated during the call or None, output count)."""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        count = fn(ctx)
+        return time.perf_counter() - start, (tracemalloc.get_traced_memory()[1] / 1e6 if memory else None), count
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+
+def start_llm_server(latency_ms: float = 0.0, **faults):
+    """Start the stub LLM server in-process and point the agents at it (no API key, no response cache)."""
+    from llm_stub_server import StubConfig, start_server
+
+    server = start_server(StubConfig(latency_ms=latency_ms, **faults))
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["LLM_CACHE"] = "0"
+    print(f"Stub LLM server on {server.base_url}")
+    return server
+
+
+def run(rows_list, stages=None, memory: bool = True, seed: int = 0,
+        results_path: str = RESULTS_PATH, llm_max: int = LLM_MAX_BREAKS):
+    """Run the selected stages for every size and append one record per stage to results_path."""
+    stages = stages or [s for s in STAGES if s not in LLM_STAGES]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}; expected some of {list(STAGES)}")
+    if set(stages) & LLM_STAGES and not os.getenv("OPENAI_BASE_URL"):
+        raise ValueError("LLM stages need --llm-server or OPENAI_BASE_URL pointing at a stub endpoint")
+    commit, dirty = git_commit()
+    stamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    records = []
+
+    with JsonlWriter(results_path, append=True) as out:
+        for rows in rows_list:
+            nbim_path, custody_path = dataset(rows, seed)
+            ctx = {"nbim_path": nbim_path, "custody_path": custody_path, "llm_max": llm_max}
+            for name in _with_prerequisites(stages):
+                fn, _ = STAGES[name]
+                seconds, peak_mb, count = measure(fn, ctx, memory and name in stages)
+                if name not in stages:
+                    continue  # prerequisite of a selected stage, not reported
+                record = {
+                    "commit": commit, "dirty": dirty, "timestamp": stamp, "rows": rows, "stage": name,
+                    "seconds": round(seconds, 4), "peak_mb": None if peak_mb is None else round(peak_mb, 1),
+                    "items": count, "memory_traced": memory, "python": platform.python_version(),
+                }
+                out.write(record)
+                records.append(record)
+                peak = "" if peak_mb is None else f"{peak_mb:>10.1f} MB"
+                print(f"{rows:>10,} {name:<18} {seconds:>9.3f} s {peak} ({count:,} items)")
+    return records
+
+
+def compare(results_path: str = RESULTS_PATH, baseline: str = None, threshold: float = 1.2):
+    """
+    Compare the latest run of the current commit with a baseline commit (default: the most recent
+    other commit in the results) per (rows, stage, memory_traced). Returns the regressions.
+    """
+    commit, _ = git_commit()
+    latest, order = {}, {}
+    for i, r in enumerate(iter_jsonl(results_path)):
+        latest[(r["commit"], r["rows"], r["stage"], r.get("memory_traced"))] = r
+        order[r["commit"]] = i
+
+    others = sorted((c for c in order if c != commit), key=order.get)
+    if baseline is None and others:
+        baseline = others[-1]
+    base = {k[1:]: r for k, r in latest.items() if baseline and k[0].startswith(baseline)}
+    current = {k[1:]: r for k, r in latest.items() if k[0] == commit}
+    if not base or not current:
+        print("Nothing to compare (need results for the current commit and a baseline commit).")
+        return []
+
+    print(f"baseline {baseline[:10]} -> current {commit[:10]}")
+    regressions = []
+    for key in sorted(set(base) & set(current)):
+        b, c = base[key], current[key]
+        ratio = c["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{key[0]:>10,} {key[1]:<18} {b['seconds']:>9.3f} s -> {c['seconds']:>9.3f} s ({ratio:.2f}x){flag}")
+        if flag:
+            regressions.append({"rows": key[0], "stage": key[1], "baseline": b, "current": c, "ratio": ratio})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage benchmark on synthetic dividend bookings")
+    parser.add_argument("--rows", default=None, help="comma-separated event counts (default 1000,10000,100000)")
+    parser.add_argument("--stages", default=None,
+                        help=f"comma-separated subset of {','.join(STAGES)} (default: all but the LLM stages)")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (pure timings)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--compare", nargs="?", const="", default=None, metavar="BASELINE",
+                        help="compare with a baseline commit (default: the previous one in the results)")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--llm-server", action="store_true", help="run the LLM stages against an in-process stub server")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="mean stub response latency")
+    parser.add_argument("--llm-p429", type=float, default=0.0, help="share of stub responses that are 429s")
+    parser.add_argument("--llm-max", type=int, default=LLM_MAX_BREAKS, help="breaks sent to the LLM stages")
+    args = parser.parse_args()
+
+    if args.llm_server:
+        start_llm_server(args.llm_latency_ms, p_429=args.llm_p429, seed=args.seed)
+
+    # --compare on its own only compares stored results
+    if args.compare is None or args.rows:
+        rows = args.rows or "1000,10000,100000"
+        stages = args.stages.split(",") if args.stages else None
+        if stages is None and args.llm_server:
+            stages = list(STAGES)
+        run([int(r) for r in rows.split(",") if r], stages, not args.no_memory,
+            args.seed, args.results, args.llm_max)
+    if args.compare is not None:
+        sys.exit(1 if compare(args.results, args.compare or None, args.threshold) else 0)
@@ -1,20 +1,201 @@
-def detect_breaks(events):
+import numpy as np
+import pandas as pd
+from data_prcessing import EventStore, build_events, iter_partitions, join_events
 
-    # Simple break detection based on NET_AMOUNT_SC difference
+# --- Tolerances ---
+# A delta is treated as noise when |nbim - custody| <= max(abs, rel * max(|nbim|, |custody|)).
 
-    breaks = []
+DEFAULT_TOLERANCES = {
+    "NET_AMOUNT_SC": {"abs": 0.01, "rel": 0.0},
+    "GROSS_AMOUNT_QC": {"abs": 0.01, "rel": 0.0},
+    "TAX_AMOUNT_QC": {"abs": 0.01, "rel": 0.0},
+    "TAX_RATE": {"abs": 1e-4, "rel": 0.0},
+    "DIV_RATE": {"abs": 1e-8, "rel": 0.0},
+    "NOMINAL_BASIS": {"abs": 0.0, "rel": 0.0},
+}
+
+# Overrides per currency of the compared amount (merged on top of the defaults), e.g. currencies without
+# minor units. Quotation-currency amounts (*_QC) are looked up by CURRENCY_QC, the others by CURRENCY_SC.
+CURRENCY_TOLERANCES = {
+    "JPY": {"NET_AMOUNT_SC": {"abs": 1.0}, "GROSS_AMOUNT_QC": {"abs": 1.0}, "TAX_AMOUNT_QC": {"abs": 1.0}},
+    "KRW": {"NET_AMOUNT_SC": {"abs": 1.0}, "GROSS_AMOUNT_QC": {"abs": 1.0}, "TAX_AMOUNT_QC": {"abs": 1.0}},
+}
+
+COMPARED_FIELDS = list(DEFAULT_TOLERANCES)
+
+# Currency column that selects a field's CURRENCY_TOLERANCES entry (default CURRENCY_SC)
+FIELD_CURRENCY = {"GROSS_AMOUNT_QC": "CURRENCY_QC", "TAX_AMOUNT_QC": "CURRENCY_QC"}
+
+# Typed break reasons emitted per event
+MISSING_NBIM = "MISSING_NBIM"
+MISSING_CUSTODY = "MISSING_CUSTODY"
+BREAK_REASONS = [MISSING_NBIM, MISSING_CUSTODY] + [f"{f}_MISMATCH" for f in COMPARED_FIELDS]
+
+# Source columns needed from each side (after normalize_columns)
+NBIM_COLUMNS = [
+    "NET_AMOUNT_SC", "GROSS_AMOUNT_QC", "TAX_RATE", "DIV_RATE", "NOMINAL_BASIS",
+    "WTHTAX_COST_QUOTATION", "LOCALTAX_COST_QUOTATION", "CURRENCY_SC", "CURRENCY_QC",
+]
+CUSTODY_COLUMNS = [
+    "NET_AMOUNT_SC", "GROSS_AMOUNT_QC", "TAX_RATE", "DIV_RATE", "NOMINAL_BASIS",
+    "TAX", "CURRENCY_SC", "CURRENCY_QC",
+]
+DETECTOR_COLUMNS = list(dict.fromkeys(NBIM_COLUMNS + CUSTODY_COLUMNS))
+
+
+def _num(frame: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in frame.columns:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=float)
+
+
+def _side_values(frame: pd.DataFrame, side: str):
+    """Compared values of one side of a joined frame, incl. the derived tax amount in QC."""
+    values = {f: _num(frame, f"{f}_{side}") for f in COMPARED_FIELDS if f != "TAX_AMOUNT_QC"}
+    if side == "nbim":
+        wht = _num(frame, "WTHTAX_COST_QUOTATION_nbim")
+        local = np.nan_to_num(_num(frame, "LOCALTAX_COST_QUOTATION_nbim"))
+        values["TAX_AMOUNT_QC"] = wht + local
+    else:
+        values["TAX_AMOUNT_QC"] = _num(frame, "TAX_custody")
+    return values
+
+
+def _currency(frame: pd.DataFrame, col: str) -> np.ndarray:
+    """Currency per event from the NBIM side, else the custody side."""
+    missing = pd.Series(np.nan, index=frame.index)
+    nb = frame[f"{col}_nbim"] if f"{col}_nbim" in frame.columns else missing
+    cu = frame[f"{col}_custody"] if f"{col}_custody" in frame.columns else missing
+    return nb.fillna(cu).astype(object).to_numpy()
+
+
+def _tolerance_arrays(field, currency: np.ndarray, tolerances, currency_tolerances):
+    base = {**DEFAULT_TOLERANCES.get(field, {}), **tolerances.get(field, {})}
+    abs_tol = np.full(len(currency), float(base.get("abs", 0.0)))
+    rel_tol = np.full(len(currency), float(base.get("rel", 0.0)))
+    for ccy, overrides in currency_tolerances.items():
+        if field not in overrides:
+            continue
+        mask = currency == ccy
+        abs_tol[mask] = overrides[field].get("abs", base.get("abs", 0.0))
+        rel_tol[mask] = overrides[field].get("rel", base.get("rel", 0.0))
+    return abs_tol, rel_tol
+
+
+def detect_breaks_frame(joined: pd.DataFrame, tolerances=None, currency_tolerances=None) -> pd.DataFrame:
+    """
+    Columnar break detection over a join_events() frame.
+
+    Adds signed <FIELD>_DELTA (NBIM - custody) and <FIELD>_MISMATCH columns for every compared field,
+    NET_AMOUNT_SC_DIFF (absolute cash impact), IS_BREAK and BREAK_REASONS (list, set on breaks only).
+    An event is a break when one side is missing or NET_AMOUNT_SC is outside tolerance;
+    the other fields only add reasons to explain it.
+    """
+    tolerances = tolerances or {}
+    currency_tolerances = CURRENCY_TOLERANCES if currency_tolerances is None else currency_tolerances
+
+    out = joined.copy()
+    status = out["match_status"].to_numpy() if "match_status" in out.columns else np.full(len(out), "matched")
+    nbim_missing = status == "custody_only"
+    custody_missing = status == "nbim_only"
+    matched = ~(nbim_missing | custody_missing)
 
-    for event in events:
+    currencies = {col: _currency(out, col) for col in {"CURRENCY_SC", *FIELD_CURRENCY.values()}}
 
-        nbim_net_sc = event['nbim_rows']['NET_AMOUNT_SC']
-        custody_net_sc = event['custody_rows']['NET_AMOUNT_SC']
+    nb = _side_values(out, "nbim")
+    cu = _side_values(out, "custody")
 
-        diff = abs(nbim_net_sc - custody_net_sc)
-        event['NET_AMOUNT_SC_DIFF'] = diff
-        
-        if diff > 0:
-            breaks.append(event)
+    flags = {MISSING_NBIM: nbim_missing, MISSING_CUSTODY: custody_missing}
+    for field in COMPARED_FIELDS:
+        a, b = nb[field], cu[field]
+        delta = a - b
+        currency = currencies[FIELD_CURRENCY.get(field, "CURRENCY_SC")]
+        abs_tol, rel_tol = _tolerance_arrays(field, currency, tolerances, currency_tolerances)
+        limit = np.maximum(abs_tol, rel_tol * np.fmax(np.abs(a), np.abs(b)))
+
+        # Flag when outside tolerance or when only one side has a value
+        one_sided = np.isnan(a) != np.isnan(b)
+        with np.errstate(invalid="ignore"):
+            mismatch = matched & ((np.abs(delta) > limit) | one_sided)
+
+        out[f"{field}_DELTA"] = delta
+        out[f"{field}_MISMATCH"] = mismatch
+        flags[f"{field}_MISMATCH"] = mismatch
+
+    # Cash impact: full amount of the present side when a record is missing
+    net_diff = np.abs(nb["NET_AMOUNT_SC"] - cu["NET_AMOUNT_SC"])
+    net_diff = np.where(nbim_missing, np.abs(cu["NET_AMOUNT_SC"]), net_diff)
+    net_diff = np.where(custody_missing, np.abs(nb["NET_AMOUNT_SC"]), net_diff)
+    out["NET_AMOUNT_SC_DIFF"] = net_diff
+
+    is_break = nbim_missing | custody_missing | flags["NET_AMOUNT_SC_MISMATCH"]
+    out["IS_BREAK"] = is_break
+
+    reason_matrix = np.column_stack([flags[r] for r in BREAK_REASONS])[is_break]
+    reasons = np.full(len(out), None, dtype=object)
+    for i, row in zip(np.flatnonzero(is_break), reason_matrix):
+        reasons[i] = [r for r, hit in zip(BREAK_REASONS, row) if hit]
+    out["BREAK_REASONS"] = reasons
+    return out
+
+
+def to_break_events(flagged: pd.DataFrame, nbim: pd.DataFrame, custody: pd.DataFrame):
+    """Event dicts (same structure as get_events) for the breaks in a detect_breaks_frame() result."""
+    breaks = flagged[flagged["IS_BREAK"]]
+    events = build_events(nbim, custody, breaks)
+    for event, diff, reasons in zip(events, breaks["NET_AMOUNT_SC_DIFF"], breaks["BREAK_REASONS"]):
+        event["NET_AMOUNT_SC_DIFF"] = None if pd.isna(diff) else float(diff)
+        event["BREAK_REASONS"] = reasons
+    return events
+
+
+def events_frame(events, nbim_columns=NBIM_COLUMNS, custody_columns=CUSTODY_COLUMNS) -> pd.DataFrame:
+    """Joined-style frame (<COL>_nbim / <COL>_custody) built from event dicts, for callers that already hold events."""
+    cols = {"match_status": []}
+    for side, key, fields in (("nbim", "nbim_rows", nbim_columns), ("custody", "custody_rows", custody_columns)):
+        for f in fields:
+            cols[f"{f}_{side}"] = [(e.get(key) or {}).get(f) for e in events]
+    for e in events:
+        nb, cu = e.get("nbim_rows"), e.get("custody_rows")
+        cols["match_status"].append("custody_only" if nb is None else "nbim_only" if cu is None else "matched")
+    return pd.DataFrame(cols)
+
+
+def detect_breaks(events, tolerances=None, currency_tolerances=None):
+    """
+    Break detection on the event dicts from get_events (or on an EventStore from get_event_store).
+    Same rules as detect_breaks_frame; events with a missing side are breaks.
+    Returns new event dicts for the breaks only; the input is not modified.
+    """
+    if not len(events):
+        return []
+
+    if isinstance(events, EventStore):
+        # Straight from the store's arrays; row dicts are built for the breaks only
+        flagged = detect_breaks_frame(events.frame(DETECTOR_COLUMNS), tolerances, currency_tolerances)
+        return to_break_events(flagged, events.nbim, events.custody)
+
+    flagged = detect_breaks_frame(events_frame(events), tolerances, currency_tolerances)
+
+    breaks = []
+    for event, diff, is_break, reasons in zip(
+        events, flagged["NET_AMOUNT_SC_DIFF"], flagged["IS_BREAK"], flagged["BREAK_REASONS"]
+    ):
+        if is_break:
+            breaks.append({**event, "NET_AMOUNT_SC_DIFF": None if pd.isna(diff) else float(diff), "BREAK_REASONS": reasons})
 
     return breaks
 
 
+def detect_breaks_streaming(nbim_path: str, custody_path: str, chunksize: int = 100_000,
+                            partitions: int = 16, tolerances=None, currency_tolerances=None):
+    """Detect breaks partition by partition from the CSV files (see data_prcessing.iter_partitions)."""
+    breaks = []
+    for nbim_part, custody_part in iter_partitions(nbim_path, custody_path, chunksize, partitions):
+        joined = join_events(nbim_part, custody_part, columns=DETECTOR_COLUMNS)
+        flagged = detect_breaks_frame(joined, tolerances, currency_tolerances)
+        breaks.extend(to_break_events(flagged, nbim_part, custody_part))
+
+    # Partitions are visited in hash order; restore the key order of the in-memory path
+    breaks.sort(key=lambda b: b["key_tuple"])
+    return breaks
@@ -0,0 +1,232 @@
+import math
+import heapq
+import itertools
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+# Deterministic priority scoring for classified breaks.
+# score = weighted sum of cash impact, classification severity, confidence and days past PAY_DATE, each in [0, 1].
+
+WEIGHTS = {
+    "cash": 0.55,
+    "classification": 0.2,
+    "confidence": 0.1,
+    "overdue": 0.15,
+}
+
+CLASSIFICATION_SEVERITY = {
+    "MISSING_RECORD": 1.0,
+    "DUPLICATE_OR_PARTIAL": 0.9,
+    "QUANTITY_OR_LENDING_MISMATCH": 0.8,
+    "AMOUNT_MISMATCH_RATE": 0.8,
+    "AMOUNT_MISMATCH_TAX": 0.7,
+    "OTHER": 0.6,
+    "DATE_MISMATCH": 0.3,
+}
+
+PAY_DATE_FORMAT = "%d.%m.%Y"
+CASH_SCALE = 7.0  # log10 of the cash difference that maps to a full cash score (10M)
+OVERDUE_DAYS = 30  # days past PAY_DATE that map to a full overdue score
+
+
+def event_key_of(record) -> str:
+    if record.get("event_key"):
+        return str(record["event_key"])
+    return f"{record.get('COAC_EVENT_KEY')}|{record.get('BANK_ACCOUNT')}"
+
+
+def _pay_date(brk) -> str:
+    """Custody PAY_DATE, else the NBIM PAYMENT_DATE, of a break from detect_breaks."""
+    if not brk:
+        return None
+    cu, nb = brk.get("custody_rows") or {}, brk.get("nbim_rows") or {}
+    return cu.get("PAY_DATE") or nb.get("PAYMENT_DATE")
+
+
+def score_arrays(diff, currency, labels, confidence, pay_dates, today=None, weights=None, fx_to_base=None):
+    """Vectorized scores plus the overdue days used in the reasons."""
+    weights = {**WEIGHTS, **(weights or {})}
+    fx_to_base = fx_to_base or {}
+    today = pd.Timestamp(today or date.today())
+
+    diff = np.abs(pd.to_numeric(pd.Series(diff, dtype=object), errors="coerce").fillna(0).to_numpy(dtype=float))
+    fx = np.array([fx_to_base.get(c, 1.0) for c in currency], dtype=float)
+    cash = np.minimum(1.0, np.log10(1.0 + diff * fx) / CASH_SCALE)
+
+    severity = np.array([CLASSIFICATION_SEVERITY.get(l, CLASSIFICATION_SEVERITY["OTHER"]) for l in labels])
+    conf = np.clip(pd.to_numeric(pd.Series(confidence, dtype=object), errors="coerce").fillna(0).to_numpy(dtype=float), 0, 1)
+
+    paid = pd.to_datetime(pd.Series(pay_dates, dtype=object), format=PAY_DATE_FORMAT, errors="coerce")
+    days = (today - paid).dt.days.fillna(0).clip(lower=0).to_numpy(dtype=float)
+    overdue = np.minimum(1.0, days / OVERDUE_DAYS)
+
+    score = (
+        weights["cash"] * cash
+        + weights["classification"] * severity
+        + weights["confidence"] * conf
+        + weights["overdue"] * overdue
+    )
+    return score, days
+
+
+def _today(today=None) -> datetime:
+    return pd.Timestamp(today or date.today()).to_pydatetime()
+
+
+def score_one(diff, currency, label, confidence, pay_date, today: datetime, weights=None, fx_to_base=None):
+    """Scalar score_arrays for one break (no pandas per call); `today` as returned by _today()."""
+    weights = {**WEIGHTS, **(weights or {})}
+    fx = (fx_to_base or {}).get(currency, 1.0)
+    cash = min(1.0, math.log10(1.0 + abs(_as_float(diff) or 0.0) * fx) / CASH_SCALE)
+    severity = CLASSIFICATION_SEVERITY.get(label, CLASSIFICATION_SEVERITY["OTHER"])
+    conf = min(1.0, max(0.0, _as_float(confidence) or 0.0))
+
+    try:
+        days = float(max(0, (today - datetime.strptime(pay_date, PAY_DATE_FORMAT)).days))
+    except (TypeError, ValueError):
+        days = 0.0
+    overdue = min(1.0, days / OVERDUE_DAYS)
+
+    score = (
+        weights["cash"] * cash
+        + weights["classification"] * severity
+        + weights["confidence"] * conf
+        + weights["overdue"] * overdue
+    )
+    return score, days
+
+
+def _inputs(records, breaks_by_key):
+    keys = [event_key_of(r) for r in records]
+    return (
+        keys,
+        [r.get("NET_AMOUNT_SC_DIFF") for r in records],
+        [r.get("SETTLEMENT_CURRENCY") for r in records],
+        [r.get("classification") for r in records],
+        [r.get("confidence") for r in records],
+        [_pay_date(breaks_by_key.get(k)) for k in keys],
+    )
+
+
+def _as_float(value):
+    """float(value), or None when it is missing or not numeric (as score_arrays coerces it)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _reason(record, days) -> str:
+    diff = record.get("NET_AMOUNT_SC_DIFF")
+    cash = f"{record.get('SETTLEMENT_CURRENCY') or ''} {diff:,.0f}".strip() if isinstance(diff, (int, float)) else "unknown"
+    parts = [f"{cash} cash gap", f"{record.get('classification') or 'unclassified'}"]
+    confidence = _as_float(record.get("confidence"))
+    if confidence is not None:
+        parts[-1] += f" (confidence {confidence:.2f})"
+    if days > 0:
+        parts.append(f"{int(days)} days past pay date")
+    return "; ".join(parts) + "."
+
+
+def _entry(record, priority, score, days):
+    return {
+        "COAC_EVENT_KEY": record.get("COAC_EVENT_KEY"),
+        "BANK_ACCOUNT": record.get("BANK_ACCOUNT"),
+        "priority": priority,
+        "reason": _reason(record, days),
+        "score": round(float(score), 4),
+    }
+
+
+def rank_breaks(classified, breaks=None, top_k=None, today=None, weights=None, fx_to_base=None):
+    """
+    Rank classified breaks by score (highest first) and return the prioritizer output shape:
+    {"reconciliation_breaks": [{COAC_EVENT_KEY, BANK_ACCOUNT, priority, reason, score}, ...]}.
+    `breaks` (from detect_breaks) supplies PAY_DATE; with top_k only the best k are returned (heap select).
+    Equal scores are ordered by event_key, so the ranking does not depend on the input order.
+    """
+    breaks_by_key = {b["event_key"]: b for b in (breaks or [])}
+    keys, diff, ccy, labels, conf, pay = _inputs(classified, breaks_by_key)
+    scores, days = score_arrays(diff, ccy, labels, conf, pay, today, weights, fx_to_base)
+
+    def order_key(i):
+        return -scores[i], keys[i]
+
+    if top_k is not None and top_k < len(classified):
+        order = heapq.nsmallest(top_k, range(len(classified)), key=order_key)
+    else:
+        order = sorted(range(len(classified)), key=order_key)
+
+    return {
+        "reconciliation_breaks": [
+            _entry(classified[i], rank, scores[i], days[i]) for rank, i in enumerate(order, start=1)
+        ]
+    }
+
+
+class BreakRanker:
+    """
+    Incremental ranking: add or re-score breaks as they arrive and read the current top-K at any time.
+    Uses a max-heap with lazy invalidation of re-scored / removed entries. Equal scores are ordered
+    by event_key, as in rank_breaks, whatever the arrival order.
+    """
+
+    def __init__(self, today=None, weights=None, fx_to_base=None):
+        self.today = _today(today)
+        self.weights = weights
+        self.fx_to_base = fx_to_base
+        self._live = {}  # event_key -> (score, seq, record, days)
+        self._heap = []  # (-score, event_key, seq)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, record, brk=None) -> float:
+        """Insert or re-score one classified break (brk: the detected break, for PAY_DATE)."""
+        key = event_key_of(record)
+        score, days = score_one(
+            record.get("NET_AMOUNT_SC_DIFF"), record.get("SETTLEMENT_CURRENCY"),
+            record.get("classification"), record.get("confidence"), _pay_date(brk),
+            self.today, self.weights, self.fx_to_base,
+        )
+        seq = next(self._seq)
+        self._live[key] = (score, seq, record, days)
+        heapq.heappush(self._heap, (-score, key, seq))
+        self._compact()
+        return score
+
+    def remove(self, event_key: str):
+        self._live.pop(event_key, None)
+        self._compact()
+
+    def _valid(self, item) -> bool:
+        live = self._live.get(item[1])
+        return live is not None and live[1] == item[2]
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [item for item in self._heap if self._valid(item)]
+            heapq.heapify(self._heap)
+
+    def top(self, k: int):
+        """Current best k as (score, record) pairs, highest first."""
+        taken = []
+        while self._heap and len(taken) < k:
+            item = heapq.heappop(self._heap)
+            if self._valid(item):
+                taken.append(item)
+        for item in taken:
+            heapq.heappush(self._heap, item)
+        return [(self._live[key][0], self._live[key][2]) for _, key, _ in taken]
+
+    def ranked(self, top_k=None):
+        """Prioritizer output shape for the current state (all breaks, or the best top_k)."""
+        k = len(self._live) if top_k is None else top_k
+        out = []
+        for rank, (_, record) in enumerate(self.top(k), start=1):
+            score, _, _, days = self._live[event_key_of(record)]
+            out.append(_entry(record, rank, score, days))
+        return {"reconciliation_breaks": out}
@@ -0,0 +1,166 @@
+import os
+from bisect import bisect_left
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional
+
+# --- Candidate counterparts for orphan records ---
+# A key booked on one side only is often the same dividend booked under another COAC_EVENT_KEY or
+# bank account on the other side. The orphans of each side are indexed by ISIN and SEDOL; every
+# bucket is sorted by (pay day, net amount), so a lookup is a hash probe plus a bisect into the
+# pay-date window. The ranked candidates are attached to the break before classification.
+
+# Pay date field per side (after normalize_columns)
+PAY_DATE_FIELDS = {"nbim": "PAYMENT_DATE", "custody": "PAY_DATE"}
+
+# Candidates must pay within this many days and within this relative net amount difference
+CANDIDATE_MAX_DAYS = 5
+CANDIDATE_AMOUNT_TOLERANCE = 0.2
+CANDIDATE_LIMIT = 3
+
+_DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d/%m/%Y")
+
+
+def _day(value) -> Optional[int]:
+    """Ordinal day of a booking date (dd.mm.yyyy as in the exports, or ISO); None when unparseable."""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).toordinal()
+        except ValueError:
+            continue
+    return None
+
+
+def _amount(row: Dict[str, Any]) -> Optional[float]:
+    try:
+        value = float(row.get("NET_AMOUNT_SC"))
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
+def _identifiers(row: Dict[str, Any]):
+    for field in ("ISIN", "SEDOL"):
+        value = row.get(field)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)  # numeric SEDOLs read as float where the column has gaps
+        if value is not None and str(value).strip():
+            yield field, str(value).strip()
+
+
+class CandidateIndex:
+    """
+    Orphan booking rows of one side, bucketed by ISIN / SEDOL and sorted by (pay day, net amount).
+    entries: dicts with the event_key and the booking row (plus the break, when built from breaks).
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]], side: str):
+        self.side = side
+        self.entries = entries
+        self._buckets: Dict[tuple, List[tuple]] = {}
+        self._amounts = [_amount(entry["row"]) for entry in entries]
+        date_field = PAY_DATE_FIELDS[side]
+        for i, entry in enumerate(entries):
+            row = entry["row"]
+            day, amount = _day(row.get(date_field)), self._amounts[i]
+            if day is None:
+                continue
+            for ident in _identifiers(row):
+                self._buckets.setdefault(ident, []).append((day, amount if amount is not None else 0.0, i))
+        for bucket in self._buckets.values():
+            bucket.sort()
+
+    @classmethod
+    def from_breaks(cls, breaks: List[Dict[str, Any]], side: str) -> "CandidateIndex":
+        """Index the rows of the breaks that exist on `side` only."""
+        rows_key = f"{side}_rows"
+        other = "custody_rows" if side == "nbim" else "nbim_rows"
+        entries = [
+            {"event_key": b["event_key"], "row": b[rows_key], "break": b}
+            for b in breaks
+            if b.get(rows_key) is not None and b.get(other) is None
+        ]
+        return cls(entries, side)
+
+    def candidates(self, row: Dict[str, Any], date_field: str, max_days: int = CANDIDATE_MAX_DAYS,
+                   amount_tolerance: float = CANDIDATE_AMOUNT_TOLERANCE, limit: int = CANDIDATE_LIMIT):
+        """
+        Ranked counterparts for an orphan row of the other side: same ISIN or SEDOL, pay date within
+        max_days and net amount within amount_tolerance (relative); best (lowest score) first.
+        When either net amount is missing the amount cannot be checked: such candidates rank after
+        every amount-checked one.
+        """
+        day, amount = _day(row.get(date_field)), _amount(row)
+        if day is None:
+            return []
+        currency = row.get("CURRENCY_SC")
+
+        found: Dict[int, tuple] = {}
+        for ident in _identifiers(row):
+            bucket = self._buckets.get(ident)
+            if not bucket:
+                continue
+            for j in range(bisect_left(bucket, (day - max_days,)), len(bucket)):
+                other_day, _, i = bucket[j]
+                if other_day > day + max_days:
+                    break
+                candidate = self.entries[i]["row"]
+                if currency and candidate.get("CURRENCY_SC") and candidate.get("CURRENCY_SC") != currency:
+                    continue
+                other_amount = self._amounts[i]
+                unchecked = amount is None or other_amount is None
+                if unchecked:
+                    amount_gap = 1.0
+                else:
+                    scale = max(abs(amount), abs(other_amount), 1e-9)
+                    amount_gap = abs(amount - other_amount) / scale
+                    if amount_gap > amount_tolerance:
+                        continue
+                score = abs(other_day - day) / (max_days + 1) + amount_gap
+                if i not in found or score < found[i][1]:
+                    found[i] = (unchecked, score, ident[0])
+
+        ranked = sorted(found.items(), key=lambda item: (*item[1][:2], self.entries[item[0]]["event_key"]))[:limit]
+        out = []
+        for i, (_, score, matched_on) in ranked:
+            candidate = self.entries[i]["row"]
+            out.append({
+                "event_key": self.entries[i]["event_key"],
+                "COAC_EVENT_KEY": candidate.get("COAC_EVENT_KEY"),
+                "BANK_ACCOUNT": candidate.get("BANK_ACCOUNT"),
+                "matched_on": matched_on,
+                "PAY_DATE": candidate.get(PAY_DATE_FIELDS[self.side]),
+                "NET_AMOUNT_SC": candidate.get("NET_AMOUNT_SC"),
+                "CURRENCY_SC": candidate.get("CURRENCY_SC"),
+                "score": round(score, 4),
+            })
+        return out
+
+
+def attach_candidates(breaks: List[Dict[str, Any]], max_days: int = None, amount_tolerance: float = None,
+                      limit: int = None) -> int:
+    """
+    Add `candidate_matches` (ranked counterparts on the other side) to every orphan break that has any.
+    Limits default to CANDIDATE_MAX_DAYS / CANDIDATE_AMOUNT_TOLERANCE / CANDIDATE_LIMIT, overridable
+    via the environment. Returns the number of orphans with candidates.
+    """
+    max_days = max_days if max_days is not None else int(os.getenv("CANDIDATE_MAX_DAYS") or CANDIDATE_MAX_DAYS)
+    amount_tolerance = amount_tolerance if amount_tolerance is not None else float(
+        os.getenv("CANDIDATE_AMOUNT_TOLERANCE") or CANDIDATE_AMOUNT_TOLERANCE)
+    limit = limit if limit is not None else int(os.getenv("CANDIDATE_LIMIT") or CANDIDATE_LIMIT)
+
+    indexes = {side: CandidateIndex.from_breaks(breaks, side) for side in PAY_DATE_FIELDS}
+    matched = 0
+    for side, other in (("nbim", "custody"), ("custody", "nbim")):
+        if not indexes[other].entries:
+            continue
+        for entry in indexes[side].entries:
+            found = indexes[other].candidates(entry["row"], PAY_DATE_FIELDS[side], max_days, amount_tolerance, limit)
+            if found:
+                entry["break"]["candidate_matches"] = found
+                matched += 1
+    return matched
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+from report_writers import iter_jsonl
+
+# --- Crash-safe stage checkpoints ---
+# Each finished unit of work of a long stage (a classification, a drafted ticket) is appended to a
+# JSON Lines file keyed by event_key, flushed and fsynced before the stage moves on. A crash loses at
+# most the line being written (iter_jsonl skips a truncated last line). With resume, the records
+# are read back and reused for breaks whose content is unchanged (same digest), so only the
+# remaining work is redone.
+
+CHECKPOINT_DIR = "cache/checkpoints"
+
+
+def break_digest(b: Dict[str, Any]) -> str:
+    """Digest of a break's content; a checkpointed result is only reused for the same break."""
+    payload = json.dumps(b, ensure_ascii=False, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """
+    Append-only, fsynced event_key -> result store of one stage (`<dir>/<stage>.jsonl`).
+    resume=False starts empty (the previous file is truncated); resume=True loads the finished records.
+    """
+
+    def __init__(self, stage: str, resume: bool = False, directory: str = None):
+        directory = directory or os.getenv("CHECKPOINT_DIR") or CHECKPOINT_DIR
+        self.path = os.path.join(directory, f"{stage}.jsonl")
+        self._lock = threading.Lock()
+        self.done: Dict[str, Dict[str, Any]] = {}
+        if resume and os.path.exists(self.path):
+            for record in iter_jsonl(self.path):
+                self.done[record["event_key"]] = record
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        # Rewrite the kept records (atomically) so a torn last line never ends up between two valid ones
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in self.done.values():
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def get(self, event_key: str, digest: str = None) -> Optional[Any]:
+        """The checkpointed result for event_key, or None (also when the break changed since)."""
+        record = self.done.get(event_key)
+        if record is None or (digest is not None and record.get("digest") != digest):
+            return None
+        return record["result"]
+
+    def put(self, event_key: str, result: Any, digest: str = None):
+        record = {"event_key": event_key, "digest": digest, "result": result}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self.done[event_key] = record
+            self._f.write(line)
+            self._sync()
+
+    def close(self, remove: bool = False):
+        """Close the file; remove=True deletes it (the stage finished, nothing left to resume)."""
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+            if remove and os.path.exists(self.path):
+                os.remove(self.path)
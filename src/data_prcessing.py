@@ -1,106 +1,500 @@
+import os
+import tempfile
+from collections.abc import Mapping
 import pandas as pd
-import math
+import numpy as np
 
 #methods for csv loading and normalizing column names
 
-def load_csv(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path, sep=";")
+# Bump whenever the column maps or schemas below change (invalidates cached normalized inputs)
+MAPPING_VERSION = "2"
+
+NBIM_COLUMN_MAP = {
+    "EXDATE": "EX_DATE",
+    "QUOTATION_CURRENCY": "CURRENCY_QC",
+    "SETTLEMENT_CURRENCY": "CURRENCY_SC",
+    "AVG_FX_RATE_QUOTATION_TO_PORTFOLIO": "FX_RATE",
+    "TOTAL_TAX_RATE": "TAX_RATE",
+    "GROSS_AMOUNT_QUOTATION": "GROSS_AMOUNT_QC",
+    "NET_AMOUNT_QUOTATION": "NET_AMOUNT_QC",
+    "NET_AMOUNT_SETTLEMENT": "NET_AMOUNT_SC",
+    "DIVIDENDS_PER_SHARE": "DIV_RATE",
+}
+
+CUSTODY_COLUMN_MAP = {
+    "CURRENCIES": "CURRENCY_QC",
+    "SETTLED_CURRENCY": "CURRENCY_SC",
+    "FX_RATE": "FX_RATE",
+    "TAX_RATE": "TAX_RATE",
+    "GROSS_AMOUNT": "GROSS_AMOUNT_QC",
+    "NET_AMOUNT_SETTLED": "NET_AMOUNT_SC",
+    "DIV_RATE": "DIV_RATE",
+    "BANK_ACCOUNTS": "BANK_ACCOUNT",
+}
+
+# Explicit dtypes for the raw (pre-normalization) columns, used by every reader (in-memory, streaming,
+# sharded) so that values, payloads and fingerprints do not depend on the loading mode.
+# Columns not listed here are inferred (per chunk when streaming).
+_ID = "Int64"
+_NUM = "float64"
+_STR = "str"
+
+NBIM_SCHEMA = {
+    "COAC_EVENT_KEY": _ID, "INSTRUMENT_DESCRIPTION": _STR, "ISIN": _STR, "SEDOL": _STR, "TICKER": _STR,
+    "ORGANISATION_NAME": _STR, "DIVIDENDS_PER_SHARE": _NUM, "EXDATE": _STR, "PAYMENT_DATE": _STR,
+    "CUSTODIAN": _STR, "BANK_ACCOUNT": _ID, "QUOTATION_CURRENCY": _STR, "SETTLEMENT_CURRENCY": _STR,
+    "AVG_FX_RATE_QUOTATION_TO_PORTFOLIO": _NUM, "NOMINAL_BASIS": _NUM, "GROSS_AMOUNT_QUOTATION": _NUM,
+    "NET_AMOUNT_QUOTATION": _NUM, "NET_AMOUNT_SETTLEMENT": _NUM, "GROSS_AMOUNT_PORTFOLIO": _NUM,
+    "NET_AMOUNT_PORTFOLIO": _NUM, "WTHTAX_COST_QUOTATION": _NUM, "WTHTAX_COST_SETTLEMENT": _NUM,
+    "WTHTAX_COST_PORTFOLIO": _NUM, "WTHTAX_RATE": _NUM, "LOCALTAX_COST_QUOTATION": _NUM,
+    "LOCALTAX_COST_SETTLEMENT": _NUM, "TOTAL_TAX_RATE": _NUM, "EXRESPRDIV_COST_QUOTATION": _NUM,
+    "EXRESPRDIV_COST_SETTLEMENT": _NUM, "RESTITUTION_RATE": _NUM,
+}
+
+CUSTODY_SCHEMA = {
+    "COAC_EVENT_KEY": _ID, "ISIN": _STR, "EVENT_EX_DATE": _STR, "EVENT_PAYMENT_DATE": _STR, "CUSTODY": _ID,
+    "SEDOL": _STR, "CUSTODIAN": _STR, "EVENT_TYPE": _STR, "NOMINAL_BASIS": _NUM, "LOAN_QUANTITY": _NUM,
+    "HOLDING_QUANTITY": _NUM, "LENDING_PERCENTAGE": _NUM, "BANK_ACCOUNTS": _ID, "EX_DATE": _STR,
+    "RECORD_DATE": _STR, "PAY_DATE": _STR, "CURRENCIES": _STR, "DIV_RATE": _NUM, "TAX_RATE": _NUM,
+    "GROSS_AMOUNT": _NUM, "NET_AMOUNT_QC": _NUM, "TAX": _NUM, "NET_AMOUNT_SC": _NUM, "SETTLED_CURRENCY": _STR,
+    "IS_CROSS_CURRENCY_REVERSAL": "boolean", "FX_RATE": _NUM, "POSSIBLE_RESTITUTION_PAYMENT": _NUM,
+    "POSSIBLE_RESTITUTION_AMOUNT": _NUM, "ADR_FEE": _NUM, "ADR_FEE_RATE": _NUM,
+}
+
+
+# Both files share the overlapping columns' dtypes, so one lookup serves either side
+BOOKING_SCHEMA = {**NBIM_SCHEMA, **CUSTODY_SCHEMA}
+
+
+def schema_dtypes(columns, schema=BOOKING_SCHEMA):
+    """The schema's dtypes for the columns present in a file."""
+    return {c: t for c, t in schema.items() if c in columns}
+
+
+def load_csv(path: str, dtype=None) -> pd.DataFrame:
+    if dtype is None:
+        dtype = schema_dtypes(pd.read_csv(path, sep=";", nrows=0).columns)
+    df = pd.read_csv(path, sep=";", dtype=dtype)
     return df
 
 def normalize_columns(nbim, custody):
-    nbim_map = {
-        "EXDATE": "EX_DATE",
-        "QUOTATION_CURRENCY": "CURRENCY_QC",
-        "SETTLEMENT_CURRENCY": "CURRENCY_SC",
-        "AVG_FX_RATE_QUOTATION_TO_PORTFOLIO": "FX_RATE",
-        "TOTAL_TAX_RATE": "TAX_RATE",
-        "GROSS_AMOUNT_QUOTATION": "GROSS_AMOUNT_QC",
-        "GROSS_AMOUNT_QUOTATION": "GROSS_AMOUNT_QC",
-        "NET_AMOUNT_QUOTATION": "NET_AMOUNT_QC",
-        "NET_AMOUNT_SETTLEMENT": "NET_AMOUNT_SC",
-        "DIVIDENDS_PER_SHARE": "DIV_RATE",
-    }
-
-    custody_map = {
-        "CURRENCIES": "CURRENCY_QC",
-        "SETTLED_CURRENCY": "CURRENCY_SC",
-        "FX_RATE": "FX_RATE",
-        "TAX_RATE": "TAX_RATE",
-        "GROSS_AMOUNT": "GROSS_AMOUNT_QC",
-        "NET_AMOUNT_SETTLED": "NET_AMOUNT_SC",
-        "DIV_RATE": "DIV_RATE",
-        "BANK_ACCOUNTS": "BANK_ACCOUNT",
-    }
-
-    nbim = nbim.rename(columns=nbim_map)
-    custody = custody.rename(columns=custody_map)
+    nbim = nbim.rename(columns=NBIM_COLUMN_MAP)
+    custody = custody.rename(columns=CUSTODY_COLUMN_MAP)
     return nbim, custody
 
 
-def get_all_keys(nbim: pd.DataFrame, custody: pd.DataFrame):
+# --- Join-based event building ---
+
+KEY_COLS = ["COAC_EVENT_KEY", "BANK_ACCOUNT"]
+
+MATCH_STATUS = {
+    "both": "matched",
+    "left_only": "nbim_only",
+    "right_only": "custody_only",
+}
+
+# Cash / amount columns (either side) that add up when a key is booked on several rows
+# (split or partial payments, restitution top-ups, duplicates); other fields come from the first row.
+AMOUNT_COLUMNS = [
+    "GROSS_AMOUNT_QC", "NET_AMOUNT_QC", "NET_AMOUNT_SC", "GROSS_AMOUNT_PORTFOLIO", "NET_AMOUNT_PORTFOLIO",
+    "WTHTAX_COST_QUOTATION", "WTHTAX_COST_SETTLEMENT", "WTHTAX_COST_PORTFOLIO", "LOCALTAX_COST_QUOTATION",
+    "LOCALTAX_COST_SETTLEMENT", "EXRESPRDIV_COST_QUOTATION", "EXRESPRDIV_COST_SETTLEMENT", "TAX",
+    "POSSIBLE_RESTITUTION_AMOUNT", "ADR_FEE",
+]
+
+# Per-key fields added to the row dict of a key booked on several rows
+ROW_COUNT = "ROW_COUNT"
+DUPLICATE_ROWS = "DUPLICATE_ROWS"
+NET_AMOUNT_SC_UNIQUE = "NET_AMOUNT_SC_UNIQUE"
+
+
+def _key_frame(df: pd.DataFrame, key_cols):
     """
-    Find all unique combinations of COAC_EVENT_KEY and BANK_ACCOUNTS across both datasets.
-    Returns (key_columns, combined_keys).
+    One row per key: key columns as strings, the positional id of the key's first row (_row)
+    and its number of rows (_rows). Rows with a missing key part are dropped.
     """
-    # Define key columns we care about
-    key_cols = ["COAC_EVENT_KEY", "BANK_ACCOUNT"]
+    if not all(k in df.columns for k in key_cols):
+        return pd.DataFrame({
+            **{k: pd.Series(dtype=str) for k in key_cols},
+            "_row": pd.Series(dtype="int64"), "_rows": pd.Series(dtype="int64"),
+        })
 
-    # Build combined key tuples
-    def make_keys(df: pd.DataFrame):
-        if not key_cols:
-            return set()
-        cols = [c for c in key_cols if c in df.columns]
-        if not cols:
-            return set()
-        tmp = df[cols].dropna().astype(str)
-        return set(tuple(x) for x in tmp.itertuples(index=False, name=None))
+    keys = df[key_cols]
+    keep = keys.notna().all(axis=1).to_numpy()
+    out = keys[keep].astype(str)
+    out["_row"] = np.flatnonzero(keep)
+    out["_rows"] = 1
+    multi = out.duplicated(subset=key_cols, keep=False).to_numpy()
+    if multi.any():
+        # Only keys booked on several rows pay for the group-by
+        counts = out[multi].groupby(key_cols, sort=False)["_row"].transform("size")
+        out.loc[multi, "_rows"] = counts.to_numpy()
+    return out.drop_duplicates(subset=key_cols, keep="first")
 
-    nb_keys = make_keys(nbim)
-    cu_keys = make_keys(custody)
 
-    combined = sorted(nb_keys | cu_keys)
-    return key_cols, combined
+def group_totals(df: pd.DataFrame, first_rows, key_cols=KEY_COLS) -> pd.DataFrame:
+    """
+    Aggregates of the keys whose first row is at the positions `first_rows` (keys booked on several
+    rows), indexed by that position, computed in one group-by over just those keys' rows:
+    summed AMOUNT_COLUMNS, ROW_COUNT, DUPLICATE_ROWS (rows identical to an earlier row of the key,
+    found by row hash), NET_AMOUNT_SC_UNIQUE (net without the duplicates) and _positions (all row
+    positions of the key, for building the per-row detail lazily).
+    """
+    first_rows = np.asarray(first_rows, dtype="int64")
+    amounts = [c for c in AMOUNT_COLUMNS if c in df.columns]
+    if not len(first_rows):
+        return pd.DataFrame(columns=amounts + [ROW_COUNT, DUPLICATE_ROWS, NET_AMOUNT_SC_UNIQUE, "_positions"])
 
+    # Candidate rows share the first key part; the exact key match is a small join
+    first = df.iloc[first_rows][key_cols].astype(str)
+    first["_first"] = first_rows
+    candidates = np.flatnonzero(df[key_cols[0]].isin(df[key_cols[0]].iloc[first_rows]).to_numpy())
+    members = df.iloc[candidates][key_cols].astype(str)
+    members["_pos"] = candidates
+    members = members.merge(first, on=key_cols).sort_values("_pos", kind="stable")
 
-def rows_for_key(df: pd.DataFrame, key_cols, key_tuple):
+    rows = df.iloc[members["_pos"].to_numpy()]
+    owner = members["_first"].to_numpy()
+    hashes = pd.util.hash_pandas_object(rows[sorted(rows.columns)], index=False).to_numpy()
+    duplicate = pd.DataFrame({"owner": owner, "hash": hashes}).duplicated().to_numpy()
+
+    values = rows[amounts].apply(pd.to_numeric, errors="coerce").reset_index(drop=True)
+    grouped = values.groupby(owner)
+    totals = grouped.sum(min_count=1)
+    totals[ROW_COUNT] = grouped.size()
+    totals[DUPLICATE_ROWS] = pd.Series(duplicate.astype("int64")).groupby(owner).sum()
+    if "NET_AMOUNT_SC" in amounts:
+        unique = values["NET_AMOUNT_SC"][~duplicate]
+        totals[NET_AMOUNT_SC_UNIQUE] = unique.groupby(owner[~duplicate]).sum(min_count=1)
+    else:
+        totals[NET_AMOUNT_SC_UNIQUE] = np.nan
+    totals["_positions"] = pd.Series(members["_pos"].to_numpy()).groupby(owner).agg(list)
+    return totals
+
+
+def join_keys(nbim: pd.DataFrame, custody: pd.DataFrame, key_cols=KEY_COLS):
     """
-    Get rows matching a composite key (e.g., (COAC_EVENT_KEY, BANK_ACCOUNTS)).
-    Returns list of row dicts.
+    Match NBIM and custody rows on (COAC_EVENT_KEY, BANK_ACCOUNT) in one hash join.
+    Returns one row per key with the first row position and the row count on each side
+    (_row_* / _rows_*, NaN when missing) and a match_status of matched / nbim_only / custody_only,
+    sorted by key.
     """
-    if not all(k in df.columns for k in key_cols):
-        return []
+    joined = pd.merge(
+        _key_frame(nbim, key_cols),
+        _key_frame(custody, key_cols),
+        on=key_cols,
+        how="outer",
+        suffixes=("_nbim", "_custody"),
+        indicator="match_status",
+    )
+    joined["match_status"] = joined["match_status"].astype(str).map(MATCH_STATUS)
+    return joined.sort_values(key_cols, kind="stable").reset_index(drop=True)
 
-    # Build boolean mask for all key columns
-    mask = pd.Series(True, index=df.index)
-    for col, val in zip(key_cols, key_tuple):
-        mask &= df[col].astype(str) == str(val)
 
-    sub = df[mask]
-    recs = []
-    for _, row in sub.iterrows():
-        d = {c: (None if isinstance(v, float) and math.isnan(v) else v)
-             for c, v in row.items()}
-        recs.append(d)
-    return recs
+def to_records(df: pd.DataFrame):
+    """Row dicts with NaN converted to None (JSON-safe)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
 
-def get_events(nbim, custody):
-    events = []
-    key_cols, keys = get_all_keys(nbim, custody)
-    for key_tuple in keys:
-        nb_rows = rows_for_key(nbim, key_cols, key_tuple)
-        cu_rows = rows_for_key(custody, key_cols, key_tuple)
 
-        # Convert from list → dict
-        nb_row = nb_rows[0] if nb_rows else None
-        cu_row = cu_rows[0] if cu_rows else None
+def _multi_rows(keys: pd.DataFrame, side: str) -> np.ndarray:
+    """First-row positions of the keys booked on several rows of one side."""
+    if f"_rows_{side}" not in keys.columns:
+        return np.array([], dtype="int64")
+    counts = keys[f"_rows_{side}"].to_numpy(dtype=float)
+    return keys[f"_row_{side}"].to_numpy(dtype=float)[counts > 1].astype("int64")
+
+
+def _side_records(df: pd.DataFrame, keys: pd.DataFrame, side: str, key_cols):
+    """
+    position -> row dict for the rows a join_keys() frame references on one side. Keys booked on
+    several rows get their summed amounts, ROW_COUNT, DUPLICATE_ROWS and NET_AMOUNT_SC_UNIQUE,
+    and position -> list of the individual row dicts (built only for those keys).
+    """
+    pos = keys[f"_row_{side}"].to_numpy()
+    take = pos[~pd.isna(pos)].astype("int64")
+    recs = dict(zip(take, to_records(df.iloc[take])))
+
+    details = {}
+    totals = group_totals(df, _multi_rows(keys, side), key_cols)
+    if len(totals):
+        fields = [c for c in totals.columns if c != "_positions"]
+        # One conversion for all detail rows, then split per key
+        detail = iter(to_records(df.iloc[np.concatenate(totals["_positions"].to_list())]))
+        for first, agg, positions in zip(totals.index, to_records(totals[fields]), totals["_positions"]):
+            recs[first] = {**recs[first], **agg}
+            details[first] = [next(detail) for _ in positions]
+    return recs, details
+
+
+def build_events(nbim: pd.DataFrame, custody: pd.DataFrame, keys: pd.DataFrame, key_cols=KEY_COLS):
+    """
+    Build event dicts for the keys in a join_keys() frame (or a subset of it).
+    nbim_rows / custody_rows hold one row per side; for keys booked on several rows that row carries
+    the summed amounts and the individual rows are listed under nbim_detail / custody_detail.
+    """
+    nb_pos = keys["_row_nbim"].to_numpy()
+    cu_pos = keys["_row_custody"].to_numpy()
+
+    # Only materialize the rows that are actually referenced
+    nb_recs, nb_details = _side_records(nbim, keys, "nbim", key_cols)
+    cu_recs, cu_details = _side_records(custody, keys, "custody", key_cols)
+
+    events = []
+    key_values = keys[key_cols].itertuples(index=False, name=None)
+    for key_tuple, nb_i, cu_i, status in zip(key_values, nb_pos, cu_pos, keys["match_status"]):
+        nb_row = None if pd.isna(nb_i) else nb_recs[int(nb_i)]
+        cu_row = None if pd.isna(cu_i) else cu_recs[int(cu_i)]
 
         # Create a readable label: coac_key|bank_account
         key_label = "|".join(str(v) for v in key_tuple)
 
-        events.append({
+        event = {
             "event_key": key_label,
             "key_tuple": key_tuple,
+            "match_status": status,
             "nbim_rows": nb_row,
             "custody_rows": cu_row,
-        })
+        }
+        if not pd.isna(nb_i) and int(nb_i) in nb_details:
+            event["nbim_detail"] = nb_details[int(nb_i)]
+        if not pd.isna(cu_i) and int(cu_i) in cu_details:
+            event["custody_detail"] = cu_details[int(cu_i)]
+        events.append(event)
     return events
+
+
+class EventView(Mapping):
+    """
+    Read-only view of one event in an EventStore, a Mapping with the build_events keys. The key
+    fields come straight from the store's arrays; the first access to any other field builds the
+    event dict (nbim_rows / custody_rows and the *_detail lists) once and keeps it.
+    """
+
+    __slots__ = ("store", "id", "_event")
+
+    def __init__(self, store: "EventStore", id: int):
+        self.store = store
+        self.id = id
+        self._event = None
+
+    def __getitem__(self, name):
+        if name == "event_key":
+            return "|".join(str(v) for v in self.store.key_tuple(self.id))
+        if name == "key_tuple":
+            return self.store.key_tuple(self.id)
+        if name == "match_status":
+            return self.store.match_status[self.id]
+        return self.to_dict()[name]
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def to_dict(self):
+        """The full event dict, as built by build_events (built on first use, then cached)."""
+        if self._event is None:
+            self._event = self.store.materialize([self.id])[0]
+        return self._event
+
+    def __repr__(self):
+        return f"EventView({self['event_key']!r}, {self['match_status']})"
+
+
+class EventStore:
+    """
+    All events of a join_keys() frame, held as column arrays indexed by event id (key order):
+    the key parts, the first row position and row count per side (-1 / 0 when missing) and the
+    match status. Row dicts are only built by materialize() (e.g. for the breaks sent to the agents);
+    frame() gives the joined columns for vectorized detection.
+    """
+
+    def __init__(self, nbim: pd.DataFrame, custody: pd.DataFrame, keys: pd.DataFrame = None, key_cols=KEY_COLS):
+        self.nbim = nbim
+        self.custody = custody
+        self.key_cols = key_cols
+        self.keys = keys if keys is not None else join_keys(nbim, custody, key_cols)
+        self.key_values = [self.keys[c].to_numpy() for c in key_cols]
+        self.match_status = self.keys["match_status"].to_numpy()
+        for side in ("nbim", "custody"):
+            pos = self.keys[f"_row_{side}"].to_numpy(dtype=float)
+            rows = self.keys[f"_rows_{side}"].to_numpy(dtype=float)
+            setattr(self, f"{side}_row", np.where(np.isnan(pos), -1, pos).astype("int64"))
+            setattr(self, f"{side}_count", np.where(np.isnan(rows), 0, rows).astype("int64"))
+
+    def __len__(self):
+        return len(self.match_status)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [EventView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return EventView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield EventView(self, i)
+
+    def key_tuple(self, i: int):
+        return tuple(values[i] for values in self.key_values)
+
+    def frame(self, columns=None) -> pd.DataFrame:
+        """Joined frame of all events (same layout as join_events), without repeating the join."""
+        return _joined(self.keys, self.nbim, self.custody, columns, self.key_cols)
+
+    def materialize(self, ids=None):
+        """Event dicts (build_events structure) for the given event ids, or for all events."""
+        keys = self.keys if ids is None else self.keys.iloc[np.asarray(ids, dtype="int64")]
+        return build_events(self.nbim, self.custody, keys, self.key_cols)
+
+
+def get_events(nbim, custody):
+    return build_events(nbim, custody, join_keys(nbim, custody))
+
+
+def get_event_store(nbim, custody, key_cols=KEY_COLS):
+    """All events as an EventStore: the get_events structure without building every row dict."""
+    return EventStore(nbim, custody, key_cols=key_cols)
+
+
+def _attach_side(keys: pd.DataFrame, df: pd.DataFrame, side: str, columns=None, key_cols=KEY_COLS):
+    """
+    Columns of one side aligned to the join_keys() rows, suffixed with _<side>.
+    Amount columns of keys booked on several rows are the per-key totals.
+    """
+    cols = [c for c in (columns or df.columns) if c in df.columns]
+    pos = keys[f"_row_{side}"].to_numpy(dtype=float)
+
+    # One positional take; missing rows (-1) come back as NaN
+    pos = np.where(np.isnan(pos), -1, pos).astype("int64")
+    taken = df[cols].reset_index(drop=True).reindex(pos)
+    taken.index = keys.index
+
+    amounts = [c for c in cols if c in AMOUNT_COLUMNS]
+    multi = _multi_rows(keys, side)
+    if amounts and len(multi):
+        totals = group_totals(df, multi, key_cols)
+        at = np.flatnonzero(np.isin(pos, totals.index.to_numpy()))
+        for col in amounts:
+            taken[col] = pd.to_numeric(taken[col], errors="coerce")
+            taken.iloc[at, taken.columns.get_loc(col)] = totals[col].reindex(pos[at]).to_numpy(dtype=float)
+    return taken.add_suffix(f"_{side}")
+
+
+def join_events(nbim: pd.DataFrame, custody: pd.DataFrame, columns=None, key_cols=KEY_COLS):
+    """
+    Joined frame with one row per event key: the join_keys() columns followed by
+    every (or the requested) NBIM column suffixed _nbim and custody column suffixed _custody.
+    Keys booked on several rows contribute their summed amounts.
+    """
+    return _joined(join_keys(nbim, custody, key_cols), nbim, custody, columns, key_cols)
+
+
+def _joined(keys: pd.DataFrame, nbim: pd.DataFrame, custody: pd.DataFrame, columns=None, key_cols=KEY_COLS):
+    return pd.concat(
+        [keys, _attach_side(keys, nbim, "nbim", columns, key_cols), _attach_side(keys, custody, "custody", columns, key_cols)],
+        axis=1,
+    )
+
+
+# --- Change detection for incremental runs ---
+
+def event_labels(df: pd.DataFrame, key_cols=KEY_COLS) -> pd.Series:
+    """event_key label (coac_key|bank_account) of every row, NaN where a key part is missing."""
+    keys = df[key_cols]
+    labels = keys[key_cols[0]].astype(str)
+    for col in key_cols[1:]:
+        labels = labels + "|" + keys[col].astype(str)
+    return labels.where(keys.notna().all(axis=1).to_numpy())
+
+
+def _side_fingerprints(df: pd.DataFrame, key_cols) -> pd.Series:
+    labels = event_labels(df, key_cols)
+    keep = labels.notna().to_numpy()
+    hashes = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+    # Sum of row hashes (wrapping uint64): independent of row order within a key
+    summed = pd.Series(hashes[keep], index=labels[keep].to_numpy()).groupby(level=0).sum()
+    return summed.astype(str)
+
+
+def combine_fingerprints(nbim_fingerprints: pd.Series, custody_fingerprints: pd.Series) -> pd.Series:
+    """event_fingerprints() from the per-side fingerprints (so one side can be rehashed on its own)."""
+    both = pd.concat([nbim_fingerprints.rename("nbim"), custody_fingerprints.rename("custody")], axis=1).fillna("-")
+    return (both["nbim"] + ":" + both["custody"]).rename("fingerprint")
+
+
+def event_fingerprints(nbim: pd.DataFrame, custody: pd.DataFrame, key_cols=KEY_COLS) -> pd.Series:
+    """
+    Fingerprint per event_key of all normalized NBIM and custody rows of that key,
+    "<nbim>:<custody>" with "-" for a missing side. Any changed booking on either side changes it.
+    """
+    return combine_fingerprints(_side_fingerprints(nbim, key_cols), _side_fingerprints(custody, key_cols))
+
+
+def select_events(df: pd.DataFrame, event_keys, key_cols=KEY_COLS) -> pd.DataFrame:
+    """Rows of a side whose event_key is in event_keys."""
+    return df[event_labels(df, key_cols).isin(event_keys).to_numpy()].reset_index(drop=True)
+
+
+# --- Streaming ingestion ---
+
+def iter_csv_chunks(path: str, schema, column_map, chunksize: int = 100_000):
+    """Read a semicolon CSV in bounded chunks with an explicit schema, normalizing each chunk."""
+    dtype = schema_dtypes(pd.read_csv(path, sep=";", nrows=0).columns, schema)
+    for chunk in pd.read_csv(path, sep=";", dtype=dtype, chunksize=chunksize):
+        yield chunk.rename(columns=column_map)
+
+
+def partition_of(df: pd.DataFrame, partitions: int, key_cols=KEY_COLS) -> np.ndarray:
+    """Hash partition id per row, computed on the string form of the key (same as the join)."""
+    keys = df[key_cols].astype(str)
+    return (pd.util.hash_pandas_object(keys, index=False).to_numpy() % partitions).astype("int64")
+
+
+def partition_csv(path: str, schema, column_map, workdir: str, prefix: str,
+                  partitions: int = 16, chunksize: int = 100_000, key_cols=KEY_COLS):
+    """
+    Spill a CSV to disk hash-partitioned on the event key, one chunk at a time.
+    Returns the list of spill files per partition (in file order).
+    """
+    files = [[] for _ in range(partitions)]
+    for n, chunk in enumerate(iter_csv_chunks(path, schema, column_map, chunksize)):
+        part = partition_of(chunk, partitions, key_cols)
+        for p in np.unique(part):
+            out = os.path.join(workdir, f"{prefix}_p{p}_c{n}.pkl")
+            chunk[part == p].to_pickle(out)
+            files[p].append(out)
+    return files
+
+
+def read_partition(files, schema, column_map):
+    """One partition's spill files (from partition_csv) as a single normalized frame."""
+    if not files:
+        # Keep the normalized columns so the join still sees the key columns
+        cols = [column_map.get(c, c) for c in schema]
+        return pd.DataFrame(columns=cols)
+    return pd.concat([pd.read_pickle(f) for f in files], ignore_index=True)
+
+
+def iter_partitions(nbim_path: str, custody_path: str, chunksize: int = 100_000,
+                    partitions: int = 16, workdir: str = None, key_cols=KEY_COLS):
+    """
+    Stream both booking files into matching key partitions and yield (nbim_part, custody_part).
+    Every event key lands in exactly one partition on both sides, so each pair can be joined on
+    its own; peak memory is bounded by the chunk and partition size rather than the file size.
+    """
+    with tempfile.TemporaryDirectory(dir=workdir, prefix="recon_parts_") as tmp:
+        nb_files = partition_csv(nbim_path, NBIM_SCHEMA, NBIM_COLUMN_MAP, tmp, "nbim", partitions, chunksize, key_cols)
+        cu_files = partition_csv(custody_path, CUSTODY_SCHEMA, CUSTODY_COLUMN_MAP, tmp, "custody", partitions, chunksize, key_cols)
+
+        for p in range(partitions):
+            if not nb_files[p] and not cu_files[p]:
+                continue
+            yield (
+                read_partition(nb_files[p], NBIM_SCHEMA, NBIM_COLUMN_MAP),
+                read_partition(cu_files[p], CUSTODY_SCHEMA, CUSTODY_COLUMN_MAP),
+            )
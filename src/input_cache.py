@@ -0,0 +1,96 @@
+import os
+import hashlib
+from pathlib import Path
+import pandas as pd
+from data_prcessing import load_csv, NBIM_COLUMN_MAP, CUSTODY_COLUMN_MAP, MAPPING_VERSION
+
+# On-disk cache of the normalized NBIM / custody frames as Arrow IPC files.
+# Entries are keyed by the CSV content hash plus MAPPING_VERSION and are read back memory-mapped.
+
+CACHE_DIR = "cache/inputs"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+SIDES = {
+    "nbim": NBIM_COLUMN_MAP,
+    "custody": CUSTODY_COLUMN_MAP,
+}
+
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """sha256 of the file content, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path(cache_dir: str, side: str, csv_path: str) -> Path:
+    key = hashlib.sha256(f"{file_fingerprint(csv_path)}|{MAPPING_VERSION}".encode()).hexdigest()[:32]
+    return Path(cache_dir) / f"{side}-{key}.arrow"
+
+
+def _read_arrow(path: Path) -> pd.DataFrame:
+    import pyarrow as pa
+
+    with pa.memory_map(str(path), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def _write_arrow(df: pd.DataFrame, path: Path):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = path.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)  # atomic: readers never see a half-written snapshot
+
+
+def evict(cache_dir: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES, keep=()):
+    """Delete the least recently used snapshots until the cache fits in max_bytes."""
+    files = sorted(Path(cache_dir).glob("*.arrow"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    keep = {Path(k) for k in keep}
+    for p in files:
+        if total <= max_bytes:
+            break
+        if p in keep:
+            continue
+        total -= p.stat().st_size
+        p.unlink(missing_ok=True)
+
+
+def _load_side(csv_path: str, side: str, cache_dir: str):
+    """(normalized frame, cache file or None when pyarrow is not installed)."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return load_csv(csv_path).rename(columns=SIDES[side]), None
+
+    path = cache_path(cache_dir, side, csv_path)
+    if path.exists():
+        os.utime(path)  # mark as recently used
+        return _read_arrow(path), path
+
+    df = load_csv(csv_path).rename(columns=SIDES[side])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_arrow(df, path)
+    return df, path
+
+
+def load_normalized_side(csv_path: str, side: str, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """Normalized frame for one side ("nbim" or "custody"), from the cache when the CSV is unchanged."""
+    return _load_side(csv_path, side, cache_dir)[0]
+
+
+def load_normalized(nbim_path: str, custody_path: str, cache_dir: str = CACHE_DIR,
+                    max_bytes: int = MAX_CACHE_BYTES):
+    """Same result as load_csv + normalize_columns, cached per file fingerprint."""
+    nbim, nbim_file = _load_side(nbim_path, "nbim", cache_dir)
+    custody, custody_file = _load_side(custody_path, "custody", cache_dir)
+    if nbim_file or custody_file:
+        evict(cache_dir, max_bytes, keep=[p for p in (nbim_file, custody_file) if p])
+    return nbim, custody
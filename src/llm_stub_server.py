@@ -0,0 +1,392 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+from agents.llm import estimate_tokens, messages_tokens
+from agents.llm_cache import ResponseCache
+from report_writers import JsonlWriter, iter_jsonl
+from pre_classifier import pre_classify
+
+# --- Local OpenAI-compatible stand-in for /v1/chat/completions ---
+# Answers the classifier (single and batched), prioritizer and remediation prompts with schema-valid
+# content, with configurable latency and injected 429s, 5xx, timeouts and malformed JSON.
+# Record mode proxies to a real endpoint and stores the responses; replay mode serves them back.
+# Point the agents at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+
+class StubConfig:
+    """Latency distribution (fixed | uniform | exponential | lognormal) and fault probabilities per request."""
+
+    def __init__(self, latency_ms: float = 0.0, latency_dist: str = "lognormal", latency_sigma: float = 0.5,
+                 p_429: float = 0.0, p_500: float = 0.0, p_timeout: float = 0.0, timeout_s: float = 30.0,
+                 p_malformed: float = 0.0, retry_after: Optional[float] = None, seed: Optional[int] = None,
+                 record: Optional[str] = None, replay: Optional[str] = None, upstream: Optional[str] = None):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.p_429 = p_429
+        self.p_500 = p_500
+        self.p_timeout = p_timeout
+        self.timeout_s = timeout_s
+        self.p_malformed = p_malformed
+        self.retry_after = retry_after
+        self.seed = seed
+        self.record = record
+        self.replay = replay
+        self.upstream = upstream
+
+    @classmethod
+    def from_env(cls) -> "StubConfig":
+        """STUB_LATENCY_MS, STUB_LATENCY_DIST, STUB_P429, STUB_P500, STUB_PTIMEOUT, STUB_PMALFORMED, ..."""
+        def num(name, default=None):
+            value = os.getenv(name)
+            return float(value) if value else default
+
+        return cls(
+            latency_ms=num("STUB_LATENCY_MS", 0.0),
+            latency_dist=os.getenv("STUB_LATENCY_DIST") or "lognormal",
+            p_429=num("STUB_P429", 0.0),
+            p_500=num("STUB_P500", 0.0),
+            p_timeout=num("STUB_PTIMEOUT", 0.0),
+            timeout_s=num("STUB_TIMEOUT_S", 30.0),
+            p_malformed=num("STUB_PMALFORMED", 0.0),
+            retry_after=num("STUB_RETRY_AFTER"),
+            seed=int(os.getenv("STUB_SEED")) if os.getenv("STUB_SEED") else None,
+            record=os.getenv("STUB_RECORD") or None,
+            replay=os.getenv("STUB_REPLAY") or None,
+            upstream=os.getenv("STUB_UPSTREAM") or None,
+        )
+
+
+# --- Synthetic responses ---
+
+def _json_after(text: str, marker: str):
+    """First JSON object in text after marker (None when absent or invalid)."""
+    start = text.find("{", text.find(marker) + len(marker) if marker in text else 0)
+    end = text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def classify_break(b: Dict[str, Any]) -> Dict[str, Any]:
+    """Classifier-shaped result: the rule pre-classifier's answer when a rule applies, else OTHER / ESCALATE."""
+    resolved, _ = pre_classify([b])
+    if resolved:
+        result = dict(resolved[0])
+        result.pop("classified_by", None)
+        return result
+    row = b.get("nbim_rows") or b.get("custody_rows") or {}
+    return {
+        "event_key": b.get("event_key"),
+        "COAC_EVENT_KEY": row.get("COAC_EVENT_KEY"),
+        "BANK_ACCOUNT": row.get("BANK_ACCOUNT"),
+        "CUSTODIAN": row.get("CUSTODIAN"),
+        "ORGANISATION_NAME": (b.get("nbim_rows") or {}).get("ORGANISATION_NAME"),
+        "classification": "OTHER",
+        "description": "The cash difference is not explained by tax rate, dividend rate or quantity alone.",
+        "confidence": 0.55,
+        "recommended_action": "ESCALATE",
+        "action_params": {"evidence": [f"NET_AMOUNT_SC_DIFF {b.get('NET_AMOUNT_SC_DIFF')}"], "notes": "Review manually."},
+        "NET_AMOUNT_SC_DIFF": b.get("NET_AMOUNT_SC_DIFF"),
+        "SETTLEMENT_CURRENCY": row.get("CURRENCY_SC"),
+    }
+
+
+def _classify_batch(user: str) -> Dict[str, Any]:
+    results = []
+    for line in user.splitlines():
+        line = line.strip()
+        if line.startswith("{") and '"event_key"' in line:
+            try:
+                results.append(classify_break(json.loads(line)))
+            except ValueError:
+                continue
+    return {"results": results}
+
+
+def _prioritize(user: str) -> Dict[str, Any]:
+    # The legacy prioritizer sends a Python repr of the classified list
+    coac = re.findall(r"['\"]COAC_EVENT_KEY['\"]:\s*['\"]?([^,'\"}]+)", user)
+    bank = re.findall(r"['\"]BANK_ACCOUNT['\"]:\s*['\"]?([^,'\"}]+)", user)
+    diffs = re.findall(r"['\"]NET_AMOUNT_SC_DIFF['\"]:\s*([-0-9.eE+]+|None|null)", user)
+    rows = []
+    for i, (c, b) in enumerate(zip(coac, bank)):
+        try:
+            diff = float(diffs[i]) if i < len(diffs) else 0.0
+        except ValueError:
+            diff = 0.0
+        rows.append((abs(diff), c.strip(), b.strip()))
+    rows.sort(key=lambda r: -r[0])
+    return {"reconciliation_breaks": [
+        {"COAC_EVENT_KEY": c, "BANK_ACCOUNT": b, "priority": i, "reason": f"Cash impact {diff:,.2f}."}
+        for i, (diff, c, b) in enumerate(rows, start=1)
+    ]}
+
+
+def _ticket(user: str) -> str:
+    data = _json_after(user, "JSON:") or {}
+    if "number_of_events" in data:
+        custodian = data.get("CUSTODIAN") or "Custodian"
+        subject = f"Dividend reconciliation discrepancies — {data['number_of_events']} COAC events"
+        summary = ", ".join(f"{label}: {v.get('count')}" for label, v in (data.get("classifications") or {}).items())
+        body = f"We have identified {data['number_of_events']} dividend events where NBIM and custody disagree ({summary})."
+    else:
+        custodian = data.get("CUSTODIAN") or "Custodian"
+        subject = f"{data.get('classification', 'OTHER')} discrepancy — {data.get('ORGANISATION_NAME') or 'unknown issuer'} (COAC {data.get('COAC_EVENT_KEY')})"
+        body = (
+            f"We have identified a discrepancy for bank account {data.get('BANK_ACCOUNT')} with a net cash difference of "
+            f"{data.get('NET_AMOUNT_SC_DIFF')} {data.get('SETTLEMENT_CURRENCY') or ''}. {data.get('description') or ''}"
+        ).strip()
+    return (
+        f"To: {custodian} — Corporate Actions / Tax Desk\n"
+        f"Subject: {subject}\n\n"
+        f"{body}\n\n"
+        "Please review and confirm the relevant details, or advise on next steps.\n\n"
+        "Kind regards,\nOperations — Corporate Actions (Reconciliations)\nNBIM\n"
+    )
+
+
+def synthesize(body: Dict[str, Any]) -> str:
+    """Content the real model would be asked for, derived from the request."""
+    messages: List[Dict[str, Any]] = body.get("messages") or []
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = messages[-1].get("content") or "" if messages else ""
+    fmt = (body.get("response_format") or {}).get("type")
+
+    if fmt == "text" or "custodian ticket" in user:
+        return _ticket(user)
+    if "prioritizing dividend reconciliation breaks" in system:
+        return json.dumps(_prioritize(user), ensure_ascii=False)
+    if "explain the priority" in system:
+        payload = _json_after(user, "") or {}
+        brk = payload.get("break") or {}
+        return json.dumps({"reason": f"Rank {payload.get('priority')}: {brk.get('classification', 'OTHER')} with "
+                                     f"{brk.get('NET_AMOUNT_SC_DIFF')} {brk.get('SETTLEMENT_CURRENCY') or ''} cash gap."})
+    if '{"results"' in user:
+        return json.dumps(_classify_batch(user), ensure_ascii=False)
+    b = _json_after(user, "Break input") or {}
+    return json.dumps(classify_break(b), ensure_ascii=False, default=str)
+
+
+# --- Server ---
+
+class Stub:
+    """Request handling shared by all server threads: faults, latency, record / replay, counters."""
+
+    def __init__(self, config: StubConfig = None):
+        self.config = config or StubConfig()
+        self.rng = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.stats = {"connections": 0, "requests": 0, "ok": 0, "429": 0, "500": 0, "timeout": 0, "malformed": 0,
+                      "replayed": 0, "recorded": 0}
+        self.recorded: Dict[str, Dict[str, Any]] = {}
+        if self.config.replay and os.path.exists(self.config.replay):
+            self.recorded = {r["key"]: r for r in iter_jsonl(self.config.replay)}
+        self._recorder = JsonlWriter(self.config.record, append=True) if self.config.record else None
+
+    def _count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _draw(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def latency(self) -> float:
+        """Seconds to wait before answering."""
+        mean = self.config.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        with self.lock:
+            dist = self.config.latency_dist
+            if dist == "fixed":
+                return mean
+            if dist == "uniform":
+                return self.rng.uniform(0, 2 * mean)
+            if dist == "exponential":
+                return self.rng.expovariate(1 / mean)
+            sigma = self.config.latency_sigma
+            return self.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+    def _upstream(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        request = urllib.request.Request(
+            self.config.upstream.rstrip("/") + "/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"},
+        )
+        with urllib.request.urlopen(request, timeout=600) as resp:
+            return json.loads(resp.read())
+
+    def respond(self, body: Dict[str, Any]):
+        """(status, extra headers, payload dict) or None to drop the connection (timeout)."""
+        self._count("requests")
+        cfg = self.config
+        draw = self._draw()
+        if draw < cfg.p_timeout:
+            self._count("timeout")
+            time.sleep(cfg.timeout_s)
+            return None
+        draw -= cfg.p_timeout
+        if draw < cfg.p_429:
+            self._count("429")
+            headers = {"retry-after": str(cfg.retry_after)} if cfg.retry_after is not None else {}
+            return 429, headers, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_exceeded"}}
+        draw -= cfg.p_429
+        if draw < cfg.p_500:
+            self._count("500")
+            return 503, {}, {"error": {"message": "Service unavailable (stub)", "type": "server_error"}}
+
+        time.sleep(self.latency())
+
+        model = body.get("model")
+        messages = body.get("messages") or []
+        key = ResponseCache.key(model, messages, body.get("response_format"))
+        usage = None
+        if key in self.recorded:
+            self._count("replayed")
+            content, usage = self.recorded[key]["content"], self.recorded[key].get("usage")
+        elif cfg.upstream:
+            try:
+                upstream = self._upstream(body)
+            except urllib.error.HTTPError as e:
+                return e.code, {}, json.loads(e.read() or b"{}")
+            content, usage = upstream["choices"][0]["message"]["content"], upstream.get("usage")
+            if self._recorder:
+                with self.lock:
+                    self._recorder.write({"key": key, "model": model, "content": content, "usage": usage})
+                    self.recorded[key] = {"content": content, "usage": usage}
+                self._count("recorded")
+        else:
+            content = synthesize(body)
+
+        if self._draw() < cfg.p_malformed and (body.get("response_format") or {}).get("type") == "json_object":
+            self._count("malformed")
+            content = content[: max(1, len(content) // 2)]
+
+        self._count("ok")
+        prompt_tokens = messages_tokens(messages)
+        completion_tokens = estimate_tokens(content)
+        return 200, {}, {
+            "id": f"chatcmpl-stub-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage or {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def close(self):
+        if self._recorder:
+            self._recorder.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes on kept-alive connections
+
+    def setup(self):
+        super().setup()
+        self.server.stub._count("connections")  # one per TCP connection, shows keep-alive reuse
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        if self.path.rstrip("/").endswith("/stats"):
+            return self._send(200, dict(self.server.stub.stats))
+        self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            return self._send(400, {"error": {"message": "Request body is not JSON"}})
+
+        result = self.server.stub.respond(body)
+        if result is None:
+            self.close_connection = True  # simulated timeout: drop the connection without answering
+            return
+        status, headers, payload = result
+        self._send(status, payload, headers)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_server(config: StubConfig = None, host: str = "127.0.0.1", port: int = 0, verbose: bool = False):
+    """Serve the stub on a background thread. Returns the server; server.base_url is the /v1 URL."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.stub = Stub(config)
+    server.verbose = verbose
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+    server.stub.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for the agents")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean response latency")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--p429", type=float, default=0.0, help="probability of a 429 response")
+    parser.add_argument("--p500", type=float, default=0.0, help="probability of a 503 response")
+    parser.add_argument("--ptimeout", type=float, default=0.0, help="probability of hanging and dropping the connection")
+    parser.add_argument("--timeout-s", type=float, default=30.0, help="how long a simulated timeout hangs")
+    parser.add_argument("--pmalformed", type=float, default=0.0, help="probability of truncated JSON content")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", help="JSONL file to append upstream responses to (needs --upstream)")
+    parser.add_argument("--replay", help="JSONL file of recorded responses to serve back")
+    parser.add_argument("--upstream", help="real OpenAI-compatible base URL to proxy to, e.g. https://api.openai.com/v1")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = start_server(StubConfig(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, p_429=args.p429, p_500=args.p500,
+        p_timeout=args.ptimeout, timeout_s=args.timeout_s, p_malformed=args.pmalformed,
+        retry_after=args.retry_after, seed=args.seed, record=args.record, replay=args.replay, upstream=args.upstream,
+    ), args.host, args.port, args.verbose)
+    print(f"Stub LLM server on {server.base_url} (export OPENAI_BASE_URL={server.base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_server(server)
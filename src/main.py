@@ -1,70 +1,257 @@
 import os
 import json
-from openai import OpenAI
-import pandas as pd
+import argparse
 import asyncio
-import time
-from data_prcessing import load_csv, normalize_columns, get_events
-from break_detector import detect_breaks
-from agents.classifier_agent import classify_reconciliation_breaks
-from agents.prioritizer_agent import prioritize_breaks
-from agents.remediation_agent import draft_custodian_tickets
-from write_to_excel import combine_and_export
+from data_prcessing import load_csv, normalize_columns, join_events, event_fingerprints, select_events
+from run_state import RunState, STATE_PATH
+from input_cache import load_normalized
+from pre_classifier import pre_classify
+from break_prioritizer import rank_breaks
+from break_detector import DETECTOR_COLUMNS, detect_breaks_frame, to_break_events, detect_breaks_streaming
+from sharding import reconcile_sharded
+from candidate_index import attach_candidates
+from report_writers import report_writers, report_formats, flatten_classified, CLASSIFIED_FIELDS
+from run_stages import (
+    STAGES, REPORTS_DIR, TICKETS_DIR, with_prerequisites, write_detected, prioritize_stage, export_stage,
+    record_run, write_metrics,
+)
+from metrics import get_metrics
+from checkpoint import Checkpoint
 
+NBIM_CSV = "data/NBIM_Dividend_Bookings 1 (2).csv"
+CUSTODY_CSV = "data/CUSTODY_Dividend_Bookings 1 (2).csv"
 
-async def run_both(items: list):
-    # Run both agents concurrently
-    
-    prioritize_task = asyncio.create_task(asyncio.to_thread(prioritize_breaks, items))
-    draft_task = asyncio.create_task(asyncio.to_thread(draft_custodian_tickets, items))
 
-    prioritize_result, draft_result = await asyncio.gather(prioritize_task, draft_task)
-    return prioritize_result
+async def main(incremental: bool = False, nbim_csv: str = NBIM_CSV, custody_csv: str = CUSTODY_CSV,
+               stages=None, reports_dir: str = REPORTS_DIR, tickets_dir: str = TICKETS_DIR, excel_path: str = None,
+               resume: bool = False):
+    """
+    Run the selected stages (default all) and their prerequisites:
+    detect -> classify (LLM agent) -> prioritize / draft (tickets) -> export (Excel).
+    Classifications and tickets are checkpointed as they are produced; resume=True reuses the
+    checkpoints of an interrupted run. They are removed once the run completes.
+    """
+    stages = with_prerequisites(stages or STAGES)
+    excel_path = excel_path or os.path.join(reports_dir, "reconciliation_breaks_combined.xlsx")
+    os.makedirs(reports_dir, exist_ok=True)
 
+    # --- Streaming mode: set CSV_CHUNKSIZE to read both files in bounded chunks ---
+    chunksize = int(os.getenv("CSV_CHUNKSIZE") or 0)
+    if chunksize and incremental:
+        print("Incremental runs load both files in memory; ignoring CSV_CHUNKSIZE.")
+        chunksize = 0
 
-async def main():
+    # --- Sharded mode: set SHARDS to load, detect and pre-classify on a process pool ---
+    shards = int(os.getenv("SHARDS") or 0)
+    if shards and incremental:
+        print("Incremental runs load both files in memory; ignoring SHARDS.")
+        shards = 0
 
-    # --- File paths ---
-    NBIM_CSV = "data/NBIM_Dividend_Bookings 1 (2).csv"
-    CUSTODY_CSV = "data/CUSTODY_Dividend_Bookings 1 (2).csv"
+    # --- Instrumentation: wall time / peak memory per stage and LLM call accounting ---
+    metrics = get_metrics()
 
+    state, fingerprints, unchanged, vanished = None, None, set(), set()
+    resolved = None
+    if shards:
+        with metrics.stage("detect_sharded") as stage:
+            breaks, resolved = reconcile_sharded(nbim_csv, custody_csv, shards, int(os.getenv("SHARD_WORKERS") or 0) or None)
+            stage["items"] = len(breaks)
+    elif chunksize:
+        partitions = int(os.getenv("CSV_PARTITIONS") or 16)
+        with metrics.stage("detect_streaming") as stage:
+            breaks = detect_breaks_streaming(nbim_csv, custody_csv, chunksize=chunksize, partitions=partitions)
+            stage["items"] = len(breaks)
+    else:
+        # --- Load and normalize (cached per file fingerprint unless INPUT_CACHE=0) ---
+        with metrics.stage("load") as stage:
+            if os.getenv("INPUT_CACHE", "1") != "0":
+                nbim, custody = load_normalized(
+                    nbim_csv, custody_csv,
+                    cache_dir=os.getenv("INPUT_CACHE_DIR") or "cache/inputs",
+                    max_bytes=int(os.getenv("INPUT_CACHE_MAX_MB") or 512) * 1024 * 1024,
+                )
+            else:
+                nbim = load_csv(nbim_csv)
+                custody = load_csv(custody_csv)
+                nbim, custody = normalize_columns(nbim, custody)
+            stage["items"] = len(nbim) + len(custody)
 
-    # --- Load and normalize ---
-    nbim = load_csv(NBIM_CSV)
-    custody = load_csv(CUSTODY_CSV)
-    nbim, custody = normalize_columns(nbim, custody)
+        # --- Run state: fingerprint every event; incremental runs only reprocess new / changed ones ---
+        with metrics.stage("fingerprint"):
+            state = RunState(os.getenv("RUN_STATE_PATH") or STATE_PATH)
+            fingerprints = event_fingerprints(nbim, custody)
+            changed, unchanged, vanished = state.diff(fingerprints.to_dict())
+            if incremental:
+                nbim, custody = select_events(nbim, changed), select_events(custody, changed)
+                fingerprints = fingerprints[fingerprints.index.isin(changed)]
+                print(f"Incremental run: {len(changed)} new or changed events, {len(unchanged)} unchanged, {len(vanished)} gone.")
+            else:
+                unchanged = set()
 
+        # --- Join both sides on the event key ---
+        with metrics.stage("join") as stage:
+            joined = join_events(nbim, custody, columns=DETECTOR_COLUMNS)
+            stage["items"] = len(joined)
 
+        # --- Detect breaks (event dicts are only built for breaks) ---
+        with metrics.stage("detect") as stage:
+            flagged = detect_breaks_frame(joined)
+            breaks = to_break_events(flagged, nbim, custody)
+            stage["items"] = len(breaks)
 
-    # --- Prepare event objects ---
-    events = get_events(nbim, custody)
-    
-
-    # --- Detect breaks ---
-    breaks = detect_breaks(events)
     print(f"Detected {len(breaks)} reconciliation breaks.")
 
-    # --- Classify breaks ---
-    classified = classify_reconciliation_breaks(breaks)
-    
-    with open("reports/classified_reconciliation_breaks.json", "w", encoding="utf-8") as f:
-            json.dump(classified, f, ensure_ascii=False, indent=2)
+    # --- Resolve mechanically explained breaks without an LLM call (done per shard in sharded mode) ---
+    if resolved is None:
+        # Propose counterparts for orphan records booked under another key, before classification
+        with metrics.stage("candidates") as stage:
+            stage["items"] = attach_candidates(breaks)
+        if stage["items"]:
+            print(f"Found candidate counterparts for {stage['items']} orphan records.")
+        with metrics.stage("pre_classify") as stage:
+            resolved, _ = pre_classify(breaks)
+            stage["items"] = len(resolved)
+    print(f"Rules classified {len(resolved)} breaks, {len(breaks) - len(resolved)} left for the classifier agent.")
+    formats = report_formats()
+
+    if "classify" not in stages:
+        # --- Detect-only run: write the detected breaks and stop before the LLM stages ---
+        write_detected(breaks, formats, reports_dir)
+        if state is not None:
+            state.close()  # nothing classified: keep the previous run state for the next full run
+        write_metrics(metrics, reports_dir)
+        return
+
+    from pipeline import run_pipeline
+    from agents.llm_cache import get_default_cache
+
+    draft = "draft" in stages
+    if draft:
+        os.makedirs(tickets_dir, exist_ok=True)
+
+    # --- Checkpoints: every classification / ticket is fsynced as it is produced ---
+    classify_checkpoint = Checkpoint("classify", resume)
+    draft_checkpoint = Checkpoint("draft", resume) if draft else None
+    if resume:
+        tickets_done = len(draft_checkpoint.done) if draft_checkpoint else 0
+        print(f"Resuming: {len(classify_checkpoint.done)} classifications and {tickets_done} tickets checkpointed.")
+
+    # --- Classify, rank and draft tickets as one streaming pipeline ---
+    # Classified records are appended to the JSONL / Parquet reports as they arrive
+    classified_stem = os.path.join(reports_dir, "classified_reconciliation_breaks")
+    classified_out = report_writers(classified_stem, formats, CLASSIFIED_FIELDS, flatten_classified)
+    # Open breaks of unchanged events are carried forward (their custodians' consolidated tickets cover them)
+    carried = state.open_breaks(unchanged) if state is not None else []
+    try:
+        with metrics.stage("pipeline") as stage:
+            classified, prioritized, written = await run_pipeline(
+                breaks, resolved, out_dir=tickets_dir, on_classified=classified_out.write, draft=draft,
+                classify_checkpoint=classify_checkpoint, draft_checkpoint=draft_checkpoint,
+                carried=[r for _, r in carried],
+            )
+            stage["items"] = len(classified)
+        new_breaks, new_classified = breaks, classified
+
+        # --- Rank the carried-forward open breaks together with the new ones ---
+        if carried:
+            print(f"Carried forward {len(carried)} open breaks from the previous run.")
+            merged = sorted(
+                list(zip(breaks, classified)) + carried, key=lambda pair: tuple(pair[0]["key_tuple"])
+            )
+            breaks = [b for b, _ in merged]
+            classified = [r for _, r in merged]
+            prioritized = rank_breaks(classified, breaks)
+            classified_out.write_many(r for _, r in carried)
+    finally:
+        classified_out.close()
 
-    print(f"✅ Wrote {len(classified)} classified breaks to reports/classified_reconciliation_breaks.json")
+    if "json" in formats:
+        with open(f"{classified_stem}.json", "w", encoding="utf-8") as f:
+                json.dump(classified, f, ensure_ascii=False, indent=2)
 
-    # --- Prioritize breaks & draft tickets ---
-    prioritized = await run_both(classified)
+    print(f"✅ Wrote {len(classified)} classified breaks to {classified_stem}.* ({', '.join(sorted(formats))})")
+    if draft:
+        print(f"✅ Wrote {len(written)} tickets to {tickets_dir}/")
 
-    with open("reports/prioritized_breaks.json", "w", encoding="utf-8") as f:
-        json.dump(prioritized, f, ensure_ascii=False, indent=2)
+    if "prioritize" in stages:
+        prioritized = await prioritize_stage(metrics, classified, prioritized, formats, reports_dir)
 
-    print(f"✅ Wrote {len(prioritized)} prioritized breaks to reports/prioritized_breaks.json")
+    if state is not None:
+        record_run(
+            state, fingerprints.to_dict(), new_breaks, new_classified, written, vanished,
+            prioritized if "prioritize" in stages else None, tickets_dir,
+        )
+        print(f"Run state: {state.stats()}")
+        state.close()
 
-    # --- Combine into Excel ---
-    time.sleep(0.5)  # wait a moment for file write to complete
-    combine_and_export()
+    # --- Combine into Excel (from the in-memory results) ---
+    if "export" in stages:
+        export_stage(metrics, prioritized, classified, excel_path)
 
+    cache = get_default_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+    # The run is complete: nothing left to resume
+    for checkpoint in (classify_checkpoint, draft_checkpoint):
+        if checkpoint is not None:
+            checkpoint.close(remove=True)
+
+    write_metrics(metrics, reports_dir)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Dividend reconciliation pipeline")
+    parser.add_argument("--nbim", default=NBIM_CSV, help="NBIM dividend bookings CSV")
+    parser.add_argument("--custody", default=CUSTODY_CSV, help="custody dividend bookings CSV")
+    parser.add_argument(
+        "--stages", default=",".join(STAGES),
+        help=f"comma-separated stages to run, prerequisites included ({', '.join(STAGES)}; default all). "
+             "detect alone writes detected_breaks.* and makes no LLM calls",
+    )
+    parser.add_argument("--reports-dir", default=REPORTS_DIR, help="directory of the JSON / JSONL / Parquet reports")
+    parser.add_argument("--tickets-dir", default=TICKETS_DIR, help="directory of the drafted custodian tickets")
+    parser.add_argument("--excel", default=None, help="Excel report path (default <reports-dir>/reconciliation_breaks_combined.xlsx)")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only re-detect, re-classify and re-draft events that are new or changed since the last run",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="reuse the classifications and tickets checkpointed by an interrupted run (CHECKPOINT_DIR)",
+    )
+    parser.add_argument(
+        "--watch", nargs="?", const="data", default=None, metavar="DIR",
+        help="keep running and reconcile the changed events whenever a new NBIM*.csv / CUSTODY*.csv "
+             "lands in DIR (default data/); --nbim / --custody are ignored",
+    )
+    parser.add_argument("--watch-interval", type=float, default=None, help="polling interval in seconds (default 2)")
+    args = parser.parse_args()
+
+    try:
+        stages = with_prerequisites(s.strip() for s in args.stages.split(",") if s.strip())
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Settings from .env apply to every stage (the agents also load it when imported)
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.watch:
+        from watcher import watch
+
+        try:
+            asyncio.run(watch(
+                args.watch, args.watch_interval, stages=stages,
+                reports_dir=args.reports_dir, tickets_dir=args.tickets_dir, excel_path=args.excel,
+            ))
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        raise SystemExit(0)
+
+    asyncio.run(main(
+        incremental=args.incremental, nbim_csv=args.nbim, custody_csv=args.custody, stages=stages,
+        reports_dir=args.reports_dir, tickets_dir=args.tickets_dir, excel_path=args.excel,
+        resume=args.resume,
+    ))
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# --- Run instrumentation: stage timings / memory and LLM call accounting ---
+# One process-wide Metrics instance (get_metrics) collects wall time and peak memory per pipeline stage,
+# and per LLM call the latency, outcome, tokens from resp.usage, retries and response-cache hits.
+# At the end of a run it is written as a JSON summary and as Prometheus text-format metrics.
+
+METRICS_PATH = "reports/run_metrics"
+
+# Upper bounds (seconds) of the LLM latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _rss_peak_mb() -> Optional[float]:
+    """Process resident-set high-water mark (MB) or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty or beyond the last bucket)."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= q * self.count:
+                return bound
+        return None
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            yield bound, total
+
+
+class _LLMStats:
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.retries: Dict[str, int] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Metrics:
+    """Thread-safe collector; see get_metrics()."""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.llm: Dict[Tuple[str, str], _LLMStats] = {}
+        self._lock = threading.Lock()
+
+    # --- Stages ---
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a pipeline stage: `with metrics.stage("detect") as s: ...; s["items"] = n`.
+        Memory is how far the stage raised the process RSS high-water mark (rss_peak_growth_mb; 0 when
+        an earlier stage already reached a higher peak) next to that process-lifetime peak, plus the peak
+        of Python allocations during the stage when trace_memory is on (METRICS_TRACE_MEMORY=1, slower).
+        """
+        info: Dict[str, Any] = {}
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        rss_before = _rss_peak_mb()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            traced = tracemalloc.get_traced_memory()[1] / 1e6 if tracing else None
+            if tracing:
+                tracemalloc.stop()
+            with self._lock:
+                entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                entry["seconds"] = round(entry["seconds"] + seconds, 4)
+                entry["calls"] += 1
+                rss_after = _rss_peak_mb()
+                entry["process_rss_peak_mb"] = rss_after
+                if rss_after is not None:
+                    growth = round(rss_after - rss_before, 1)
+                    entry["rss_peak_growth_mb"] = max(growth, entry.get("rss_peak_growth_mb") or 0.0)
+                if traced is not None:
+                    entry["traced_peak_mb"] = round(max(traced, entry.get("traced_peak_mb") or 0.0), 1)
+                if "items" in info:
+                    entry["items"] = entry.get("items", 0) + info["items"]
+
+    # --- LLM calls ---
+
+    def _llm(self, operation: str, model: Optional[str]) -> _LLMStats:
+        key = (operation, str(model))
+        stats = self.llm.get(key)
+        if stats is None:
+            stats = self.llm[key] = _LLMStats()
+        return stats
+
+    def llm_call(self, operation: str, model: Optional[str], seconds: float, usage=None, error: bool = False):
+        """One HTTP attempt: latency, outcome and token usage (resp.usage, when the server reports it)."""
+        with self._lock:
+            stats = self._llm(operation, model)
+            stats.latency.observe(seconds)
+            stats.calls += 1
+            stats.errors += bool(error)
+            if usage is not None:
+                stats.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                stats.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def llm_retry(self, operation: str, model: Optional[str], reason: str):
+        with self._lock:
+            retries = self._llm(operation, model).retries
+            retries[reason] = retries.get(reason, 0) + 1
+
+    def llm_cache(self, operation: str, model: Optional[str], hit: bool):
+        with self._lock:
+            stats = self._llm(operation, model)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    # --- Export ---
+
+    @staticmethod
+    def prices() -> Tuple[float, float]:
+        """USD per 1M prompt / completion tokens (LLM_PRICE_INPUT_PER_1M / LLM_PRICE_OUTPUT_PER_1M, default 0)."""
+        return float(os.getenv("LLM_PRICE_INPUT_PER_1M") or 0), float(os.getenv("LLM_PRICE_OUTPUT_PER_1M") or 0)
+
+    def summary(self) -> Dict[str, Any]:
+        price_in, price_out = self.prices()
+        with self._lock:
+            llm = []
+            for (operation, model), s in sorted(self.llm.items()):
+                llm.append({
+                    "operation": operation,
+                    "model": model,
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "retries": dict(s.retries),
+                    "cache_hits": s.cache_hits,
+                    "cache_misses": s.cache_misses,
+                    "prompt_tokens": s.prompt_tokens,
+                    "completion_tokens": s.completion_tokens,
+                    "cost_usd": round((s.prompt_tokens * price_in + s.completion_tokens * price_out) / 1e6, 6),
+                    "latency_seconds": {
+                        "mean": round(s.latency.sum / s.latency.count, 4) if s.latency.count else None,
+                        "p50": s.latency.quantile(0.5),
+                        "p95": s.latency.quantile(0.95),
+                        "p99": s.latency.quantile(0.99),
+                    },
+                })
+            return {
+                "started": self.started,
+                "wall_seconds": round(time.time() - self.started, 3),
+                "process_rss_peak_mb": _rss_peak_mb(),
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+                "llm": llm,
+                "llm_totals": {
+                    key: sum(entry[key] for entry in llm)
+                    for key in ("calls", "errors", "cache_hits", "prompt_tokens", "completion_tokens", "cost_usd")
+                },
+            }
+
+    def prometheus(self, prefix: str = "recon") -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        price_in, price_out = self.prices()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def labels(**values):
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in values.items()) + "}"
+
+        with self._lock:
+            family("stage_seconds", "gauge", "Wall time per pipeline stage.")
+            for name, entry in self.stages.items():
+                lines.append(f"{prefix}_stage_seconds{labels(stage=name)} {entry['seconds']}")
+            rss_peak = _rss_peak_mb()
+            if rss_peak is not None:
+                family("process_rss_peak_megabytes", "gauge", "Process RSS high-water mark over the process lifetime.")
+                lines.append(f"{prefix}_process_rss_peak_megabytes {rss_peak}")
+            family("stage_rss_peak_growth_megabytes", "gauge", "Rise of the process RSS high-water mark during the stage.")
+            for name, entry in self.stages.items():
+                if entry.get("rss_peak_growth_mb") is not None:
+                    lines.append(f"{prefix}_stage_rss_peak_growth_megabytes{labels(stage=name)} {entry['rss_peak_growth_mb']}")
+            family("stage_items", "gauge", "Items produced per pipeline stage.")
+            for name, entry in self.stages.items():
+                if "items" in entry:
+                    lines.append(f"{prefix}_stage_items{labels(stage=name)} {entry['items']}")
+
+            items = sorted(self.llm.items())
+            family("llm_request_seconds", "histogram", "Latency of LLM HTTP attempts.")
+            for (operation, model), s in items:
+                for bound, total in s.latency.cumulative():
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f"{prefix}_llm_request_seconds_bucket{labels(operation=operation, model=model, le=le)} {total}")
+                lines.append(f"{prefix}_llm_request_seconds_sum{labels(operation=operation, model=model)} {round(s.latency.sum, 6)}")
+                lines.append(f"{prefix}_llm_request_seconds_count{labels(operation=operation, model=model)} {s.latency.count}")
+            family("llm_requests_total", "counter", "LLM HTTP attempts by outcome.")
+            for (operation, model), s in items:
+                lines.append(f"{prefix}_llm_requests_total{labels(operation=operation, model=model, outcome='ok')} {s.calls - s.errors}")
+                lines.append(f"{prefix}_llm_requests_total{labels(operation=operation, model=model, outcome='error')} {s.errors}")
+            family("llm_retries_total", "counter", "LLM retries by reason.")
+            for (operation, model), s in items:
+                for reason, n in sorted(s.retries.items()):
+                    lines.append(f"{prefix}_llm_retries_total{labels(operation=operation, model=model, reason=reason)} {n}")
+            family("llm_tokens_total", "counter", "Tokens reported in resp.usage.")
+            for (operation, model), s in items:
+                lines.append(f"{prefix}_llm_tokens_total{labels(operation=operation, model=model, kind='prompt')} {s.prompt_tokens}")
+                lines.append(f"{prefix}_llm_tokens_total{labels(operation=operation, model=model, kind='completion')} {s.completion_tokens}")
+            family("llm_cache_lookups_total", "counter", "Response-cache lookups by result.")
+            for (operation, model), s in items:
+                lines.append(f"{prefix}_llm_cache_lookups_total{labels(operation=operation, model=model, result='hit')} {s.cache_hits}")
+                lines.append(f"{prefix}_llm_cache_lookups_total{labels(operation=operation, model=model, result='miss')} {s.cache_misses}")
+            family("llm_cost_usd_total", "counter", "Estimated LLM cost from token usage and LLM_PRICE_* settings.")
+            for (operation, model), s in items:
+                cost = (s.prompt_tokens * price_in + s.completion_tokens * price_out) / 1e6
+                lines.append(f"{prefix}_llm_cost_usd_total{labels(operation=operation, model=model)} {round(cost, 6)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, stem: str = METRICS_PATH):
+        """Write `stem`.json (run summary) and `stem`.prom (Prometheus text format)."""
+        Path(stem).parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{stem}.json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        with open(f"{stem}.prom", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        return f"{stem}.json", f"{stem}.prom"
+
+
+_METRICS: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics collector; METRICS_TRACE_MEMORY=1 adds tracemalloc peaks per stage."""
+    global _METRICS
+    if _METRICS is None:
+        _METRICS = Metrics(trace_memory=os.getenv("METRICS_TRACE_MEMORY") == "1")
+    return _METRICS
+
+
+def reset_metrics() -> Metrics:
+    """Start a fresh collector (e.g. between benchmark runs)."""
+    global _METRICS
+    _METRICS = None
+    return get_metrics()
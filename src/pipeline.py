@@ -0,0 +1,199 @@
+import os, asyncio
+from typing import List, Dict, Any
+from checkpoint import Checkpoint, break_digest
+from agents.llm import RateLimiter, env_int, get_client, get_async_client
+from agents.classifier_agent import classify_break_async, classify_reconciliation_breaks_batched, failed_result
+from agents.remediation_agent import draft_custodian_ticket, draft_custodian_tickets, ticket_path, write_ticket
+from break_prioritizer import BreakRanker
+
+# --- Streaming pipeline: classify -> (rank, draft) connected by bounded queues ---
+# Each break flows to the next stage as soon as it is classified, so ticket drafting and ranking
+# overlap with classification instead of waiting for the whole list. Queue sizes bound memory
+# and give backpressure when a downstream stage is slower.
+
+_DONE = object()  # end-of-stream marker, one per worker
+
+
+async def _run_stages(tasks):
+    """
+    Wait for all stage tasks. When one fails the others are cancelled (they may be blocked on a full
+    queue that nobody drains any more) and the error is raised, so a broken stage fails the run
+    instead of hanging it.
+    """
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+
+
+async def run_pipeline(
+    breaks: List[Dict[str, Any]],
+    resolved: List[Dict[str, Any]] = None,
+    model: str = None,
+    classify_workers: int = None,
+    ticket_workers: int = None,
+    consolidate: bool = None,
+    out_dir: str = "drafted_tickets",
+    on_classified=None,
+    draft: bool = True,
+    classify_checkpoint: Checkpoint = None,
+    draft_checkpoint: Checkpoint = None,
+    carried: List[Dict[str, Any]] = None,
+):
+    """
+    Classify, rank and draft tickets for detected breaks as one streaming pipeline.
+
+    `resolved` are results already produced by the rule pre-classifier (keyed by event_key); they skip
+    the classifier stage. Classification runs on `classify_workers` tasks (LLM_CONCURRENCY, default 8),
+    micro-batching several queued breaks per request when CLASSIFIER_BATCH_TOKENS is set. Tickets are
+    drafted on `ticket_workers` threads (TICKET_WORKERS, default 8) as results arrive; with `consolidate`
+    (TICKETS_CONSOLIDATE=1) the per-custodian tickets are drafted once classification is done.
+    `on_classified(result)` is called for every result as it arrives. With draft=False no tickets are drafted.
+
+    `classify_checkpoint` / `draft_checkpoint` persist every classification / per-break ticket path as it
+    is produced; breaks already in a resumed checkpoint (unchanged since) are not classified or drafted
+    again. Consolidated tickets are always redrafted.
+
+    `carried` are the classifications of open breaks from earlier runs that are not processed again
+    (incremental and watch modes). A consolidated ticket is redrafted over all open breaks of its
+    custodian, carried ones included, whenever the custodian has a new ticket-worthy break.
+
+    A failure of one break is contained: a classification that raises or is not a JSON object becomes a
+    failed_result (manual review), and a ticket that cannot be drafted or written is reported and skipped.
+    Any other stage error cancels the remaining stages and is raised.
+
+    Returns (classified in detection order, prioritized, written ticket paths).
+    """
+    aclient = get_async_client()
+    client = get_client()
+    model = model or os.getenv("MODEL")
+    limiter = RateLimiter.from_env()
+    classify_workers = classify_workers or env_int("LLM_CONCURRENCY", 8)
+    ticket_workers = ticket_workers or env_int("TICKET_WORKERS", 8)
+    batch_size = env_int("CLASSIFIER_BATCH_SIZE", 20) if os.getenv("CLASSIFIER_BATCH_TOKENS") else 1
+    if consolidate is None:
+        consolidate = os.getenv("TICKETS_CONSOLIDATE") == "1"
+
+    resolved = resolved or []
+    resolved_keys = {r.get("event_key") for r in resolved}
+    breaks_by_key = {b["event_key"]: b for b in breaks}
+    digests = {b["event_key"]: break_digest(b) for b in breaks} if classify_checkpoint or draft_checkpoint else {}
+
+    to_classify = asyncio.Queue(maxsize=2 * classify_workers * batch_size)
+    classified_q = asyncio.Queue(maxsize=2 * classify_workers * batch_size)
+    to_draft = asyncio.Queue(maxsize=2 * ticket_workers)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    ranker = BreakRanker()
+    held_for_consolidation: List[Dict[str, Any]] = []
+    written: List[str] = []
+
+    async def produce():
+        for r in resolved:
+            await classified_q.put((r.get("event_key"), r))
+        for b in breaks:
+            key = b["event_key"]
+            if key in resolved_keys:
+                continue
+            done = classify_checkpoint.get(key, digests[key]) if classify_checkpoint else None
+            if done is not None:
+                await classified_q.put((key, done))
+            else:
+                await to_classify.put(b)
+        for _ in range(classify_workers):
+            await to_classify.put(_DONE)
+
+    async def classify_worker():
+        finished = False
+        while not finished:
+            item = await to_classify.get()
+            if item is _DONE:
+                break
+            # Take whatever else is already queued, up to one batch
+            batch = [item]
+            while len(batch) < batch_size and not to_classify.empty():
+                nxt = to_classify.get_nowait()
+                if nxt is _DONE:
+                    finished = True
+                    break
+                batch.append(nxt)
+
+            try:
+                if len(batch) > 1:
+                    out = await classify_reconciliation_breaks_batched(batch, model, concurrency=1, limiter=limiter)
+                else:
+                    out = [await classify_break_async(aclient, model, batch[0], limiter)]
+            except Exception as e:
+                print(f"Classifying {len(batch)} breaks failed: {e}")
+                out = [failed_result(b, e) for b in batch]
+            for b, r in zip(batch, out):
+                if not isinstance(r, dict):
+                    r = failed_result(b, ValueError(f"unexpected classifier result {r!r}"))
+                if classify_checkpoint and r.get("error") is None:
+                    classify_checkpoint.put(b["event_key"], r, digests[b["event_key"]])
+                await classified_q.put((b["event_key"], r))
+
+    async def fan_out():
+        while (item := await classified_q.get()) is not _DONE:
+            key, r = item
+            results[key] = r
+            ranker.add(r, breaks_by_key.get(key))
+            if on_classified:
+                on_classified(r)
+            if draft and r.get("recommended_action") == "DRAFT_CUSTODIAN_TICKET":
+                if consolidate:
+                    held_for_consolidation.append(r)
+                else:
+                    await to_draft.put((key, r))
+        for _ in range(ticket_workers):
+            await to_draft.put(_DONE)
+
+    async def draft_worker():
+        while (item := await to_draft.get()) is not _DONE:
+            key, r = item
+            done = draft_checkpoint.get(key, digests.get(key)) if draft_checkpoint else None
+            if done is not None and os.path.exists(done):
+                written.append(done)
+                continue
+            try:
+                ticket = await asyncio.to_thread(draft_custodian_ticket, r, model, client, limiter)
+                if ticket:
+                    filename = ticket_path(r, out_dir)
+                    write_ticket(filename, ticket)
+                    written.append(filename)
+                    if draft_checkpoint:
+                        draft_checkpoint.put(key, filename, digests.get(key))
+            except Exception as e:
+                # No ticket and no checkpoint entry: a resumed run drafts it again
+                print(f"Drafting the ticket for {key} failed: {e}")
+
+    classifiers = [asyncio.create_task(classify_worker()) for _ in range(classify_workers)]
+
+    async def end_classification():
+        await asyncio.gather(*classifiers)
+        await classified_q.put(_DONE)
+
+    await _run_stages([
+        asyncio.create_task(produce()),
+        *classifiers,
+        asyncio.create_task(end_classification()),
+        asyncio.create_task(fan_out()),
+        *[asyncio.create_task(draft_worker()) for _ in range(ticket_workers)],
+    ])
+
+    if held_for_consolidation:
+        custodians = {r.get("CUSTODIAN") or "unknown" for r in held_for_consolidation}
+        held_for_consolidation += [
+            r for r in carried or []
+            if r and r.get("recommended_action") == "DRAFT_CUSTODIAN_TICKET"
+            and (r.get("CUSTODIAN") or "unknown") in custodians
+        ]
+        written += await asyncio.to_thread(
+            draft_custodian_tickets, held_for_consolidation, model, ticket_workers, True, out_dir
+        )
+
+    classified = [results[b["event_key"]] for b in breaks if b["event_key"] in results]
+    return classified, ranker.ranked(), written
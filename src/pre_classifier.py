@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from break_detector import CURRENCY_TOLERANCES, events_frame
+
+# Deterministic pre-classifier: resolves breaks whose cash difference is fully explained by
+# simple arithmetic on the fields the classifier agent would otherwise receive.
+# Only the breaks no rule explains are sent to the LLM.
+# Labels and actions are the ones used by agents.classifier_agent (CLASS_LABELS / RECOMMENDED_ACTIONS).
+
+# An explanation reconciles when |expected - actual| <= abs, in the settlement currency. The slack only
+# covers rounding of the recomputed amount; a larger residual is left to the classifier agent.
+RULE_TOLERANCE = {"abs": 0.05}
+
+# Per settlement currency overrides: currencies without minor units use break_detector's NET_AMOUNT_SC tolerance
+CURRENCY_RULE_TOLERANCES = {
+    ccy: {"abs": fields["NET_AMOUNT_SC"]["abs"]} for ccy, fields in CURRENCY_TOLERANCES.items() if "NET_AMOUNT_SC" in fields
+}
+
+# Multi-row keys carry ROW_COUNT / DUPLICATE_ROWS / NET_AMOUNT_SC_UNIQUE (see data_prcessing.group_totals)
+GROUP_FIELDS = ["ROW_COUNT", "DUPLICATE_ROWS", "NET_AMOUNT_SC_UNIQUE"]
+
+NBIM_FIELDS = [
+    "NET_AMOUNT_SC", "NET_AMOUNT_QC", "GROSS_AMOUNT_QC", "TAX_RATE", "DIV_RATE", "NOMINAL_BASIS", "CURRENCY_SC",
+    "CUSTODIAN", "ORGANISATION_NAME", "COAC_EVENT_KEY", "BANK_ACCOUNT",
+] + GROUP_FIELDS
+CUSTODY_FIELDS = [
+    "NET_AMOUNT_SC", "NET_AMOUNT_QC", "GROSS_AMOUNT_QC", "TAX_RATE", "DIV_RATE", "NOMINAL_BASIS",
+    "HOLDING_QUANTITY", "LOAN_QUANTITY", "CURRENCY_SC", "CUSTODIAN", "COAC_EVENT_KEY", "BANK_ACCOUNT",
+] + GROUP_FIELDS
+
+
+def _num(frame: pd.DataFrame, col: str) -> np.ndarray:
+    return pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=float)
+
+
+def _limits(f: pd.DataFrame, tolerance, currency_tolerances) -> np.ndarray:
+    """Absolute tolerance per event, by settlement currency (NBIM side, else custody)."""
+    currency = f["CURRENCY_SC_nbim"].fillna(f["CURRENCY_SC_custody"]).astype(object).to_numpy()
+    limit = np.full(len(f), float(tolerance["abs"]))
+    for ccy, override in currency_tolerances.items():
+        limit[currency == ccy] = override.get("abs", tolerance["abs"])
+    return limit
+
+
+def _explains(expected: np.ndarray, actual: np.ndarray, limit: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return np.abs(expected - actual) <= limit
+
+
+def _rule_masks(f: pd.DataFrame, limit):
+    """Vectorized rules (limit: absolute tolerance per event). Returns {rule: (mask, expected signed NBIM - custody net diff)}."""
+    status = f["match_status"].to_numpy()
+    matched = status == "matched"
+
+    delta = _num(f, "NET_AMOUNT_SC_nbim") - _num(f, "NET_AMOUNT_SC_custody")
+
+    # QC -> SC conversion implied by the custody (else NBIM) booking
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fx = _num(f, "NET_AMOUNT_SC_custody") / _num(f, "NET_AMOUNT_QC_custody")
+        fx = np.where(np.isfinite(fx), fx, _num(f, "NET_AMOUNT_SC_nbim") / _num(f, "NET_AMOUNT_QC_nbim"))
+
+    rate_nb, rate_cu = _num(f, "TAX_RATE_nbim"), _num(f, "TAX_RATE_custody")
+    div_nb, div_cu = _num(f, "DIV_RATE_nbim"), _num(f, "DIV_RATE_custody")
+    qty_nb = _num(f, "NOMINAL_BASIS_nbim")
+    gross_cu = _num(f, "GROSS_AMOUNT_QC_custody")
+
+    # Duplicate: dropping the rows booked twice (on either side) explains the net difference
+    rows_nb = np.nan_to_num(_num(f, "ROW_COUNT_nbim"), nan=1.0)
+    rows_cu = np.nan_to_num(_num(f, "ROW_COUNT_custody"), nan=1.0)
+    dups = np.nan_to_num(_num(f, "DUPLICATE_ROWS_nbim")) + np.nan_to_num(_num(f, "DUPLICATE_ROWS_custody"))
+    extra_nb = _num(f, "NET_AMOUNT_SC_nbim") - np.where(
+        np.isnan(_num(f, "NET_AMOUNT_SC_UNIQUE_nbim")), _num(f, "NET_AMOUNT_SC_nbim"), _num(f, "NET_AMOUNT_SC_UNIQUE_nbim"))
+    extra_cu = _num(f, "NET_AMOUNT_SC_custody") - np.where(
+        np.isnan(_num(f, "NET_AMOUNT_SC_UNIQUE_custody")), _num(f, "NET_AMOUNT_SC_custody"), _num(f, "NET_AMOUNT_SC_UNIQUE_custody"))
+    dup_expected = extra_nb - extra_cu
+    duplicate = matched & (dups > 0) & _explains(dup_expected, delta, limit)
+
+    # Partial: the sides booked the event on a different number of rows at the same rates (split payment
+    # with an outstanding or extra installment), and the part paid on one side plus the outstanding
+    # difference reconciles to the full entitlement booked on the other (quantity x rate net of tax)
+    net_nb, net_cu = _num(f, "NET_AMOUNT_SC_nbim"), _num(f, "NET_AMOUNT_SC_custody")
+    entitlement = qty_nb * div_nb * (1 - rate_nb / 100.0) * fx
+    full_nb = _explains(net_cu + delta, entitlement, limit)
+    full_cu = _explains(net_nb - delta, entitlement, limit)
+    partial_expected = np.where(full_nb, entitlement - net_cu, net_nb - entitlement)
+    partial = (
+        matched & ~duplicate & (rows_nb != rows_cu) & (div_nb == div_cu) & (rate_nb == rate_cu)
+        & (full_nb | full_cu)
+    )
+
+    # Tax: a different tax rate on the same gross explains the net difference
+    tax_expected = -(rate_nb - rate_cu) / 100.0 * gross_cu * fx
+    tax = matched & (rate_nb != rate_cu) & _explains(tax_expected, delta, limit)
+
+    # Rate: a different dividend per share on the same quantity explains it
+    rate_expected = (div_nb - div_cu) * qty_nb * (1 - rate_nb / 100.0) * fx
+    rate = matched & (div_nb != div_cu) & _explains(rate_expected, delta, limit)
+
+    # Quantity / lending: custody paid on a different number of shares than NBIM's entitlement
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qty_paid = gross_cu / div_cu
+    qty_expected = (qty_nb - qty_paid) * div_nb * (1 - rate_nb / 100.0) * fx
+    quantity = matched & (np.abs(qty_nb - qty_paid) >= 0.5) & _explains(qty_expected, delta, limit)
+
+    return {
+        "MISSING_RECORD": (~matched, delta),
+        "DUPLICATE_OR_PARTIAL": (duplicate | partial, np.where(duplicate, dup_expected, partial_expected)),
+        "AMOUNT_MISMATCH_TAX": (tax, tax_expected),
+        "AMOUNT_MISMATCH_RATE": (rate, rate_expected),
+        "QUANTITY_OR_LENDING_MISMATCH": (quantity, qty_expected),
+    }, qty_paid
+
+
+def _fmt(x, spec: str = ",.2f") -> str:
+    return "n/a" if x is None or pd.isna(x) else format(x, spec)
+
+
+def _qty(x) -> str:
+    return _fmt(x, ",.0f")
+
+
+def _pct(x) -> str:
+    return _fmt(x, "g")
+
+
+def _result(b, label, confidence, action, description, evidence, notes):
+    row = b.get("nbim_rows") or b.get("custody_rows") or {}
+    return {
+        "event_key": b.get("event_key"),
+        "COAC_EVENT_KEY": row.get("COAC_EVENT_KEY"),
+        "BANK_ACCOUNT": row.get("BANK_ACCOUNT"),
+        "CUSTODIAN": (b.get("custody_rows") or row).get("CUSTODIAN"),
+        "ORGANISATION_NAME": (b.get("nbim_rows") or {}).get("ORGANISATION_NAME"),
+        "classification": label,
+        "description": description,
+        "confidence": confidence,
+        "recommended_action": action,
+        "action_params": {"evidence": evidence, "notes": notes},
+        "NET_AMOUNT_SC_DIFF": b.get("NET_AMOUNT_SC_DIFF"),
+        "SETTLEMENT_CURRENCY": row.get("CURRENCY_SC"),
+        "classified_by": "rules",
+    }
+
+
+def _explain(b, label, r, expected, qty_paid):
+    nb, cu = b.get("nbim_rows") or {}, b.get("custody_rows") or {}
+    ccy = (nb or cu).get("CURRENCY_SC") or ""
+    cash = f"NBIM NET_AMOUNT_SC {_fmt(nb.get('NET_AMOUNT_SC'))} vs Custody {_fmt(cu.get('NET_AMOUNT_SC'))} {ccy}"
+
+    if label == "MISSING_RECORD":
+        # A likely counterpart under another key (candidate_index) makes it a probable mis-keyed booking
+        candidates = b.get("candidate_matches") or []
+        best = candidates[0] if candidates else None
+        hint = [] if best is None else [
+            f"Possible counterpart under COAC {best.get('COAC_EVENT_KEY')} / account {best.get('BANK_ACCOUNT')} "
+            f"(same {best.get('matched_on')}, pay date {best.get('PAY_DATE')}, NET_AMOUNT_SC {_fmt(best.get('NET_AMOUNT_SC'))})"
+        ]
+        confidence = 0.95 if best is None else 0.7
+        if b.get("custody_rows") is None:
+            return _result(
+                b, label, confidence, "DRAFT_CUSTODIAN_TICKET",
+                "NBIM has booked this dividend but custody reports no corresponding record"
+                + (" under the same COAC event and bank account." if best else "."),
+                [f"NBIM NET_AMOUNT_SC {_fmt(nb.get('NET_AMOUNT_SC'))} {ccy}", "No custody booking for this COAC event and bank account"] + hint,
+                "Ask the custodian to confirm entitlement and payment status"
+                + (" and whether the payment was booked under the candidate event / account." if best else "."),
+            )
+        return _result(
+            b, label, confidence, "PROPOSE_NBIM_CORRECTION",
+            "Custody reports a dividend payment that NBIM has not booked"
+            + (" under the same COAC event and bank account." if best else "."),
+            [f"Custody NET_AMOUNT_SC {_fmt(cu.get('NET_AMOUNT_SC'))} {ccy}", "No NBIM booking for this COAC event and bank account"] + hint,
+            "Check whether NBIM booked this payment under the candidate event / account and correct the key"
+            if best else "Review the NBIM event setup and book the missing dividend if the entitlement is confirmed.",
+        )
+
+    explained = f"Expected difference from the rule {_fmt(expected)} {ccy} vs observed {_fmt(r)} {ccy}"
+    if label == "DUPLICATE_OR_PARTIAL":
+        rows = f"NBIM rows {nb.get('ROW_COUNT') or 1} vs custody rows {cu.get('ROW_COUNT') or 1}"
+        dup_side = "custody" if cu.get("DUPLICATE_ROWS") else "NBIM" if nb.get("DUPLICATE_ROWS") else None
+        if dup_side:
+            return _result(
+                b, label, 0.9, "DRAFT_CUSTODIAN_TICKET" if dup_side == "custody" else "PROPOSE_NBIM_CORRECTION",
+                f"The {dup_side} side booked the same dividend payment more than once; "
+                "the duplicated rows explain the cash difference.",
+                [cash, rows, f"Duplicate rows NBIM {nb.get('DUPLICATE_ROWS') or 0} vs custody {cu.get('DUPLICATE_ROWS') or 0}", explained],
+                "Ask the custodian to reverse the duplicate booking." if dup_side == "custody"
+                else "Reverse the duplicate NBIM booking.",
+            )
+        return _result(
+            b, label, 0.75, "DRAFT_CUSTODIAN_TICKET",
+            "The dividend was booked in several partial payments at the same dividend and tax rates, "
+            "and the installments do not add up to the same amount on both sides.",
+            [cash, rows, f"DIV_RATE {nb.get('DIV_RATE')} and TAX_RATE {_pct(nb.get('TAX_RATE'))} agree", explained],
+            "Ask the custodian whether further installments are outstanding or one was paid in excess.",
+        )
+    if label == "AMOUNT_MISMATCH_TAX":
+        return _result(
+            b, label, 0.9, "DRAFT_CUSTODIAN_TICKET",
+            f"NBIM applied a {_pct(nb.get('TAX_RATE'))}% tax rate while custody applied {_pct(cu.get('TAX_RATE'))}%; "
+            "the rate difference on the gross amount explains the cash difference.",
+            [cash, f"TAX_RATE NBIM {_pct(nb.get('TAX_RATE'))} vs Custody {_pct(cu.get('TAX_RATE'))}", explained],
+            "Confirm the applicable withholding / treaty rate with the custodian and align the booking.",
+        )
+    if label == "AMOUNT_MISMATCH_RATE":
+        return _result(
+            b, label, 0.9, "DRAFT_CUSTODIAN_TICKET",
+            f"NBIM used a dividend rate of {nb.get('DIV_RATE')} while custody used {cu.get('DIV_RATE')}; "
+            "the rate difference on the position explains the cash difference.",
+            [cash, f"DIV_RATE NBIM {nb.get('DIV_RATE')} vs Custody {cu.get('DIV_RATE')}", explained],
+            "Confirm the declared dividend per share with the custodian.",
+        )
+
+    loan = cu.get("LOAN_QUANTITY") or 0
+    lending = bool(loan) and abs((nb.get("NOMINAL_BASIS") or 0) - qty_paid - loan) < 0.5
+    return _result(
+        b, label, 0.9, "DRAFT_CUSTODIAN_TICKET",
+        f"Custody paid on {_qty(qty_paid)} shares while NBIM's entitlement is {_qty(nb.get('NOMINAL_BASIS'))} shares"
+        + ("; the gap equals the shares on loan." if lending else "; the quantity difference explains the cash difference."),
+        [
+            cash,
+            f"NBIM NOMINAL_BASIS {_qty(nb.get('NOMINAL_BASIS'))} vs custody quantity paid {_qty(qty_paid)} "
+            f"(custody NOMINAL_BASIS {_qty(cu.get('NOMINAL_BASIS'))}, HOLDING_QUANTITY {_qty(cu.get('HOLDING_QUANTITY'))}, "
+            f"LOAN_QUANTITY {_qty(loan)})",
+            explained,
+        ],
+        "Confirm the entitled quantity at record date"
+        + (" and the lending compensation for the shares on loan." if lending else "."),
+    )
+
+
+def pre_classify(breaks, tolerance=None, currency_tolerances=None):
+    """
+    Classify the breaks that simple arithmetic explains within tolerance (RULE_TOLERANCE, with
+    CURRENCY_RULE_TOLERANCES by settlement currency). Returns (resolved, remaining): resolved are
+    classifier-shaped results, remaining the untouched breaks that still need the LLM.
+    """
+    if not breaks:
+        return [], []
+    tolerance = {**RULE_TOLERANCE, **(tolerance or {})}
+    currency_tolerances = CURRENCY_RULE_TOLERANCES if currency_tolerances is None else currency_tolerances
+
+    frame = events_frame(breaks, NBIM_FIELDS, CUSTODY_FIELDS)
+    rules, qty_paid = _rule_masks(frame, _limits(frame, tolerance, currency_tolerances))
+
+    labels = list(rules)
+    masks = [m for m, _ in rules.values()]
+    # First matching rule wins (order of the dict above)
+    chosen = np.select(masks, range(len(labels)), default=-1)
+    signed = _num(frame, "NET_AMOUNT_SC_nbim") - _num(frame, "NET_AMOUNT_SC_custody")
+
+    resolved, remaining = [], []
+    for i, b in enumerate(breaks):
+        if chosen[i] < 0:
+            remaining.append(b)
+            continue
+        label = labels[chosen[i]]
+        resolved.append(_explain(b, label, signed[i], rules[label][1][i], qty_paid[i]))
+    return resolved, remaining
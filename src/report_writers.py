@@ -0,0 +1,274 @@
+import os
+import json
+from pathlib import Path
+from typing import Dict, Any, Iterator, List
+import pandas as pd
+
+# Streaming report outputs: append-only JSON Lines (one record per line, flushed as it is written)
+# and optional Parquet files with a fixed schema (needs pyarrow), plus lazy / chunked readers.
+
+CLASSIFIED_FIELDS = {
+    "event_key": "string",
+    "COAC_EVENT_KEY": "string",
+    "BANK_ACCOUNT": "string",
+    "CUSTODIAN": "string",
+    "ORGANISATION_NAME": "string",
+    "classification": "string",
+    "description": "string",
+    "confidence": "double",
+    "recommended_action": "string",
+    "evidence": "list<string>",
+    "notes": "string",
+    "NET_AMOUNT_SC_DIFF": "double",
+    "SETTLEMENT_CURRENCY": "string",
+    "classified_by": "string",
+    "error": "string",
+}
+
+PRIORITIZED_FIELDS = {
+    "COAC_EVENT_KEY": "string",
+    "BANK_ACCOUNT": "string",
+    "priority": "int64",
+    "reason": "string",
+    "score": "double",
+}
+
+BREAK_FIELDS = {
+    "event_key": "string",
+    "COAC_EVENT_KEY": "string",
+    "BANK_ACCOUNT": "string",
+    "CUSTODIAN": "string",
+    "ORGANISATION_NAME": "string",
+    "match_status": "string",
+    "BREAK_REASONS": "list<string>",
+    "NET_AMOUNT_SC_NBIM": "double",
+    "NET_AMOUNT_SC_CUSTODY": "double",
+    "NET_AMOUNT_SC_DIFF": "double",
+    "CURRENCY_SC": "string",
+}
+
+
+class JsonlWriter:
+    """
+    Append-only JSON Lines writer; each record is flushed as soon as it is written.
+    `transform` maps each record before it is written (same record shape as the Parquet writer).
+    """
+
+    def __init__(self, path: str, append: bool = False, transform=None):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+        self.transform = transform
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]):
+        if self.transform:
+            record = self.transform(record)
+        self._f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _arrow_schema(fields: Dict[str, str]):
+    import pyarrow as pa
+
+    types = {"string": pa.string(), "double": pa.float64(), "int64": pa.int64(), "list<string>": pa.list_(pa.string())}
+    return pa.schema([(name, types[kind]) for name, kind in fields.items()])
+
+
+def _coerce(value, kind: str):
+    """Fit an (LLM-produced) value to the schema type; unusable values become null."""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    try:
+        if kind == "double":
+            return float(value)
+        if kind == "int64":
+            return int(value)
+        if kind == "list<string>":
+            return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def flatten_classified(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Classified record with action_params split into evidence / notes (as in the Excel report)."""
+    params = record.get("action_params") if isinstance(record.get("action_params"), dict) else {}
+    out = {k: v for k, v in record.items() if k != "action_params"}
+    out["evidence"] = params.get("evidence")
+    out["notes"] = params.get("notes")
+    return out
+
+
+def flatten_break(b: Dict[str, Any]) -> Dict[str, Any]:
+    """Detected break with the key fields and both net amounts lifted out of nbim_rows / custody_rows."""
+    nb, cu = b.get("nbim_rows") or {}, b.get("custody_rows") or {}
+    side = nb or cu
+    return {
+        "event_key": b.get("event_key"),
+        "COAC_EVENT_KEY": side.get("COAC_EVENT_KEY"),
+        "BANK_ACCOUNT": side.get("BANK_ACCOUNT"),
+        "CUSTODIAN": side.get("CUSTODIAN"),
+        "ORGANISATION_NAME": side.get("ORGANISATION_NAME"),
+        "match_status": b.get("match_status"),
+        "BREAK_REASONS": b.get("BREAK_REASONS"),
+        "NET_AMOUNT_SC_NBIM": nb.get("NET_AMOUNT_SC"),
+        "NET_AMOUNT_SC_CUSTODY": cu.get("NET_AMOUNT_SC"),
+        "NET_AMOUNT_SC_DIFF": b.get("NET_AMOUNT_SC_DIFF"),
+        "CURRENCY_SC": side.get("CURRENCY_SC"),
+    }
+
+
+class ParquetWriter:
+    """
+    Parquet writer with a fixed schema; records are buffered and written as row groups of
+    `row_group_size`, so memory stays bounded. Needs pyarrow.
+    """
+
+    def __init__(self, path: str, fields: Dict[str, str], row_group_size: int = 10_000, transform=None):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.fields = fields
+        self.row_group_size = row_group_size
+        self.transform = transform
+        self.schema = _arrow_schema(fields)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._writer = pq.ParquetWriter(path, self.schema)
+        self._rows: List[Dict[str, Any]] = []
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]):
+        if self.transform:
+            record = self.transform(record)
+        self._rows.append({name: _coerce(record.get(name), kind) for name, kind in self.fields.items()})
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        import pyarrow as pa
+
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReportWriters:
+    """Fan one stream of records out to several writers (e.g. JSONL + Parquet)."""
+
+    def __init__(self, writers):
+        self.writers = list(writers)
+
+    def write(self, record: Dict[str, Any]):
+        for w in self.writers:
+            w.write(record)
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        for w in self.writers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def report_writers(stem: str, formats, fields: Dict[str, str], transform=None, append: bool = False) -> ReportWriters:
+    """Writers for `stem`.jsonl / `stem`.parquet according to formats (e.g. {"jsonl", "parquet"})."""
+    writers = []
+    if "jsonl" in formats:
+        writers.append(JsonlWriter(f"{stem}.jsonl", append=append, transform=transform))
+    if "parquet" in formats:
+        writers.append(ParquetWriter(f"{stem}.parquet", fields, transform=transform))
+    return ReportWriters(writers)
+
+
+def report_formats() -> set:
+    """REPORT_FORMATS: comma-separated subset of json, jsonl, parquet (default json,jsonl)."""
+    return {f.strip().lower() for f in (os.getenv("REPORT_FORMATS") or "json,jsonl").split(",") if f.strip()}
+
+
+# --- Readers ---
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON Lines file, read lazily. A truncated last line (interrupted run) is skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith("\n"):
+                    raise
+
+
+def iter_report_chunks(path: str, chunksize: int = 10_000) -> Iterator[pd.DataFrame]:
+    """DataFrames of at most chunksize records from a .jsonl, .parquet or .json report."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    records = iter_jsonl(path) if suffix == ".jsonl" else iter(read_report(path))
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunksize:
+            yield pd.DataFrame(chunk)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk)
+
+
+def read_report(path: str) -> List[Dict[str, Any]]:
+    """All records of a report; prioritized .json files are unwrapped from {"reconciliation_breaks": [...]}."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".jsonl":
+        return list(iter_jsonl(path))
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path).to_pylist()
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("reconciliation_breaks", []) if isinstance(data, dict) else data
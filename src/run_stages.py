@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+from report_writers import report_writers, flatten_break, BREAK_FIELDS, PRIORITIZED_FIELDS
+
+# --- Stages and the report / run-state steps shared by a one-off run (main.py) and watch mode (watcher.py) ---
+# The LLM agents and the Excel writer are imported inside the steps that use them, so a detect-only
+# run only loads pandas and the detection modules.
+
+# stage -> prerequisite stages
+STAGES = {
+    "detect": [],
+    "classify": ["detect"],
+    "prioritize": ["classify"],
+    "draft": ["classify"],
+    "export": ["prioritize"],
+}
+
+REPORTS_DIR = "reports"
+TICKETS_DIR = "drafted_tickets"
+
+
+def with_prerequisites(stages) -> list:
+    """The selected stages plus everything they depend on, in pipeline order."""
+    needed, todo = set(), list(stages)
+    while todo:
+        name = todo.pop()
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage {name!r}; choose from {', '.join(STAGES)}")
+        if name not in needed:
+            needed.add(name)
+            todo.extend(STAGES[name])
+    return [name for name in STAGES if name in needed]
+
+
+def write_report(stem: str, formats, fields, records, payload=None, transform=None):
+    """Rewrite `stem`.jsonl / .parquet from records, and `stem`.json from payload (default: the records)."""
+    with report_writers(stem, formats, fields, transform) as out:
+        out.write_many(records)
+    if "json" in formats:
+        with open(f"{stem}.json", "w", encoding="utf-8") as f:
+            json.dump(records if payload is None else payload, f, ensure_ascii=False, indent=2, default=str)
+
+
+def write_detected(breaks: list, formats, reports_dir: str = REPORTS_DIR):
+    """Detect-only report of the breaks, without classifications."""
+    stem = os.path.join(reports_dir, "detected_breaks")
+    write_report(stem, formats, BREAK_FIELDS, breaks, transform=flatten_break)
+    print(f"✅ Wrote {len(breaks)} detected breaks to {stem}.* ({', '.join(sorted(formats))})")
+
+
+async def prioritize(classified: list, prioritized: dict):
+    from agents.prioritizer_agent import prioritize_breaks, explain_priorities_async
+
+    if os.getenv("PRIORITIZER_MODE") == "llm":
+        # Legacy: one LLM call ordering the whole list
+        return await asyncio.to_thread(prioritize_breaks, classified)
+
+    # Deterministic ranking from the pipeline; optional short LLM reasons for the top N
+    top_n = int(os.getenv("PRIORITIZER_LLM_REASONS") or 0)
+    if top_n:
+        await explain_priorities_async(prioritized["reconciliation_breaks"][:top_n], classified)
+    return prioritized
+
+
+async def prioritize_stage(metrics, classified: list, prioritized: dict, formats, reports_dir: str = REPORTS_DIR) -> dict:
+    """The prioritize stage: final ordering (see prioritize) written to prioritized_breaks.*."""
+    with metrics.stage("prioritize"):
+        prioritized = await prioritize(classified, prioritized)
+
+    stem = os.path.join(reports_dir, "prioritized_breaks")
+    records = prioritized.get("reconciliation_breaks", [])
+    write_report(stem, formats, PRIORITIZED_FIELDS, records, prioritized)
+    print(f"✅ Wrote {len(records)} prioritized breaks to {stem}.* ({', '.join(sorted(formats))})")
+    return prioritized
+
+
+def export_stage(metrics, prioritized: dict, classified: list, excel_path: str):
+    """The export stage: combine the in-memory results into the Excel report."""
+    from write_to_excel import export_combined
+
+    with metrics.stage("excel") as stage:
+        export_combined(prioritized, classified, excel_path)
+        stage["items"] = len(classified)
+
+
+def ticket_paths(breaks: list, classified: list, written: list, out_dir: str = TICKETS_DIR) -> dict:
+    """event_key -> path of the ticket written for it in this run."""
+    from agents.remediation_agent import ticket_path, consolidated_ticket_path
+
+    written = set(written)
+    consolidate = os.getenv("TICKETS_CONSOLIDATE") == "1"
+    tickets = {}
+    for b, r in zip(breaks, classified):
+        path = consolidated_ticket_path(r.get("CUSTODIAN"), out_dir) if consolidate else ticket_path(r, out_dir)
+        if path in written:
+            tickets[b["event_key"]] = path
+    return tickets
+
+
+def record_run(state, fingerprints: dict, breaks: list, classified: list, written: list, vanished,
+               prioritized: dict = None, tickets_dir: str = TICKETS_DIR):
+    """
+    Persist a classified run in the run state: the fingerprints of the reprocessed events, their breaks,
+    classifications and tickets, the events that are gone, and the priorities when the run ranked them.
+    """
+    state.record(fingerprints, breaks, classified, ticket_paths(breaks, classified, written, tickets_dir))
+    state.close_events(vanished)
+    if prioritized is not None:
+        state.set_priorities(prioritized)
+
+
+def write_metrics(metrics, reports_dir: str = REPORTS_DIR):
+    summary_path, prom_path = metrics.write(os.getenv("METRICS_PATH") or os.path.join(reports_dir, "run_metrics"))
+    totals = metrics.summary()["llm_totals"]
+    if totals["calls"]:
+        print(f"LLM calls: {totals['calls']} ({totals['errors']} failed), {totals['prompt_tokens']} prompt + "
+              f"{totals['completion_tokens']} completion tokens, ~${totals['cost_usd']:.4f}")
+    print(f"✅ Wrote run metrics to {summary_path} and {prom_path}")
@@ -0,0 +1,127 @@
+import json, time, sqlite3, threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable
+
+# --- Persisted run state for incremental reconciliation (SQLite) ---
+# One row per event_key (COAC_EVENT_KEY|BANK_ACCOUNT): fingerprint of the normalized input rows
+# and the last detected break, classification, priority and ticket.
+# status: open (a break), clean (both sides agree), closed (no longer in the inputs).
+
+STATE_PATH = "cache/run_state.sqlite"
+
+
+def _dumps(value) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _loads(value):
+    return None if value is None else json.loads(value)
+
+
+class RunState:
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " event_key TEXT PRIMARY KEY, fingerprint TEXT, status TEXT NOT NULL,"
+                " break TEXT, classification TEXT, priority TEXT, ticket TEXT, updated REAL NOT NULL)"
+            )
+
+    def fingerprints(self) -> Dict[str, str]:
+        """Fingerprints of the events seen in the last run (closed ones excluded)."""
+        with self._lock:
+            rows = self._db.execute("SELECT event_key, fingerprint FROM events WHERE status != 'closed'")
+            return dict(rows.fetchall())
+
+    def diff(self, current: Dict[str, str]):
+        """
+        Compare current fingerprints with the stored ones.
+        Returns (changed, unchanged, vanished) event_key sets: changed covers new keys, changed
+        fingerprints and open breaks whose classification failed; vanished keys are gone from the inputs.
+        """
+        previous = self.fingerprints()
+        with self._lock:
+            failed = {
+                key for key, classification in self._db.execute(
+                    "SELECT event_key, classification FROM events WHERE status = 'open'"
+                )
+                if (_loads(classification) or {}).get("error") is not None or classification is None
+            }
+        changed = {k for k, fp in current.items() if previous.get(k) != fp or k in failed}
+        unchanged = set(current) - changed
+        vanished = set(previous) - set(current)
+        return changed, unchanged, vanished
+
+    def open_breaks(self, event_keys: Iterable[str]):
+        """(break, classification) pairs carried forward for open events among event_keys."""
+        wanted = set(event_keys)
+        out = []
+        with self._lock:
+            for key, brk, classification in self._db.execute(
+                "SELECT event_key, break, classification FROM events WHERE status = 'open'"
+            ):
+                if key in wanted:
+                    out.append((_loads(brk), _loads(classification)))
+        return out
+
+    def record(self, fingerprints: Dict[str, str], breaks: List[Dict[str, Any]],
+               classified: List[Dict[str, Any]], tickets: Dict[str, str] = None):
+        """
+        Store the outcome for the re-processed events: keys in `breaks` become open with their
+        classification (classified[i] belongs to breaks[i]) and ticket path, the other keys of
+        `fingerprints` become clean.
+        """
+        tickets = tickets or {}
+        by_key = {b["event_key"]: r for b, r in zip(breaks, classified)}
+        breaks_by_key = {b["event_key"]: b for b in breaks}
+        now = time.time()
+        rows = []
+        for key, fp in fingerprints.items():
+            brk = breaks_by_key.get(key)
+            if brk is None:
+                rows.append((key, fp, "clean", None, None, None, None, now))
+            else:
+                rows.append((key, fp, "open", _dumps(brk), _dumps(by_key.get(key)), None, tickets.get(key), now))
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO events (event_key, fingerprint, status, break, classification, priority, ticket, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(event_key) DO UPDATE SET fingerprint = excluded.fingerprint, status = excluded.status,"
+                " break = excluded.break, classification = excluded.classification, priority = excluded.priority,"
+                " ticket = COALESCE(excluded.ticket, CASE WHEN excluded.status = 'open' THEN events.ticket END),"
+                " updated = excluded.updated",
+                rows,
+            )
+
+    def set_priorities(self, prioritized: Dict[str, Any]):
+        """Store the current priority entry of every ranked break."""
+        rows = [
+            (_dumps(entry), f"{entry.get('COAC_EVENT_KEY')}|{entry.get('BANK_ACCOUNT')}")
+            for entry in prioritized.get("reconciliation_breaks", [])
+        ]
+        with self._lock, self._db:
+            self._db.executemany("UPDATE events SET priority = ? WHERE event_key = ?", rows)
+
+    def close_events(self, event_keys: Iterable[str]):
+        """Mark events that disappeared from the inputs as closed."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE events SET status = 'closed', updated = ? WHERE event_key = ?",
+                [(now, k) for k in event_keys],
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM events GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
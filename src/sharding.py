@@ -0,0 +1,122 @@
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple
+import numpy as np
+import pandas as pd
+from data_prcessing import (
+    NBIM_SCHEMA, CUSTODY_SCHEMA, NBIM_COLUMN_MAP, CUSTODY_COLUMN_MAP,
+    join_events, partition_of, schema_dtypes, read_partition,
+)
+from break_detector import DETECTOR_COLUMNS, detect_breaks_frame, to_break_events
+from pre_classifier import pre_classify
+from candidate_index import attach_candidates
+
+# --- Multi-process sharded reconciliation ---
+# Both booking files are split into byte ranges that worker processes parse in parallel, spilling
+# their rows to disk hash-partitioned by BANK_ACCOUNT. A second pass joins, detects and
+# pre-classifies each shard in its own process. BANK_ACCOUNT is part of the event key, so every
+# event lands in exactly one shard on both sides. Results are merged back in key order.
+
+SHARD_COLUMN = "BANK_ACCOUNT"
+
+
+def _byte_ranges(path: str, parts: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """Header line and up to `parts` (start, end) byte ranges of the data lines, split on line boundaries."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        bounds = [len(header)]
+        for i in range(1, parts):
+            target = len(header) + (size - len(header)) * i // parts
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()  # finish the line that straddles the target
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+        bounds.append(size)
+    return header, [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _spill_range(path: str, header: bytes, start: int, end: int, side: str, block: int,
+                 shards: int, workdir: str) -> Dict[int, str]:
+    """Parse one byte range of a booking file and write its rows per shard. Returns shard -> spill file."""
+    schema, column_map = (NBIM_SCHEMA, NBIM_COLUMN_MAP) if side == "nbim" else (CUSTODY_SCHEMA, CUSTODY_COLUMN_MAP)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    columns = pd.read_csv(io.BytesIO(header), sep=";", nrows=0).columns
+    dtype = schema_dtypes(columns, schema)
+    df = pd.read_csv(io.BytesIO(header + data), sep=";", dtype=dtype).rename(columns=column_map)
+
+    part = partition_of(df, shards, [SHARD_COLUMN])
+    files = {}
+    for p in np.unique(part):
+        out = os.path.join(workdir, f"{side}_s{p}_b{block}.pkl")
+        df[part == p].to_pickle(out)
+        files[int(p)] = out
+    return files
+
+
+def _reconcile_shard(nbim_files: List[str], custody_files: List[str]):
+    """Join, detect and pre-classify one shard. Returns (breaks, resolved)."""
+    nbim = read_partition(nbim_files, NBIM_SCHEMA, NBIM_COLUMN_MAP)
+    custody = read_partition(custody_files, CUSTODY_SCHEMA, CUSTODY_COLUMN_MAP)
+    joined = join_events(nbim, custody, columns=DETECTOR_COLUMNS)
+    breaks = to_break_events(detect_breaks_frame(joined), nbim, custody)
+    resolved, _ = pre_classify(breaks)
+    return breaks, resolved
+
+
+def reconcile_sharded(nbim_path: str, custody_path: str, shards: int = None, workers: int = None,
+                      workdir: str = None):
+    """
+    Load, detect and pre-classify both booking files on a process pool, sharded by BANK_ACCOUNT.
+    Orphan candidates (candidate_index) are attached after the merge.
+    Returns (breaks, resolved) in the same key order as the streaming path (same explicit schemas).
+    Assumes no quoted newlines in the CSVs (true for the booking exports).
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+
+    with tempfile.TemporaryDirectory(dir=workdir, prefix="recon_shards_") as tmp, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        # --- Pass 1: parse byte ranges in parallel and spill rows per shard ---
+        spills = []
+        for side, path in (("nbim", nbim_path), ("custody", custody_path)):
+            header, ranges = _byte_ranges(path, workers)
+            for block, (start, end) in enumerate(ranges):
+                spills.append((side, pool.submit(_spill_range, path, header, start, end, side, block, shards, tmp)))
+
+        files = {"nbim": [[] for _ in range(shards)], "custody": [[] for _ in range(shards)]}
+        for side, future in spills:  # submission order keeps the file order within a shard
+            for p, out in future.result().items():
+                files[side][p].append(out)
+
+        # --- Pass 2: reconcile each shard in its own process ---
+        results = [
+            pool.submit(_reconcile_shard, files["nbim"][p], files["custody"][p])
+            for p in range(shards)
+            if files["nbim"][p] or files["custody"][p]
+        ]
+        breaks, resolved = [], []
+        for future in results:
+            shard_breaks, shard_resolved = future.result()
+            breaks.extend(shard_breaks)
+            resolved.extend(shard_resolved)
+
+    # Deterministic merge: key order, as in the in-memory and streaming paths
+    breaks.sort(key=lambda b: b["key_tuple"])
+    position = {b["event_key"]: i for i, b in enumerate(breaks)}
+    resolved.sort(key=lambda r: position[r["event_key"]])
+
+    # Orphan counterparts usually sit on another bank account, i.e. in another shard:
+    # match them on the merged breaks and re-explain the orphans that got candidates
+    if attach_candidates(breaks):
+        refreshed, _ = pre_classify([b for b in breaks if b.get("candidate_matches")])
+        refreshed = {r["event_key"]: r for r in refreshed}
+        resolved = [refreshed.get(r["event_key"], r) for r in resolved]
+    return breaks, resolved
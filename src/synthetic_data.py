@@ -0,0 +1,228 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from data_prcessing import NBIM_SCHEMA, CUSTODY_SCHEMA
+
+# Synthetic NBIM / custody dividend bookings with the real (raw) column sets, for scaling tests.
+# Rows are generated in chunks, so 10M-row files need little memory. A fraction of the events get
+# a controlled break; the ground truth is written next to the CSVs (synthetic_breaks.csv).
+
+BREAK_TYPES = ["tax", "rate", "quantity", "missing", "duplicate", "date"]
+
+DEFAULT_MIX = {"tax": 0.25, "rate": 0.15, "quantity": 0.2, "missing": 0.15, "duplicate": 0.1, "date": 0.15}
+
+# Quotation currency -> (settlement currency, QC per SC, NBIM portfolio FX, custodian code, NBIM custodian)
+MARKETS = {
+    "USD": ("USD", 1.0, 11.2345, "CUST/JPMORGANUS", "JPMORGAN_CHASE"),
+    "EUR": ("EUR", 1.0, 11.7012, "CUST/BNPPFR", "BNP_PARIBAS"),
+    "GBP": ("GBP", 1.0, 13.4520, "CUST/CITIGB", "CITIBANK_UK"),
+    "CHF": ("CHF", 1.0, 12.1055, "CUST/UBSCH", "UBS_SWITZERLAND"),
+    "JPY": ("JPY", 1.0, 0.0752, "CUST/MIZUHOJP", "MIZUHO_JAPAN"),
+    "KRW": ("USD", 1307.25, 0.008234, "CUST/HSBCKR", "HSBC_KOREA"),
+}
+TAX_RATES = np.array([0.0, 10.0, 15.0, 20.0, 25.0, 30.0, 35.0])
+
+NBIM_FILE = "NBIM_Dividend_Bookings.csv"
+CUSTODY_FILE = "CUSTODY_Dividend_Bookings.csv"
+TRUTH_FILE = "synthetic_breaks.csv"
+
+
+# dd.mm.YYYY strings by day offset from 2024-01-01 (formatting once beats strftime per row)
+_DATE_STRINGS = pd.date_range("2024-01-01", periods=800, freq="D").strftime("%d.%m.%Y").to_numpy()
+
+
+def _dates(days: np.ndarray) -> np.ndarray:
+    return _DATE_STRINGS[days]
+
+
+def _chunk(start: int, n: int, rng: np.random.Generator, break_rate: float, mix):
+    """Clean bookings for events start..start+n, the break type per event ('' = none) and the pay day offsets."""
+    i = np.arange(start, start + n)
+    coac = 900_000_000 + i // 3
+    bank = 500_000_000 + (i % 3) * 1_000_000 + (i // 3) % 1_000_000
+
+    qc = rng.choice(list(MARKETS), size=n)
+    market = pd.DataFrame.from_dict(MARKETS, orient="index", columns=["sc", "qc_per_sc", "fx_port", "custodian_cu", "custodian_nb"])
+    m = market.loc[qc].reset_index(drop=True)
+
+    issuer = rng.integers(0, 5_000, size=n)
+    nominal = rng.integers(1_000, 2_000_000, size=n).astype(float)
+    div_rate = np.round(rng.uniform(0.05, 5.0, size=n) * np.where(qc == "KRW", 300, np.where(qc == "JPY", 40, 1)), 4)
+    tax_rate = rng.choice(TAX_RATES, size=n)
+    ex = rng.integers(0, 700, size=n)
+
+    gross = nominal * div_rate
+    tax = gross * tax_rate / 100.0
+    net_qc = gross - tax
+    net_sc = np.round(net_qc / m["qc_per_sc"].to_numpy(), 2)
+
+    kinds = np.where(rng.random(n) < break_rate, rng.choice(list(mix), size=n, p=np.array(list(mix.values())) / sum(mix.values())), "")
+
+    ccy_label = np.where(m["sc"].to_numpy() != qc, qc + " " + m["sc"].to_numpy(), qc)
+    nbim = pd.DataFrame({
+        "COAC_EVENT_KEY": coac,
+        "INSTRUMENT_DESCRIPTION": np.char.add("SYNTHETIC ISSUER ", issuer.astype(str)),
+        "ISIN": np.char.add("XS", np.char.zfill(issuer.astype(str), 10)),
+        "SEDOL": np.char.zfill((issuer + 1_000_000).astype(str), 7),
+        "TICKER": np.char.add("SYN", issuer.astype(str)),
+        "ORGANISATION_NAME": np.char.add("Synthetic Issuer ", issuer.astype(str)),
+        "DIVIDENDS_PER_SHARE": div_rate,
+        "EXDATE": _dates(ex),
+        "PAYMENT_DATE": _dates(ex + 7),
+        "CUSTODIAN": m["custodian_nb"].to_numpy(),
+        "BANK_ACCOUNT": bank,
+        "QUOTATION_CURRENCY": qc,
+        "SETTLEMENT_CURRENCY": m["sc"].to_numpy(),
+        "AVG_FX_RATE_QUOTATION_TO_PORTFOLIO": m["fx_port"].to_numpy(),
+        "NOMINAL_BASIS": nominal,
+        "GROSS_AMOUNT_QUOTATION": np.round(gross, 2),
+        "NET_AMOUNT_QUOTATION": np.round(net_qc, 2),
+        "NET_AMOUNT_SETTLEMENT": net_sc,
+        "GROSS_AMOUNT_PORTFOLIO": np.round(gross * m["fx_port"].to_numpy(), 2),
+        "NET_AMOUNT_PORTFOLIO": np.round(net_qc * m["fx_port"].to_numpy(), 2),
+        "WTHTAX_COST_QUOTATION": np.round(tax, 2),
+        "WTHTAX_COST_SETTLEMENT": np.round(tax / m["qc_per_sc"].to_numpy(), 2),
+        "WTHTAX_COST_PORTFOLIO": np.round(tax * m["fx_port"].to_numpy(), 2),
+        "WTHTAX_RATE": tax_rate,
+        "LOCALTAX_COST_QUOTATION": 0.0,
+        "LOCALTAX_COST_SETTLEMENT": 0.0,
+        "TOTAL_TAX_RATE": tax_rate,
+        "EXRESPRDIV_COST_QUOTATION": 0.0,
+        "EXRESPRDIV_COST_SETTLEMENT": 0.0,
+        "RESTITUTION_RATE": 0.0,
+    })
+    custody = pd.DataFrame({
+        "COAC_EVENT_KEY": coac,
+        "ISIN": nbim["ISIN"].to_numpy(),
+        "EVENT_EX_DATE": nbim["EXDATE"].to_numpy(),
+        "EVENT_PAYMENT_DATE": nbim["PAYMENT_DATE"].to_numpy(),
+        "CUSTODY": bank,
+        "SEDOL": nbim["SEDOL"].to_numpy(),
+        "CUSTODIAN": m["custodian_cu"].to_numpy(),
+        "EVENT_TYPE": "DVCA",
+        "NOMINAL_BASIS": nominal,
+        "LOAN_QUANTITY": 0.0,
+        "HOLDING_QUANTITY": nominal,
+        "LENDING_PERCENTAGE": 0.0,
+        "BANK_ACCOUNTS": bank,
+        "EX_DATE": nbim["EXDATE"].to_numpy(),
+        "RECORD_DATE": _dates(ex + 1),
+        "PAY_DATE": nbim["PAYMENT_DATE"].to_numpy(),
+        "CURRENCIES": ccy_label,
+        "DIV_RATE": div_rate,
+        "TAX_RATE": tax_rate,
+        "GROSS_AMOUNT": np.round(gross, 2),
+        "NET_AMOUNT_QC": np.round(net_qc, 2),
+        "TAX": np.round(tax, 2),
+        "NET_AMOUNT_SC": net_sc,
+        "SETTLED_CURRENCY": m["sc"].to_numpy(),
+        "IS_CROSS_CURRENCY_REVERSAL": m["sc"].to_numpy() != qc,
+        "FX_RATE": m["qc_per_sc"].to_numpy(),
+        "POSSIBLE_RESTITUTION_PAYMENT": 0.0,
+        "POSSIBLE_RESTITUTION_AMOUNT": 0.0,
+        "ADR_FEE": 0.0,
+        "ADR_FEE_RATE": 0.0,
+    })
+    return nbim, custody, kinds, ex + 7
+
+
+def _recompute_custody(cu: pd.DataFrame, mask: np.ndarray, quantity=None):
+    """Re-derive the custody amounts of the masked rows from DIV_RATE, TAX_RATE and the paid quantity."""
+    qty = cu.loc[mask, "NOMINAL_BASIS"] if quantity is None else quantity
+    gross = qty * cu.loc[mask, "DIV_RATE"]
+    tax = gross * cu.loc[mask, "TAX_RATE"] / 100.0
+    cu.loc[mask, "GROSS_AMOUNT"] = np.round(gross, 2)
+    cu.loc[mask, "TAX"] = np.round(tax, 2)
+    cu.loc[mask, "NET_AMOUNT_QC"] = np.round(gross - tax, 2)
+    cu.loc[mask, "NET_AMOUNT_SC"] = np.round((gross - tax) / cu.loc[mask, "FX_RATE"], 2)
+
+
+def inject_breaks(nbim: pd.DataFrame, custody: pd.DataFrame, kinds: np.ndarray, pay_days: np.ndarray,
+                  rng: np.random.Generator):
+    """Apply the break of each event to the clean bookings. Returns (nbim, custody) to write."""
+    cu = custody.copy()
+
+    tax = kinds == "tax"
+    cu.loc[tax, "TAX_RATE"] = np.where(cu.loc[tax, "TAX_RATE"] >= 30, cu.loc[tax, "TAX_RATE"] - 5, cu.loc[tax, "TAX_RATE"] + 5)
+    _recompute_custody(cu, tax)
+
+    rate = kinds == "rate"
+    cu.loc[rate, "DIV_RATE"] = np.round(cu.loc[rate, "DIV_RATE"] * rng.choice([0.9, 0.95, 1.05, 1.1], size=int(rate.sum())), 6)
+    _recompute_custody(cu, rate)
+
+    # Quantity / lending: custody pays on the holding net of shares on loan
+    qty = kinds == "quantity"
+    loan = np.floor(cu.loc[qty, "NOMINAL_BASIS"] * rng.uniform(0.02, 0.2, size=int(qty.sum())))
+    cu.loc[qty, "LOAN_QUANTITY"] = loan
+    cu.loc[qty, "HOLDING_QUANTITY"] = cu.loc[qty, "NOMINAL_BASIS"] - loan
+    cu.loc[qty, "LENDING_PERCENTAGE"] = np.round(loan / cu.loc[qty, "NOMINAL_BASIS"] * 100, 2)
+    _recompute_custody(cu, qty, cu.loc[qty, "HOLDING_QUANTITY"])
+
+    date = kinds == "date"
+    cu.loc[date, "PAY_DATE"] = _dates(pay_days[date] + rng.integers(1, 10, size=int(date.sum())))
+    cu.loc[date, "EVENT_PAYMENT_DATE"] = cu.loc[date, "PAY_DATE"]
+
+    # Duplicate / partial: half the events are booked twice by custody; the other half are paid in two
+    # installments where the second one is short (half of the remaining amount is outstanding)
+    dup = kinds == "duplicate"
+    partial = dup & (rng.random(len(kinds)) < 0.5)
+    second = cu[dup].copy()
+    for col in ("GROSS_AMOUNT", "TAX", "NET_AMOUNT_QC", "NET_AMOUNT_SC"):
+        cu.loc[partial, col] = np.round(cu.loc[partial, col] / 2, 2)
+        second.loc[partial[dup], col] = np.round(second.loc[partial[dup], col] / 4, 2)
+    cu = pd.concat([cu, second]).sort_index(kind="stable")
+
+    # Missing: half the events lose the custody booking, the other half the NBIM booking
+    missing = kinds == "missing"
+    side = rng.random(len(kinds)) < 0.5
+    nb_keep = ~(missing & ~side)
+    cu_keep = np.repeat(~(missing & side), np.where(dup, 2, 1))
+    return nbim[nb_keep], cu[cu_keep]
+
+
+def generate(rows: int, out_dir: str, break_rate: float = 0.05, mix=None, seed: int = 0,
+             chunksize: int = 500_000):
+    """
+    Write NBIM and custody CSVs of about `rows` events each (semicolon separated, raw column names)
+    plus the injected break per event (synthetic_breaks.csv). Returns the three paths.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, name) for name in (NBIM_FILE, CUSTODY_FILE, TRUTH_FILE)]
+
+    for start in range(0, rows, chunksize):
+        nbim, custody, kinds, pay_days = _chunk(start, min(chunksize, rows - start), rng, break_rate, mix)
+        truth = nbim.loc[kinds != "", ["COAC_EVENT_KEY", "BANK_ACCOUNT"]].assign(BREAK_TYPE=kinds[kinds != ""])
+        nbim, custody = inject_breaks(nbim, custody, kinds, pay_days, rng)
+
+        first = start == 0
+        for df, path, columns in ((nbim, paths[0], list(NBIM_SCHEMA)), (custody, paths[1], list(CUSTODY_SCHEMA)), (truth, paths[2], None)):
+            df.to_csv(path, sep=";", index=False, mode="w" if first else "a", header=first, columns=columns)
+
+    return paths
+
+
+def parse_mix(text: str):
+    """'tax=0.5,missing=0.5' -> {"tax": 0.5, "missing": 0.5}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in BREAK_TYPES:
+            raise ValueError(f"Unknown break type {name!r}; expected one of {BREAK_TYPES}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic NBIM / custody dividend bookings")
+    parser.add_argument("--rows", type=int, default=10_000, help="events per file (1k to 10M)")
+    parser.add_argument("--out", default="data/synthetic", help="output directory")
+    parser.add_argument("--break-rate", type=float, default=0.05, help="share of events with an injected break")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="break type weights, e.g. tax=2,missing=1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in generate(args.rows, args.out, args.break_rate, args.mix, args.seed):
+        print(f"✅ Wrote {path}")
@@ -0,0 +1,210 @@
+import os
+import glob
+import asyncio
+from typing import Dict, Any, Optional, Tuple
+import pandas as pd
+from data_prcessing import (
+    KEY_COLS, NBIM_COLUMN_MAP, CUSTODY_COLUMN_MAP,
+    load_csv, join_events, event_labels, combine_fingerprints, _side_fingerprints,
+)
+from break_detector import DETECTOR_COLUMNS, detect_breaks_frame, to_break_events
+from candidate_index import attach_candidates
+from pre_classifier import pre_classify
+from break_prioritizer import rank_breaks
+from run_state import RunState, STATE_PATH
+from report_writers import report_formats, flatten_classified, CLASSIFIED_FIELDS
+from run_stages import (
+    STAGES, REPORTS_DIR, TICKETS_DIR, with_prerequisites, write_report, write_detected, prioritize_stage,
+    export_stage, record_run, write_metrics,
+)
+from metrics import Metrics, reset_metrics
+
+# --- Watch mode: a long-running reconciler for custodian drops ---
+# The drop folder is polled for the newest NBIM and custody booking files. The normalized frames, the
+# per-side event fingerprints and the open breaks with their classifications stay in memory (as do the
+# shared LLM clients), so when a file arrives only that side is reloaded and rehashed, and only the
+# event keys whose bookings changed are detected, classified and drafted again. The run state
+# (run_state.py) is updated after every cycle, so a later cold --incremental run continues from it.
+
+WATCH_INTERVAL = 2.0
+WATCH_GLOBS = {"nbim": "NBIM*.csv", "custody": "CUSTODY*.csv"}
+COLUMN_MAPS = {"nbim": NBIM_COLUMN_MAP, "custody": CUSTODY_COLUMN_MAP}
+
+
+def latest_inputs(directory: str, globs: Dict[str, str] = None) -> Dict[str, Tuple[str, int, int]]:
+    """side -> (path, size, mtime_ns) of the newest file matching that side's glob in directory."""
+    globs = globs or {
+        side: os.getenv(f"WATCH_{side.upper()}_GLOB") or pattern for side, pattern in WATCH_GLOBS.items()
+    }
+    found = {}
+    for side, pattern in globs.items():
+        stats = []
+        for path in glob.glob(os.path.join(directory, pattern)):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:  # removed between glob and stat
+                continue
+            stats.append((st.st_mtime_ns, path, st.st_size))
+        if stats:
+            mtime, path, size = max(stats)
+            found[side] = (path, size, mtime)
+    return found
+
+
+class WarmReconciler:
+    """
+    In-memory reconciliation state kept between drops: normalized frames and event fingerprints per
+    side, and the open (break, classification) pairs by event_key, seeded from the run state.
+    """
+
+    def __init__(self, stages=None, reports_dir: str = REPORTS_DIR, tickets_dir: str = TICKETS_DIR,
+                 excel_path: str = None, state_path: str = None, key_cols=KEY_COLS):
+        self.stages = with_prerequisites(stages or STAGES)
+        self.reports_dir = reports_dir
+        self.tickets_dir = tickets_dir
+        self.excel_path = excel_path or os.path.join(reports_dir, "reconciliation_breaks_combined.xlsx")
+        self.key_cols = key_cols
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.labels: Dict[str, pd.Series] = {}
+        self.side_fingerprints: Dict[str, pd.Series] = {}
+
+        self.state = RunState(state_path or os.getenv("RUN_STATE_PATH") or STATE_PATH)
+        self.fingerprints = pd.Series(self.state.fingerprints(), dtype=object)
+        self.open: Dict[str, Tuple[Dict[str, Any], Optional[Dict[str, Any]]]] = {
+            b["event_key"]: (b, r) for b, r in self.state.open_breaks(self.fingerprints.index)
+        }
+        os.makedirs(reports_dir, exist_ok=True)
+
+    def load(self, side: str, path: str):
+        """Reload and rehash one side."""
+        df = load_csv(path).rename(columns=COLUMN_MAPS[side])
+        self.frames[side] = df
+        self.labels[side] = event_labels(df, self.key_cols)
+        self.side_fingerprints[side] = _side_fingerprints(df, self.key_cols)
+
+    def rows_of(self, side: str, event_keys) -> pd.DataFrame:
+        """Rows of one side for the given event keys (select_events on the cached labels)."""
+        return self.frames[side][self.labels[side].isin(event_keys).to_numpy()].reset_index(drop=True)
+
+    def changed_keys(self, fingerprints: pd.Series):
+        """(new or changed keys, including open ones whose classification failed; vanished keys)."""
+        previous = self.fingerprints.reindex(fingerprints.index)
+        changed = set(fingerprints.index[(previous != fingerprints).to_numpy()])
+        changed |= {k for k, (_, r) in self.open.items() if r is not None and r.get("error") is not None}
+        changed &= set(fingerprints.index)
+        vanished = set(self.fingerprints.index.difference(fingerprints.index))
+        return changed, vanished
+
+    async def reconcile(self, metrics: Metrics = None) -> int:
+        """
+        Re-detect and re-classify the changed keys, then rewrite the reports. Returns the number of changed keys.
+        Each cycle reports its own metrics: pass the cycle's fresh collector, or a new one is started here.
+        """
+        metrics = metrics or reset_metrics()
+        fingerprints = combine_fingerprints(self.side_fingerprints["nbim"], self.side_fingerprints["custody"])
+        changed, vanished = self.changed_keys(fingerprints)
+        if not changed and not vanished:
+            print("No booking changes.")
+            return 0
+        print(f"{len(changed)} new or changed events, {len(vanished)} gone.")
+
+        with metrics.stage("join") as stage:
+            nbim, custody = self.rows_of("nbim", changed), self.rows_of("custody", changed)
+            joined = join_events(nbim, custody, columns=DETECTOR_COLUMNS, key_cols=self.key_cols)
+            stage["items"] = len(joined)
+        with metrics.stage("detect") as stage:
+            breaks = to_break_events(detect_breaks_frame(joined), nbim, custody)
+            stage["items"] = len(breaks)
+
+        for key in changed | vanished:
+            self.open.pop(key, None)
+        # Orphan counterparts may sit among the breaks carried over from earlier drops
+        with metrics.stage("candidates") as stage:
+            stage["items"] = attach_candidates(breaks + [b for b, _ in self.open.values()])
+        with metrics.stage("pre_classify") as stage:
+            resolved, _ = pre_classify(breaks)
+            stage["items"] = len(resolved)
+        print(f"Detected {len(breaks)} breaks among them, {len(resolved)} classified by rules.")
+
+        formats = report_formats()
+        if "classify" not in self.stages:
+            self.open.update({b["event_key"]: (b, None) for b in breaks})
+            self.fingerprints = fingerprints
+            pairs = sorted(self.open.values(), key=lambda pair: tuple(pair[0]["key_tuple"]))
+            write_detected([b for b, _ in pairs], formats, self.reports_dir)
+            write_metrics(metrics, self.reports_dir)
+            return len(changed)
+
+        from pipeline import run_pipeline
+
+        draft = "draft" in self.stages
+        if draft:
+            os.makedirs(self.tickets_dir, exist_ok=True)
+        with metrics.stage("pipeline") as stage:
+            classified, _, written = await run_pipeline(
+                breaks, resolved, out_dir=self.tickets_dir, draft=draft,
+                carried=[r for _, r in self.open.values()],
+            )
+            stage["items"] = len(classified)
+        self.open.update({b["event_key"]: (b, r) for b, r in zip(breaks, classified)})
+        self.fingerprints = fingerprints
+
+        # --- Rank everything that is open and rewrite the reports ---
+        pairs = sorted(self.open.values(), key=lambda pair: tuple(pair[0]["key_tuple"]))
+        all_breaks = [b for b, _ in pairs]
+        all_classified = [r for _, r in pairs]
+        prioritized = rank_breaks(all_classified, all_breaks)
+
+        stem = os.path.join(self.reports_dir, "classified_reconciliation_breaks")
+        write_report(stem, formats, CLASSIFIED_FIELDS, all_classified, transform=flatten_classified)
+        print(f"✅ Wrote {len(all_classified)} classified breaks to {stem}.* ({', '.join(sorted(formats))})")
+        if "prioritize" in self.stages:
+            prioritized = await prioritize_stage(metrics, all_classified, prioritized, formats, self.reports_dir)
+
+        record_run(
+            self.state, fingerprints[fingerprints.index.isin(changed)].to_dict(), breaks, classified, written,
+            vanished, prioritized if "prioritize" in self.stages else None, self.tickets_dir,
+        )
+        if "export" in self.stages:
+            export_stage(metrics, prioritized, all_classified, self.excel_path)
+
+        write_metrics(metrics, self.reports_dir)
+        return len(changed)
+
+    def close(self):
+        self.state.close()
+
+
+async def watch(directory: str, interval: float = None, stages=None, reports_dir: str = REPORTS_DIR,
+                tickets_dir: str = TICKETS_DIR, excel_path: str = None, max_cycles: int = None):
+    """
+    Poll `directory` every `interval` seconds (WATCH_INTERVAL, default 2) for the newest NBIM*.csv and
+    CUSTODY*.csv (WATCH_NBIM_GLOB / WATCH_CUSTODY_GLOB). A new or changed file is picked up once its
+    size and mtime are unchanged for one interval (no half-written drops) and only its side is
+    reloaded. Runs until interrupted, or for max_cycles reconciliations.
+    """
+    interval = interval or float(os.getenv("WATCH_INTERVAL") or WATCH_INTERVAL)
+    reconciler = WarmReconciler(stages, reports_dir, tickets_dir, excel_path)
+    loaded: Dict[str, Tuple[str, int, int]] = {}
+    seen: Dict[str, Tuple[str, int, int]] = {}
+    cycles = 0
+    print(f"Watching {directory} for booking files (every {interval:g}s, Ctrl+C to stop).")
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            current = latest_inputs(directory)
+            # Settled: same signature as on the previous poll, and not loaded yet
+            ready = [side for side, sig in current.items() if sig == seen.get(side) and sig != loaded.get(side)]
+            seen = current
+            if ready and all(side in reconciler.frames or side in ready for side in WATCH_GLOBS):
+                metrics = reset_metrics()  # per-cycle metrics, starting with the load
+                with metrics.stage("load") as stage:
+                    for side in ready:
+                        print(f"Loading {side} bookings from {current[side][0]}")
+                        reconciler.load(side, current[side][0])
+                        loaded[side] = current[side]
+                    stage["items"] = sum(len(reconciler.frames[side]) for side in ready)
+                await reconciler.reconcile(metrics)
+                cycles += 1
+            await asyncio.sleep(interval)
+    finally:
+        reconciler.close()
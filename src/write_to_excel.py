@@ -1,19 +1,36 @@
+import re
 import json
+import math
 from pathlib import Path
 import pandas as pd
+import xlsxwriter
+from report_writers import read_report
 
+# Excel limit per worksheet (header included); longer reports continue on Combined_2, Combined_3, ...
+EXCEL_MAX_ROWS = 1_048_576
 
-def load_data(breaks_path: Path, classes_path: Path):
-    with open(breaks_path, "r", encoding="utf-8") as f:
-        data_a = json.load(f)
-    with open(classes_path, "r", encoding="utf-8") as f:
-        data_b = json.load(f)
+COLUMN_ORDER = [
+    "priority","coac_event_key", "bank_account", "custodian", "organisation_name", "classification", "NET_AMOUNT_SC_DIFF", "SETTLEMENT_CURRENCY",
+    "recommended_action","description", "confidence",
+     "notes",
+]
+
+WIDTH_MAP = {
+    "priority": 10, "priority_label": 14, "reason": 60,
+    "coac_event_key": 16, "bank_account": 16, "event_key": 22,
+    "classification": 24, "description": 80, "confidence": 12,
+    "recommended_action": 26, "evidence": 48, "notes": 48,
+    "NET_AMOUNT_SC_DIFF": 18, "SETTLEMENT_CURRENCY": 10,
+}
 
-    # A: {"reconciliation_breaks": [ {...}, ... ]}
-    df_a = pd.DataFrame(data_a["reconciliation_breaks"])
+
+def load_data(breaks_path: Path, classes_path: Path):
+    # .json, .jsonl or .parquet reports (see report_writers)
+    # A: {"reconciliation_breaks": [ {...}, ... ]} or one entry per line / row
+    df_a = pd.DataFrame(read_report(str(breaks_path)))
 
     # B: [ {...}, {...} ]
-    df_b = pd.DataFrame(data_b)
+    df_b = pd.DataFrame(read_report(str(classes_path)))
 
     # --- Ensure join keys exist on both sides with the SAME names & dtypes ---
     # Left side uses uppercase keys
@@ -73,12 +90,7 @@ def combine(df_a: pd.DataFrame, df_b: pd.DataFrame) -> pd.DataFrame:
     })
 
     # Reorder columns (include only those that exist)
-    col_order = [
-        "priority","coac_event_key", "bank_account", "custodian", "organisation_name", "classification", "NET_AMOUNT_SC_DIFF", "SETTLEMENT_CURRENCY",
-        "recommended_action","description", "confidence",
-         "notes",
-    ]
-    cols = [c for c in col_order if c in combined.columns]
+    cols = [c for c in COLUMN_ORDER if c in combined.columns]
     combined = combined[cols]
 
     # Sort: priority asc
@@ -90,31 +102,111 @@ def combine(df_a: pd.DataFrame, df_b: pd.DataFrame) -> pd.DataFrame:
     return combined
 
 
+def _cell(value):
+    """Excel-safe cell value: NaN -> blank, lists/dicts -> text."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def write_rows(columns, rows, out_path: Path, sheet_name: str = "Combined", max_rows: int = EXCEL_MAX_ROWS):
+    """
+    Stream rows (tuples in `columns` order) into an xlsx file in constant-memory mode: each row is
+    flushed to disk once the next one starts, so memory does not grow with the report.
+    A new sheet is started whenever one reaches max_rows (header included).
+    """
+    columns = list(columns)
+    wb = xlsxwriter.Workbook(str(out_path), {"constant_memory": True})
+    header_fmt = wb.add_format({"bold": True, "text_wrap": True})
+
+    def new_sheet(n: int):
+        ws = wb.add_worksheet(sheet_name if n == 1 else f"{sheet_name}_{n}")
+        for idx, col in enumerate(columns):
+            ws.set_column(idx, idx, WIDTH_MAP.get(col, 18))
+        ws.write_row(0, 0, columns, header_fmt)
+        return ws
+
+    sheets = 1
+    ws, r = new_sheet(sheets), 1
+    for row in rows:
+        if r >= max_rows:
+            sheets += 1
+            ws, r = new_sheet(sheets), 1
+        ws.write_row(r, 0, [_cell(v) for v in row])
+        r += 1
+
+    wb.close()
+    return sheets
+
+
 def write_excel(df: pd.DataFrame, out_path: Path):
-    with pd.ExcelWriter(out_path, engine="xlsxwriter") as writer:
-        # Main sheet
-        sheet_name = "Combined"
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
-        wb = writer.book
-        ws = writer.sheets[sheet_name]
-
-        # Column widths
-        width_map = {
-            "priority": 10, "priority_label": 14, "reason": 60,
-            "coac_event_key": 16, "bank_account": 16, "event_key": 22,
-            "classification": 24, "description": 80, "confidence": 12,
-            "recommended_action": 26, "evidence": 48, "notes": 48,
-            "NET_AMOUNT_SC_DIFF": 18, "SETTLEMENT_CURRENCY": 10,
-        }
-        for idx, col in enumerate(df.columns):
-            ws.set_column(idx, idx, width_map.get(col, 18))
+    write_rows(df.columns, df.itertuples(index=False, name=None), out_path)
+
 
-        # Header format
-        header_fmt = wb.add_format({"bold": True, "text_wrap": True})
-        for col_idx, col_name in enumerate(df.columns):
-            ws.write(0, col_idx, col_name, header_fmt)
+def _norm_key(value) -> str:
+    return re.sub(r"\.0$", "", str(value).strip())
 
 
+def _number(value, default: float) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if math.isnan(value) else value
+
+
+def _record_key(record) -> tuple:
+    if record.get("COAC_EVENT_KEY") is None and record.get("event_key"):
+        coac, _, bank = str(record["event_key"]).partition("|")
+        return _norm_key(coac), _norm_key(bank)
+    return _norm_key(record.get("COAC_EVENT_KEY")), _norm_key(record.get("BANK_ACCOUNT"))
+
+
+def combined_rows(prioritized, classified, columns=COLUMN_ORDER):
+    """
+    Same rows as combine(load_data(...)) built from the in-memory results, yielded one at a time:
+    prioritized entries in rank order joined with their classification, then unranked classifications.
+    """
+    by_key = {_record_key(c): c for c in classified}
+    entries = prioritized.get("reconciliation_breaks", []) if isinstance(prioritized, dict) else prioritized
+
+    def row(p, c):
+        params = c.get("action_params") if isinstance(c.get("action_params"), dict) else {}
+        merged = {
+            **{k: v for k, v in c.items() if k != "action_params"},
+            "notes": params.get("notes"),
+            **p,
+        }
+        coac, bank = _record_key(p or c)
+        merged.update({
+            "coac_event_key": coac,
+            "bank_account": bank,
+            "custodian": merged.get("CUSTODIAN"),
+            "organisation_name": merged.get("ORGANISATION_NAME"),
+        })
+        return tuple(merged.get(col) for col in columns)
+
+    def order(p):
+        # Same order as combine(): priority ascending, larger cash difference first
+        diff = _number((by_key.get(_record_key(p)) or {}).get("NET_AMOUNT_SC_DIFF"), 0.0)
+        return (_number(p.get("priority"), math.inf), -diff)
+
+    for p in sorted(entries, key=order):
+        yield row(p, by_key.pop(_record_key(p), {}))
+    for c in by_key.values():
+        yield row({}, c)
+
+
+def export_combined(prioritized, classified, out_path: str = "reports/reconciliation_breaks_combined.xlsx"):
+    """Write the combined Excel report straight from the in-memory pipeline results."""
+    write_rows(COLUMN_ORDER, combined_rows(prioritized, classified), Path(out_path))
+    print(f"✅ Wrote Excel report to {out_path}")
+    return out_path
+
 
 def combine_and_export(breaks_path: str = "reports/prioritized_breaks.json", classes_path: str = "reports/classified_reconciliation_breaks.json", out_path: str = "reports/reconciliation_breaks_combined.xlsx"):
     df_a, df_b = load_data(Path(breaks_path), Path(classes_path))
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in src/ (run as `python src/main.py`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from synthetic_data import generate  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic(tmp_path_factory):
+    """(nbim_path, custody_path, truth_path) of a small synthetic booking set with a high break rate."""
+    return generate(2000, str(tmp_path_factory.mktemp("synthetic")), break_rate=0.2, seed=7)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from break_detector import detect_breaks_frame
+
+
+def joined(**columns):
+    """A join_events()-shaped frame of matched events; scalars apply to every row."""
+    n = max(len(v) for v in columns.values() if isinstance(v, list))
+    frame = pd.DataFrame({k: v if isinstance(v, list) else [v] * n for k, v in columns.items()})
+    frame.insert(0, "match_status", "matched")
+    return frame
+
+
+def test_net_amount_within_default_tolerance_is_not_a_break():
+    flagged = detect_breaks_frame(joined(
+        CURRENCY_SC_nbim="USD", CURRENCY_SC_custody="USD",
+        NET_AMOUNT_SC_nbim=[100.0, 100.0], NET_AMOUNT_SC_custody=[100.005, 100.02],
+    ))
+    assert flagged["IS_BREAK"].tolist() == [False, True]
+    assert flagged.loc[1, "BREAK_REASONS"] == ["NET_AMOUNT_SC_MISMATCH"]
+    assert flagged.loc[1, "NET_AMOUNT_SC_DIFF"] == pytest.approx(0.02)
+
+
+def test_currency_override_for_settlement_amounts():
+    flagged = detect_breaks_frame(joined(
+        CURRENCY_SC_nbim=["JPY", "USD"], CURRENCY_SC_custody=["JPY", "USD"],
+        NET_AMOUNT_SC_nbim=100.0, NET_AMOUNT_SC_custody=100.5,
+    ))
+    assert flagged["IS_BREAK"].tolist() == [False, True]
+
+
+def test_quotation_amounts_use_the_quotation_currency_tolerance():
+    # JPY quoted, USD settled: a half-yen gross difference is noise; USD quoted, JPY settled: it is not
+    flagged = detect_breaks_frame(joined(
+        CURRENCY_SC_nbim=["USD", "JPY"], CURRENCY_SC_custody=["USD", "JPY"],
+        CURRENCY_QC_nbim=["JPY", "USD"], CURRENCY_QC_custody=["JPY", "USD"],
+        NET_AMOUNT_SC_nbim=100.0, NET_AMOUNT_SC_custody=100.0,
+        GROSS_AMOUNT_QC_nbim=[1000.0, 10.0], GROSS_AMOUNT_QC_custody=[1000.5, 10.5],
+    ))
+    assert flagged["GROSS_AMOUNT_QC_MISMATCH"].tolist() == [False, True]
+
+
+def test_caller_tolerances_override_defaults():
+    frame = joined(
+        CURRENCY_SC_nbim="USD", CURRENCY_SC_custody="USD",
+        NET_AMOUNT_SC_nbim=[1000.0, 1000.0], NET_AMOUNT_SC_custody=[1004.0, 1020.0],
+    )
+    flagged = detect_breaks_frame(frame, tolerances={"NET_AMOUNT_SC": {"rel": 0.01}})
+    assert flagged["IS_BREAK"].tolist() == [False, True]
+    flagged = detect_breaks_frame(frame, currency_tolerances={"USD": {"NET_AMOUNT_SC": {"abs": 50.0}}})
+    assert flagged["IS_BREAK"].tolist() == [False, False]
+
+
+def test_missing_side_is_a_break_with_the_full_amount():
+    frame = joined(CURRENCY_SC_nbim="USD", CURRENCY_SC_custody="USD",
+                   NET_AMOUNT_SC_nbim=[250.0, np.nan], NET_AMOUNT_SC_custody=[np.nan, 75.0])
+    frame["match_status"] = ["nbim_only", "custody_only"]
+    flagged = detect_breaks_frame(frame)
+    assert flagged["IS_BREAK"].tolist() == [True, True]
+    assert flagged["NET_AMOUNT_SC_DIFF"].tolist() == [250.0, 75.0]
+    assert flagged.loc[0, "BREAK_REASONS"][0] == "MISSING_CUSTODY"
+    assert flagged.loc[1, "BREAK_REASONS"][0] == "MISSING_NBIM"
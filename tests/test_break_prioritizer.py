@@ -0,0 +1,84 @@
+import random
+
+from break_prioritizer import rank_breaks, BreakRanker, score_arrays, score_one, _today
+
+TODAY = "2025-06-30"
+
+
+def records():
+    # Pairs of identical breaks (equal scores) under different keys, plus odd confidences
+    out = []
+    for i in range(12):
+        out.append({
+            "event_key": f"{900 + i % 6}|{i}",
+            "COAC_EVENT_KEY": 900 + i % 6,
+            "BANK_ACCOUNT": i,
+            "classification": ["OTHER", "AMOUNT_MISMATCH_TAX", "MISSING_RECORD"][i % 3],
+            "confidence": [0.8, "high", None, float("nan")][i % 4],
+            "NET_AMOUNT_SC_DIFF": [100.0, 2500.0][i % 2],
+            "SETTLEMENT_CURRENCY": "USD",
+        })
+    return out
+
+
+def ranked_keys(result):
+    return [(e["COAC_EVENT_KEY"], e["BANK_ACCOUNT"]) for e in result["reconciliation_breaks"]]
+
+
+def test_rank_breaks_does_not_depend_on_input_order():
+    expected = rank_breaks(records(), today=TODAY)
+    for seed in range(5):
+        shuffled = records()
+        random.Random(seed).shuffle(shuffled)
+        assert rank_breaks(shuffled, today=TODAY) == expected
+
+
+def test_top_k_is_a_prefix_of_the_full_ranking():
+    full = rank_breaks(records(), today=TODAY)["reconciliation_breaks"]
+    top = rank_breaks(records(), top_k=5, today=TODAY)["reconciliation_breaks"]
+    assert top == full[:5]
+
+
+def test_incremental_ranker_matches_rank_breaks_for_any_arrival_order():
+    expected = rank_breaks(records(), today=TODAY)
+    shuffled = records()
+    random.Random(3).shuffle(shuffled)
+    ranker = BreakRanker(today=TODAY)
+    for r in shuffled:
+        ranker.add(r)
+    assert ranker.ranked() == expected
+    assert ranker.ranked(top_k=4)["reconciliation_breaks"] == expected["reconciliation_breaks"][:4]
+
+
+def test_scalar_scores_match_the_vectorized_ones():
+    cases = [
+        (100.0, "USD", "OTHER", 0.8, "15.06.2025"),
+        (-2500, "NOK", "MISSING_RECORD", "0.4", "31.12.2024"),
+        ("12.5", None, None, "high", "01.07.2025"),
+        (None, "JPY", "UNKNOWN", float("nan"), None),
+        (float("nan"), "USD", "AMOUNT_MISMATCH_TAX", 1.7, "2025-06-01"),
+        (5e7, "USD", "DATE_MISMATCH", -0.2, "29.06.2025"),
+    ]
+    weights, fx = {"overdue": 0.3}, {"NOK": 0.1, "JPY": 0.01}
+    scores, days = score_arrays(*map(list, zip(*cases)), today=TODAY, weights=weights, fx_to_base=fx)
+    for i, case in enumerate(cases):
+        score, day = score_one(*case, _today(TODAY), weights, fx)
+        assert abs(score - scores[i]) < 1e-12 and day == days[i]
+
+
+def test_rescored_and_removed_breaks():
+    ranker = BreakRanker(today=TODAY)
+    for r in records():
+        ranker.add(r)
+    first = records()[0]
+    ranker.add({**first, "NET_AMOUNT_SC_DIFF": 1e9})
+    assert ranked_keys(ranker.ranked(top_k=1)) == [(first["COAC_EVENT_KEY"], first["BANK_ACCOUNT"])]
+    ranker.remove(first["event_key"])
+    assert len(ranker) == 11
+    assert (first["COAC_EVENT_KEY"], first["BANK_ACCOUNT"]) not in ranked_keys(ranker.ranked())
+
+
+def test_non_numeric_confidence_is_left_out_of_the_reason():
+    reasons = [e["reason"] for e in rank_breaks(records(), today=TODAY)["reconciliation_breaks"]]
+    assert any("(confidence 0.80)" in r for r in reasons)
+    assert not any("confidence nan" in r or "high" in r for r in reasons)
@@ -0,0 +1,46 @@
+from candidate_index import CandidateIndex, attach_candidates
+
+
+def custody_row(coac, net, pay_date="15.05.2025", isin="US0000000001"):
+    return {"COAC_EVENT_KEY": coac, "BANK_ACCOUNT": 1, "ISIN": isin, "CURRENCY_SC": "USD",
+            "PAY_DATE": pay_date, "NET_AMOUNT_SC": net}
+
+
+def index(rows):
+    return CandidateIndex([{"event_key": f"{r['COAC_EVENT_KEY']}|1", "row": r} for r in rows], "custody")
+
+
+def nbim_row(net, pay_date="15.05.2025"):
+    return {"COAC_EVENT_KEY": 1, "BANK_ACCOUNT": 2, "ISIN": "US0000000001", "CURRENCY_SC": "USD",
+            "PAYMENT_DATE": pay_date, "NET_AMOUNT_SC": net}
+
+
+def keys(found):
+    return [c["COAC_EVENT_KEY"] for c in found]
+
+
+def test_candidates_rank_by_pay_date_and_amount_within_tolerance():
+    idx = index([custody_row(10, 1000.0, "17.05.2025"), custody_row(11, 1000.0), custody_row(12, 1500.0),
+                 custody_row(13, 1000.0, "25.05.2025"), custody_row(14, 1000.0, isin="US0000000002")])
+    assert keys(idx.candidates(nbim_row(1000.0), "PAYMENT_DATE")) == [11, 10]
+
+
+def test_candidates_without_an_amount_rank_after_amount_checked_ones():
+    # The unchecked ones pay on the same day, the checked ones days apart: the checked ones still come first
+    idx = index([custody_row(10, None), custody_row(11, 1100.0, "19.05.2025"), custody_row(12, 1000.0, "20.05.2025")])
+    assert keys(idx.candidates(nbim_row(1000.0), "PAYMENT_DATE")) == [11, 12, 10]
+    assert keys(idx.candidates(nbim_row(None), "PAYMENT_DATE")) == [10, 11, 12]
+
+
+def test_a_missing_amount_is_not_matched_as_zero():
+    # A zero net amount used to match a counterpart whose amount is missing with no gap at all
+    idx = index([custody_row(10, None), custody_row(11, 0.0, "16.05.2025")])
+    assert keys(idx.candidates(nbim_row(0.0), "PAYMENT_DATE")) == [11, 10]
+
+
+def test_attach_candidates_links_orphans_both_ways():
+    nbim = {"event_key": "1|2", "nbim_rows": nbim_row(1000.0), "custody_rows": None}
+    custody = {"event_key": "11|1", "nbim_rows": None, "custody_rows": custody_row(11, 1000.0)}
+    assert attach_candidates([nbim, custody]) == 2
+    assert keys(nbim["candidate_matches"]) == [11]
+    assert keys(custody["candidate_matches"]) == [1]
@@ -0,0 +1,38 @@
+from checkpoint import Checkpoint, break_digest
+
+
+def test_resume_skips_a_torn_last_line(tmp_path):
+    checkpoint = Checkpoint("classify", directory=str(tmp_path))
+    checkpoint.put("a", {"classification": "OTHER"}, "d1")
+    checkpoint.put("b", {"classification": "AMOUNT_MISMATCH_TAX"}, "d2")
+    checkpoint.close()
+    # A crash while writing the third record leaves half a line
+    with open(checkpoint.path, "a", encoding="utf-8") as f:
+        f.write('{"event_key": "c", "digest": "d3", "resu')
+
+    resumed = Checkpoint("classify", resume=True, directory=str(tmp_path))
+    assert set(resumed.done) == {"a", "b"}
+    assert resumed.get("b", "d2") == {"classification": "AMOUNT_MISMATCH_TAX"}
+    # Records written after the recovery are not glued to the torn line
+    resumed.put("c", {"classification": "OTHER"}, "d3")
+    resumed.close()
+    assert set(Checkpoint("classify", resume=True, directory=str(tmp_path)).done) == {"a", "b", "c"}
+
+
+def test_changed_break_is_not_reused(tmp_path):
+    b = {"event_key": "1|2", "NET_AMOUNT_SC_DIFF": 10.0}
+    checkpoint = Checkpoint("classify", directory=str(tmp_path))
+    checkpoint.put(b["event_key"], {"classification": "OTHER"}, break_digest(b))
+    checkpoint.close()
+
+    resumed = Checkpoint("classify", resume=True, directory=str(tmp_path))
+    assert resumed.get(b["event_key"], break_digest(b)) == {"classification": "OTHER"}
+    assert resumed.get(b["event_key"], break_digest({**b, "NET_AMOUNT_SC_DIFF": 11.0})) is None
+
+
+def test_without_resume_the_previous_run_is_discarded(tmp_path):
+    checkpoint = Checkpoint("draft", directory=str(tmp_path))
+    checkpoint.put("a", "tickets/a.md")
+    checkpoint.close()
+    assert Checkpoint("draft", directory=str(tmp_path)).done == {}
+    assert Checkpoint("draft", resume=True, directory=str(tmp_path)).done == {}
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import pytest
+
+from agents import classifier_agent
+
+BREAK = {"event_key": "1|1", "nbim_rows": {"COAC_EVENT_KEY": 1, "BANK_ACCOUNT": 1, "CURRENCY_SC": "USD"},
+         "NET_AMOUNT_SC_DIFF": 5.0}
+GOOD = {"event_key": "1|1", "classification": "OTHER", "confidence": 0.7, "recommended_action": "ESCALATE"}
+
+
+@pytest.mark.parametrize("content", ['["a", "list"]', '"text"', "42", "null", "{}",
+                                     '{"classification": "NOPE", "recommended_action": "ESCALATE"}', "not json"])
+def test_malformed_reply_becomes_failed_result(monkeypatch, content):
+    async def reply(*args, **kwargs):
+        return content
+    monkeypatch.setattr(classifier_agent, "acomplete", reply)
+    r = asyncio.run(classifier_agent.classify_break_async(None, "m", BREAK))
+    assert r["error"] and r["recommended_action"] == "ESCALATE" and r["event_key"] == "1|1"
+
+
+def test_valid_reply_is_returned(monkeypatch):
+    async def reply(*args, **kwargs):
+        return json.dumps(GOOD)
+    monkeypatch.setattr(classifier_agent, "acomplete", reply)
+    assert asyncio.run(classifier_agent.classify_break_async(None, "m", BREAK)) == GOOD
+
+
+def test_sync_path_checks_replies(monkeypatch):
+    replies = iter(['["a"]', json.dumps(GOOD)])
+    monkeypatch.setattr(classifier_agent, "get_client", lambda: None)
+    monkeypatch.setattr(classifier_agent, "complete", lambda *args, **kwargs: next(replies))
+    bad, good = classifier_agent.classify_reconciliation_breaks([BREAK, BREAK], model="m")
+    assert bad["error"] and good == GOOD
+
+
+def test_only_classifications_are_cached():
+    assert not classifier_agent._is_result('["a"]')
+    assert not classifier_agent._is_result("{}")
+    assert classifier_agent._is_result(json.dumps(GOOD))
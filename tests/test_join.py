@@ -0,0 +1,68 @@
+import math
+
+import pandas as pd
+import pytest
+
+from data_prcessing import KEY_COLS, load_csv, normalize_columns, get_events, join_events
+
+
+@pytest.fixture(scope="module")
+def frames(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    return normalize_columns(load_csv(nbim_path), load_csv(custody_path))
+
+
+def key_labels(df):
+    return df[KEY_COLS].astype(str).agg("|".join, axis=1)
+
+
+def rows_of(df, labels, label):
+    """Reference per-key scan: the rows of one side booked under an event key, NaN as None."""
+    rows = df[(labels == label).to_numpy()]
+    return [{c: (None if isinstance(v, float) and math.isnan(v) else v) for c, v in row.items()}
+            for row in rows.to_dict("records")]
+
+
+def test_events_cover_every_key_once_in_key_order(frames):
+    nbim, custody = frames
+    events = get_events(nbim, custody)
+    nb_keys, cu_keys = set(key_labels(nbim)), set(key_labels(custody))
+
+    labels = [e["event_key"] for e in events]
+    assert len(labels) == len(set(labels))
+    assert set(labels) == nb_keys | cu_keys
+    assert [e["key_tuple"] for e in events] == sorted(e["key_tuple"] for e in events)
+    for e in events:
+        expected = ("matched" if e["event_key"] in nb_keys & cu_keys
+                    else "nbim_only" if e["event_key"] in nb_keys else "custody_only")
+        assert e["match_status"] == expected
+
+
+def test_event_rows_match_a_per_key_scan(frames):
+    nbim, custody = frames
+    events = get_events(nbim, custody)
+    labels = {"nbim": key_labels(nbim), "custody": key_labels(custody)}
+    for e in events[::20]:
+        for side, df in (("nbim", nbim), ("custody", custody)):
+            rows = rows_of(df, labels[side], e["event_key"])
+            if not rows:
+                assert e[f"{side}_rows"] is None
+            elif len(rows) == 1:
+                assert e[f"{side}_rows"] == rows[0]
+                assert f"{side}_detail" not in e
+            else:
+                assert e[f"{side}_detail"] == rows
+                assert e[f"{side}_rows"]["ROW_COUNT"] == len(rows)
+                assert e[f"{side}_rows"]["NET_AMOUNT_SC"] == pytest.approx(sum(r["NET_AMOUNT_SC"] for r in rows))
+
+
+def test_join_events_frame_matches_the_event_dicts(frames):
+    nbim, custody = frames
+    events = get_events(nbim, custody)
+    joined = join_events(nbim, custody, columns=["NET_AMOUNT_SC"])
+
+    assert joined["match_status"].tolist() == [e["match_status"] for e in events]
+    for side in ("nbim", "custody"):
+        expected = [(e[f"{side}_rows"] or {}).get("NET_AMOUNT_SC") for e in events]
+        got = [None if pd.isna(v) else v for v in joined[f"NET_AMOUNT_SC_{side}"]]
+        assert got == pytest.approx(expected)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import pipeline
+
+
+def brk(i):
+    return {"event_key": f"{i}|1", "key_tuple": (i, 1), "match_status": "matched",
+            "nbim_rows": {"COAC_EVENT_KEY": i, "BANK_ACCOUNT": 1, "CUSTODIAN": "CUST"},
+            "custody_rows": {"COAC_EVENT_KEY": i, "BANK_ACCOUNT": 1, "CUSTODIAN": "CUST"},
+            "NET_AMOUNT_SC_DIFF": float(i)}
+
+
+def result(b, action="ESCALATE"):
+    return {"event_key": b["event_key"], "COAC_EVENT_KEY": b["key_tuple"][0], "BANK_ACCOUNT": 1, "CUSTODIAN": "CUST",
+            "classification": "OTHER", "confidence": 0.5, "recommended_action": action,
+            "NET_AMOUNT_SC_DIFF": b["NET_AMOUNT_SC_DIFF"]}
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("CLASSIFIER_BATCH_TOKENS", raising=False)
+
+
+def run(breaks, timeout=10, **kwargs):
+    return asyncio.run(asyncio.wait_for(
+        pipeline.run_pipeline(breaks, classify_workers=2, ticket_workers=2, consolidate=False, **kwargs), timeout
+    ))
+
+
+def test_bad_classifications_become_failed_results(monkeypatch, tmp_path):
+    async def classify(client, model, b, limiter=None):
+        i = b["key_tuple"][0]
+        if i % 3 == 0:
+            return ["not", "an", "object"]
+        if i % 3 == 1:
+            raise RuntimeError("boom")
+        return result(b)
+
+    monkeypatch.setattr(pipeline, "classify_break_async", classify)
+    breaks = [brk(i) for i in range(30)]
+    classified, prioritized, _ = run(breaks, out_dir=str(tmp_path))
+
+    assert [r["event_key"] for r in classified] == [b["event_key"] for b in breaks]
+    assert sum(r.get("error") is not None for r in classified) == 20
+    assert len(prioritized["reconciliation_breaks"]) == 30
+
+
+def test_ticket_failures_are_skipped(monkeypatch, tmp_path):
+    async def classify(client, model, b, limiter=None):
+        return result(b, "DRAFT_CUSTODIAN_TICKET")
+
+    def write_ticket(filename, ticket):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pipeline, "classify_break_async", classify)
+    monkeypatch.setattr(pipeline, "draft_custodian_ticket", lambda r, *args: "ticket")
+    monkeypatch.setattr(pipeline, "write_ticket", write_ticket)
+    classified, _, written = run([brk(i) for i in range(20)], out_dir=str(tmp_path))
+    assert len(classified) == 20 and written == []
+
+
+def test_a_failing_stage_fails_the_run_instead_of_hanging(monkeypatch, tmp_path):
+    async def classify(client, model, b, limiter=None):
+        return result(b)
+
+    def on_classified(r):
+        raise OSError("report disk full")
+
+    monkeypatch.setattr(pipeline, "classify_break_async", classify)
+    with pytest.raises(OSError, match="report disk full"):
+        run([brk(i) for i in range(200)], out_dir=str(tmp_path), on_classified=on_classified)
@@ -0,0 +1,35 @@
+from data_prcessing import load_csv, normalize_columns, join_events
+from break_detector import DETECTOR_COLUMNS, detect_breaks_frame, to_break_events
+from candidate_index import attach_candidates
+from pre_classifier import pre_classify
+from checkpoint import break_digest
+from sharding import reconcile_sharded
+
+
+def in_memory(nbim_path, custody_path):
+    nbim, custody = normalize_columns(load_csv(nbim_path), load_csv(custody_path))
+    breaks = to_break_events(detect_breaks_frame(join_events(nbim, custody, columns=DETECTOR_COLUMNS)), nbim, custody)
+    attach_candidates(breaks)
+    return breaks
+
+
+def digests(breaks):
+    return {b["event_key"]: break_digest(b) for b in breaks}
+
+
+def test_sharded_matches_in_memory(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    expected = in_memory(nbim_path, custody_path)
+    breaks, resolved = reconcile_sharded(nbim_path, custody_path, shards=3, workers=2)
+
+    assert expected
+    assert [b["event_key"] for b in breaks] == [b["event_key"] for b in expected]
+    assert digests(breaks) == digests(expected)
+    assert resolved == pre_classify(expected)[0]
+
+
+def test_shard_count_does_not_change_the_result(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    one, _ = reconcile_sharded(nbim_path, custody_path, shards=1, workers=1)
+    many, _ = reconcile_sharded(nbim_path, custody_path, shards=5, workers=2)
+    assert digests(one) == digests(many)
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from data_prcessing import (
+    NBIM_SCHEMA, CUSTODY_SCHEMA, NBIM_COLUMN_MAP, CUSTODY_COLUMN_MAP,
+    load_csv, normalize_columns, join_events, event_fingerprints, iter_csv_chunks, iter_partitions,
+)
+from break_detector import DETECTOR_COLUMNS, detect_breaks_frame, to_break_events, detect_breaks_streaming
+from checkpoint import break_digest
+
+
+def in_memory(nbim_path, custody_path):
+    nbim, custody = normalize_columns(load_csv(nbim_path), load_csv(custody_path))
+    return to_break_events(detect_breaks_frame(join_events(nbim, custody, columns=DETECTOR_COLUMNS)), nbim, custody)
+
+
+def digests(breaks):
+    return {b["event_key"]: break_digest(b) for b in breaks}
+
+
+def test_partitions_hold_every_key_on_both_sides_once(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    nbim, custody = normalize_columns(load_csv(nbim_path), load_csv(custody_path))
+    seen = {"nbim": [], "custody": []}
+    for nbim_part, custody_part in iter_partitions(nbim_path, custody_path, chunksize=500, partitions=4):
+        for side, part in (("nbim", nbim_part), ("custody", custody_part)):
+            seen[side].append(set(part["COAC_EVENT_KEY"].astype(str) + "|" + part["BANK_ACCOUNT"].astype(str)))
+    for side, df in (("nbim", nbim), ("custody", custody)):
+        assert sum(len(keys) for keys in seen[side]) == len(set.union(*seen[side]))
+        assert set.union(*seen[side]) == set(df["COAC_EVENT_KEY"].astype(str) + "|" + df["BANK_ACCOUNT"].astype(str))
+
+
+def test_streaming_matches_in_memory(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    expected = in_memory(nbim_path, custody_path)
+    breaks = detect_breaks_streaming(nbim_path, custody_path, chunksize=500, partitions=4)
+    assert expected
+    assert [b["event_key"] for b in breaks] == [b["event_key"] for b in expected]
+    assert digests(breaks) == digests(expected)
+
+
+def test_fingerprints_match_between_whole_file_and_chunked_reads(synthetic):
+    nbim_path, custody_path, _ = synthetic
+    whole = normalize_columns(load_csv(nbim_path), load_csv(custody_path))
+    chunked = [
+        pd.concat(iter_csv_chunks(path, schema, column_map, chunksize=300), ignore_index=True)
+        for path, schema, column_map in (
+            (nbim_path, NBIM_SCHEMA, NBIM_COLUMN_MAP), (custody_path, CUSTODY_SCHEMA, CUSTODY_COLUMN_MAP),
+        )
+    ]
+    assert event_fingerprints(*chunked).equals(event_fingerprints(*whole))